@@ -0,0 +1,284 @@
+"""Generate a synthetic V-pipe result tree for benchmarking.
+
+Fabricates, at a configurable scale, the inputs the coverage analyses and
+the amplicon coverage script read:
+
+    out_dir/
+        results/<sample>/<batch>/alignments/basecnt.tsv.gz
+        results/<sample>/<batch>/alignments/coverage.tsv.gz
+        timeline.tsv
+        samples.tsv                 (sample, batch, read length, protocol)
+        mutations_of_interest.csv
+        primers.bed                 (ARTIC-like tiling of the genome)
+
+Depths follow a tiled amplicon scheme with per-sample amplicon efficiency and
+dropouts, mutations of interest rise in frequency over the sampling dates.
+
+Usage:
+    python benchmarks/generate_tree.py out_dir --samples 1000 --mutations 100
+"""
+
+import gzip
+import io
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+
+NUCLEOTIDES = np.array(list("ACGT-"))
+REFERENCE_NAME = "NC_045512.2"
+LOCATIONS = ["Zürich (ZH)", "Genève (GE)", "Basel (BS)", "Lugano (TI)"]
+
+AMPLICON_LENGTH = 400
+AMPLICON_OVERLAP = 100
+PRIMER_LENGTH = 24
+
+
+def reference_sequence(genome_length: int, seed: int) -> np.ndarray:
+    """Random reference sequence as indices into A, C, G, T."""
+    return np.random.default_rng(seed).integers(0, 4, size=genome_length)
+
+
+def amplicon_tiling(genome_length: int) -> np.ndarray:
+    """Start and end of the amplicons tiling the genome, shape (amplicons, 2)."""
+    step = AMPLICON_LENGTH - AMPLICON_OVERLAP
+    starts = np.arange(30, genome_length - AMPLICON_LENGTH, step)
+    return np.column_stack([starts, starts + AMPLICON_LENGTH])
+
+
+def primer_bed(genome_length: int) -> pd.DataFrame:
+    """Primer bed file of the amplicon tiling, in the ARTIC layout."""
+    rows = []
+    for i, (start, end) in enumerate(amplicon_tiling(genome_length), start=1):
+        pool = f"nCoV-2019_{2 - i % 2}"
+        rows.append(
+            (
+                REFERENCE_NAME,
+                start,
+                start + PRIMER_LENGTH,
+                f"nCoV-2019_{i}_LEFT",
+                pool,
+                "+",
+            )
+        )
+        rows.append(
+            (
+                REFERENCE_NAME,
+                end - PRIMER_LENGTH,
+                end,
+                f"nCoV-2019_{i}_RIGHT",
+                pool,
+                "-",
+            )
+        )
+    return pd.DataFrame(rows)
+
+
+def sample_counts(
+    reference: np.ndarray,
+    mutation_positions: np.ndarray,
+    mutation_nt: np.ndarray,
+    progress: float,
+    seed: int,
+) -> np.ndarray:
+    """
+    Per-base counts (A, C, G, T, -) of one synthetic sample.
+
+    Args:
+        reference: Reference sequence, see reference_sequence.
+        mutation_positions: 0-based positions of the mutations of interest.
+        mutation_nt: Index of the mutated nucleotide of each mutation.
+        progress: Position of the sample in the sampling period, in [0, 1].
+        seed: Seed of the sample.
+
+    Returns:
+        np.ndarray: uint32 counts of shape (genome length, 5).
+    """
+    rng = np.random.default_rng(seed)
+    genome_length = reference.size
+
+    # amplicon depths, some amplicons drop out entirely
+    tiling = amplicon_tiling(genome_length)
+    amplicon_depth = rng.lognormal(np.log(rng.uniform(200, 3000)), 0.8, len(tiling))
+    amplicon_depth[rng.random(len(tiling)) < 0.05] = 0
+    steps = np.zeros(genome_length + 1)
+    np.add.at(steps, tiling[:, 0], amplicon_depth)
+    np.add.at(steps, tiling[:, 1], -amplicon_depth)
+    depth = rng.poisson(np.clip(np.cumsum(steps[:-1]), 0, None)).astype(np.int64)
+
+    # sequencing errors spread over the other channels
+    counts = np.zeros((genome_length, 5), dtype=np.int64)
+    errors = rng.binomial(depth, 0.005)
+    error_channel = (reference + rng.integers(1, 5, size=genome_length)) % 5
+    counts[np.arange(genome_length), error_channel] = errors
+    counts[np.arange(genome_length), reference] = depth - errors
+
+    # mutations of interest grow in frequency over the sampling period
+    midpoint = rng.uniform(0, 1, size=mutation_positions.size)
+    frequency = 1 / (1 + np.exp(-10 * (progress - midpoint)))
+    ref_at = reference[mutation_positions]
+    mutated = rng.binomial(counts[mutation_positions, ref_at], frequency)
+    counts[mutation_positions, ref_at] -= mutated
+    counts[mutation_positions, mutation_nt] += mutated
+    return counts.astype(np.uint32)
+
+
+def write_table(path: Path, header: str, rows: pd.DataFrame) -> None:
+    """Write a gzipped tab separated table below a verbatim header."""
+    buffer = io.StringIO()
+    buffer.write(header)
+    rows.to_csv(buffer, sep="\t", header=False, index=False)
+    with gzip.open(path, "wt", compresslevel=6) as file:
+        file.write(buffer.getvalue())
+
+
+def write_sample(
+    alignments: Path,
+    sample: str,
+    reference: np.ndarray,
+    mutation_positions: np.ndarray,
+    mutation_nt: np.ndarray,
+    progress: float,
+    seed: int,
+) -> None:
+    """Write the basecnt.tsv.gz and coverage.tsv.gz of one sample."""
+    counts = sample_counts(reference, mutation_positions, mutation_nt, progress, seed)
+    positions = np.arange(1, reference.size + 1)
+    alignments.mkdir(parents=True, exist_ok=True)
+
+    basecnt = pd.DataFrame(counts, columns=list(NUCLEOTIDES))
+    basecnt.insert(0, "pos", positions)
+    basecnt.insert(0, "ref", REFERENCE_NAME)
+    write_table(
+        alignments / "basecnt.tsv.gz",
+        "sample\t\t"
+        + "\t".join([sample] * 5)
+        + "\nnt\t\tA\tC\tG\tT\t-\nref\tpos\t\t\t\t\t\n",
+        basecnt,
+    )
+    coverage = pd.DataFrame(
+        {"ref": REFERENCE_NAME, "pos": positions, "depth": counts.sum(axis=1)}
+    )
+    write_table(alignments / "coverage.tsv.gz", f"ref\tpos\t{sample}\n", coverage)
+
+
+def generate_tree(
+    out_dir: str,
+    n_samples: int = 100,
+    n_mutations: int = 10,
+    genome_length: int = 29903,
+    seed: int = 0,
+    jobs: int = 1,
+) -> dict:
+    """
+    Generate a synthetic V-pipe result tree.
+
+    Args:
+        out_dir: Directory to write the tree to.
+        n_samples: Number of samples.
+        n_mutations: Number of mutations of interest.
+        genome_length: Number of positions of the genome.
+        seed: Seed of the whole tree.
+        jobs: Number of processes to write the samples with.
+
+    Returns:
+        dict: Paths of the generated inputs.
+    """
+    out_path = Path(out_dir)
+    results = out_path / "results"
+    results.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    reference = reference_sequence(genome_length, seed)
+
+    # mutations of interest at distinct positions, to another nucleotide
+    n_mutations = min(n_mutations, genome_length)
+    mutation_positions = np.sort(
+        rng.choice(genome_length, size=n_mutations, replace=False)
+    )
+    mutation_nt = (reference[mutation_positions] + rng.integers(1, 4, n_mutations)) % 4
+    mutations = [
+        f"{NUCLEOTIDES[ref]}{pos + 1}{NUCLEOTIDES[alt]}"
+        for ref, pos, alt in zip(
+            reference[mutation_positions], mutation_positions, mutation_nt
+        )
+    ]
+    pd.DataFrame({"mut": mutations}).to_csv(
+        out_path / "mutations_of_interest.csv", index=False
+    )
+
+    # one sample about every third day per location
+    first_day = date(2024, 1, 2)
+    timeline = []
+    for i in range(n_samples):
+        location = LOCATIONS[i % len(LOCATIONS)]
+        day = first_day + timedelta(days=3 * (i // len(LOCATIONS)) + i % 3)
+        batch = (day + timedelta(days=4)).strftime("%Y%m%d") + "_SYNTH"
+        sample = f"{chr(65 + i % len(LOCATIONS))}{i:05d}_{day:%Y_%m_%d}"
+        timeline.append((sample, batch, 250, "v41", location, day.isoformat()))
+    timeline = pd.DataFrame(
+        timeline, columns=["sample", "batch", "reads", "proto", "location", "date"]
+    )
+    timeline.to_csv(out_path / "timeline.tsv", sep="\t", index=False)
+    timeline[["sample", "batch", "reads", "proto"]].to_csv(
+        out_path / "samples.tsv", sep="\t", index=False, header=False
+    )
+    primer_bed(genome_length).to_csv(
+        out_path / "primers.bed", sep="\t", index=False, header=False
+    )
+
+    tasks = [
+        (
+            results / sample / batch / "alignments",
+            sample,
+            reference,
+            mutation_positions,
+            mutation_nt,
+            i / max(n_samples - 1, 1),
+            seed + 1 + i,
+        )
+        for i, (sample, batch) in enumerate(zip(timeline["sample"], timeline["batch"]))
+    ]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(write_sample, *zip(*tasks)))
+    else:
+        for task in tasks:
+            write_sample(*task)
+
+    return {
+        "root": str(out_path),
+        "results": str(results),
+        "basecnt_fps": str(results / "*" / "*" / "alignments" / "basecnt.tsv.gz"),
+        "coverage_fps": str(results / "*" / "*" / "alignments" / "coverage.tsv.gz"),
+        "timeline": str(out_path / "timeline.tsv"),
+        "samples": str(out_path / "samples.tsv"),
+        "mutations": str(out_path / "mutations_of_interest.csv"),
+        "primers": str(out_path / "primers.bed"),
+        "startdate": (first_day - timedelta(days=1)).isoformat(),
+        "enddate": (
+            date.fromisoformat(timeline["date"].max()) + timedelta(days=1)
+        ).isoformat(),
+        "location": LOCATIONS[0],
+    }
+
+
+@click.command()
+@click.argument("out_dir", type=click.Path(path_type=Path))
+@click.option("--samples", default=100, type=click.IntRange(min=1), help="Samples.")
+@click.option(
+    "--mutations", default=10, type=click.IntRange(min=1), help="Mutations of interest."
+)
+@click.option("--genome-length", default=29903, type=click.IntRange(min=1000))
+@click.option("--seed", default=0, type=int)
+@click.option("-j", "--jobs", default=1, type=click.IntRange(min=1))
+def main(out_dir, samples, mutations, genome_length, seed, jobs):
+    """Generate a synthetic V-pipe result tree in OUT_DIR."""
+    generate_tree(str(out_dir), samples, mutations, genome_length, seed, jobs)
+    click.echo(f"Wrote {samples} samples to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
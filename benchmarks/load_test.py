@@ -0,0 +1,188 @@
+"""Load test of the coverage query server under concurrent clients.
+
+Starts scripts/coverage_server.py on a synthetic tree (or targets a running
+server with --url), then runs --clients threads, each with its own
+connection, sending random mutation x six-week x location queries:
+
+    python benchmarks/load_test.py --samples 400 --clients 8 --requests 200
+
+Reports the throughput and the latency percentiles as a JSON line, together
+with the counters of the server.
+"""
+
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+import click
+import numpy as np
+import pandas as pd
+
+from run_benchmarks import prepare_tree
+from usefulgnom.interface.client import CoverageClient
+from usefulgnom.interface.server import QUERY_KINDS
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def start_server(tree: dict, genome_length: int, preload: bool) -> tuple:
+    """Start a server on a free port, return its process and URL."""
+    command = [
+        sys.executable,
+        str(REPO_ROOT / "scripts" / "coverage_server.py"),
+        "--basecnt-fps",
+        tree["basecnt_fps"],
+        "--timeline",
+        tree["timeline"],
+        "--port",
+        "0",
+        "--genome-length",
+        str(genome_length),
+    ]
+    if preload:
+        command += ["--preload", "all"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    assert process.stdout is not None
+    for line in process.stdout:
+        if line.startswith("Serving coverage queries on "):
+            return process, line.split()[-1]
+    process.wait()
+    raise RuntimeError("The coverage server did not start.")
+
+
+def random_queries(
+    tree: dict, locations: list[str], n_queries: int, seed: int
+) -> list[dict]:
+    """Random queries of 1 to 5 mutations over six weeks of one location."""
+    rng = random.Random(seed)
+    mutations = list(pd.read_csv(tree["mutations"])["mut"])
+    first = datetime.strptime(tree["startdate"], "%Y-%m-%d")
+    days = (datetime.strptime(tree["enddate"], "%Y-%m-%d") - first).days
+    queries = []
+    for _ in range(n_queries):
+        end = first + timedelta(days=rng.randint(42, max(42, days)))
+        queries.append(
+            dict(
+                mutations=rng.sample(mutations, rng.randint(1, min(5, len(mutations)))),
+                location=rng.choice(locations),
+                startdate=(end - timedelta(days=42)).strftime("%Y-%m-%d"),
+                enddate=end.strftime("%Y-%m-%d"),
+                kind=rng.choice(QUERY_KINDS),
+            )
+        )
+    return queries
+
+
+def run_client(url: str, queries: list[dict], latencies: list, errors: list) -> None:
+    """Send the queries one after the other, record their latencies."""
+    client = CoverageClient(url)
+    try:
+        for query in queries:
+            start = time.perf_counter()
+            try:
+                client.query(**query)
+            except (ValueError, OSError) as error:
+                errors.append(str(error))
+            latencies.append(time.perf_counter() - start)
+    finally:
+        client.close()
+
+
+@click.command()
+@click.option("--url", default=None, help="URL of a running server to target.")
+@click.option("--samples", default=400, type=click.IntRange(min=1))
+@click.option("--mutations", default=10, type=click.IntRange(min=1))
+@click.option("--genome-length", default=29903, type=click.IntRange(min=1000))
+@click.option(
+    "--work-dir",
+    default=Path("/tmp/usefulgnom-benchmarks"),
+    type=click.Path(path_type=Path),
+)
+@click.option("--clients", default=8, type=click.IntRange(min=1))
+@click.option("--requests", default=200, type=click.IntRange(min=1))
+@click.option("--no-preload", is_flag=True, help="Load samples on first query.")
+@click.option("--seed", default=0, type=int)
+@click.option("-j", "--jobs", default=1, type=click.IntRange(min=1))
+@click.option("--output", default=None, type=click.Path(path_type=Path))
+def main(
+    url: Optional[str],
+    samples,
+    mutations,
+    genome_length,
+    work_dir,
+    clients,
+    requests,
+    no_preload,
+    seed,
+    jobs,
+    output,
+):
+    """Measure the throughput of the coverage query server."""
+    tree_file = prepare_tree(work_dir, samples, mutations, genome_length, jobs)
+    with open(tree_file) as file:
+        tree = json.load(file)
+
+    process = None
+    if url is None:
+        start = time.perf_counter()
+        process, url = start_server(tree, genome_length, not no_preload)
+        startup_s = time.perf_counter() - start
+    else:
+        startup_s = 0.0
+    try:
+        locations = CoverageClient(url).locations()
+        latencies: list[float] = []
+        errors: list[str] = []
+        threads = [
+            threading.Thread(
+                target=run_client,
+                args=(
+                    url,
+                    random_queries(tree, locations, requests, seed + i),
+                    latencies,
+                    errors,
+                ),
+            )
+            for i in range(clients)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time_s = time.perf_counter() - start
+        stats = CoverageClient(url).stats()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    latency_ms = np.asarray(latencies) * 1000
+    record = {
+        "samples": samples,
+        "mutations": mutations,
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "startup_s": round(startup_s, 3),
+        "wall_time_s": round(wall_time_s, 3),
+        "requests_per_s": round(len(latencies) / wall_time_s, 1),
+        "p50_ms": round(float(np.percentile(latency_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latency_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latency_ms, 99)), 2),
+        "server": stats,
+    }
+    click.echo(json.dumps(record))
+    if output is not None:
+        with open(output, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
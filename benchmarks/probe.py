@@ -0,0 +1,203 @@
+"""Run one benchmark case and report its cost as a JSON line.
+
+Meant to be run in a fresh process per case by run_benchmarks.py, so the peak
+RSS of one case does not leak into the next:
+
+    python benchmarks/probe.py <case> <tree.json> [--workers N] [--streaming]
+        [--parser NAME] [--prefetch THREADS]
+
+Reports the wall time, the peak RSS of the process and of its worker
+processes, and the number of bytes decompressed from gzip files. The
+decompressed bytes are counted by wrapping gzip's reader and gzip.decompress;
+worker processes inherit the wrappers when forked (the default on Linux up to
+Python 3.13), prefetch threads share them under a lock.
+"""
+
+import atexit
+import gzip
+import json
+import os
+import resource
+import runpy
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import click
+
+from usefulgnom.serialize.parsers import DEFAULT_PARSER, PARSERS
+
+CASES = ["basecnt_coverage", "total_coverage", "amplicon_coverage"]
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# decompressed bytes of this process not yet flushed to the counter file
+_decompressed = 0
+_decompressed_lock = threading.Lock()
+
+
+def _flush_decompressed(counter_path: str) -> None:
+    """Append the decompressed bytes of this process to the counter file."""
+    global _decompressed
+    with _decompressed_lock:
+        flushed, _decompressed = _decompressed, 0
+    if flushed:
+        # O_APPEND writes of one short line are atomic across processes
+        fd = os.open(counter_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, f"{flushed}\n".encode())
+        finally:
+            os.close(fd)
+
+
+def count_decompressed_bytes(counter_path: str) -> None:
+    """Wrap gzip's reader to count the bytes decompressed by all processes."""
+    read = gzip._GzipReader.read
+    close = gzip.GzipFile.close
+    decompress = gzip.decompress
+
+    def counting_read(self, size=-1):
+        global _decompressed
+        data = read(self, size)
+        with _decompressed_lock:
+            _decompressed += len(data)
+        return data
+
+    def flushing_close(self):
+        close(self)
+        # worker processes exit without atexit handlers, flush per file
+        _flush_decompressed(counter_path)
+
+    def counting_decompress(data):
+        global _decompressed
+        data = decompress(data)
+        with _decompressed_lock:
+            _decompressed += len(data)
+        _flush_decompressed(counter_path)
+        return data
+
+    gzip._GzipReader.read = counting_read
+    gzip.GzipFile.close = flushing_close
+    gzip.decompress = counting_decompress
+    atexit.register(_flush_decompressed, counter_path)
+
+
+def run_case(
+    case: str,
+    tree: dict,
+    out_dir: str,
+    workers: int,
+    streaming: bool,
+    parser: str,
+    prefetch: int = 0,
+):
+    """Run one benchmark case on a generated tree."""
+    if case == "basecnt_coverage":
+        from usefulgnom.analyze import run_basecnt_coverage
+
+        run_basecnt_coverage(
+            tree["basecnt_fps"],
+            tree["timeline"],
+            tree["mutations"],
+            os.path.join(out_dir, "mut_base_coverage.csv"),
+            tree["startdate"],
+            tree["enddate"],
+            tree["location"],
+            n_workers=workers,
+            streaming=streaming,
+            parser=parser,
+            prefetch_threads=prefetch,
+        )
+    elif case == "total_coverage":
+        from usefulgnom.analyze import run_total_coverage_depth
+
+        run_total_coverage_depth(
+            coverage_tsv_fps=tree["coverage_fps"],
+            mutations_of_interest_fp=tree["mutations"],
+            timeline_file_dir=tree["timeline"],
+            output_file=os.path.join(out_dir, "mut_total_coverage.csv"),
+            startdate=tree["startdate"],
+            enddate=tree["enddate"],
+            location=tree["location"],
+            n_workers=workers,
+            streaming=streaming,
+            parser=parser,
+            prefetch_threads=prefetch,
+        )
+    elif case == "amplicon_coverage":
+        sys.argv = [
+            "amplicon_covs.py",
+            "-s",
+            tree["samples"],
+            "-f",
+            tree["results"],
+            "-r",
+            tree["primers"],
+            "-o",
+            out_dir,
+            "-j",
+            str(workers),
+            "--no-scheme-cache",
+            "--parser",
+            parser,
+        ]
+        try:
+            runpy.run_path(
+                str(REPO_ROOT / "scripts" / "amplicon_covs.py"), run_name="__main__"
+            )
+        except SystemExit as exit:
+            if exit.code:
+                raise
+    else:
+        raise ValueError(f"Unknown benchmark case {case}, expected one of {CASES}.")
+
+
+@click.command()
+@click.argument("case", type=click.Choice(CASES))
+@click.argument("tree_file", type=click.Path(exists=True))
+@click.option("--workers", default=1, type=click.IntRange(min=1))
+@click.option("--streaming", is_flag=True)
+@click.option("--parser", default=DEFAULT_PARSER, type=click.Choice(PARSERS))
+@click.option("--prefetch", default=0, type=click.IntRange(min=0))
+def main(case, tree_file, workers, streaming, parser, prefetch):
+    """Run benchmark CASE on the tree described by TREE_FILE."""
+    with open(tree_file) as file:
+        tree = json.load(file)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        counter_path = os.path.join(out_dir, "decompressed.txt")
+        count_decompressed_bytes(counter_path)
+
+        start = time.perf_counter()
+        run_case(case, tree, out_dir, workers, streaming, parser, prefetch)
+        wall_time = time.perf_counter() - start
+
+        _flush_decompressed(counter_path)
+        with open(counter_path, "a+") as file:
+            file.seek(0)
+            bytes_decompressed = sum(int(line) for line in file)
+
+    # ru_maxrss is in KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    peak_child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    click.echo(
+        json.dumps(
+            {
+                "case": case,
+                "workers": workers,
+                "streaming": streaming,
+                "parser": parser,
+                "prefetch": prefetch,
+                "wall_time_s": round(wall_time, 4),
+                "peak_rss_bytes": peak_rss,
+                "peak_worker_rss_bytes": peak_child_rss,
+                "bytes_decompressed": bytes_decompressed,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
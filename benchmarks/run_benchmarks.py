@@ -0,0 +1,142 @@
+"""Benchmark the coverage analyses over a grid of synthetic tree scales.
+
+For every combination of --samples and --mutations a synthetic V-pipe tree
+is generated (and reused on later runs), then every case is run in its own
+process by probe.py. Results are printed as a table and written as JSON
+lines, so scaling curves can be compared between releases.
+
+Usage:
+    python benchmarks/run_benchmarks.py --samples 100 --samples 1000 \
+        --mutations 10 --mutations 1000 --output bench.jsonl
+"""
+
+import itertools
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import click
+
+from generate_tree import generate_tree
+from probe import CASES
+from usefulgnom.serialize.parsers import DEFAULT_PARSER, PARSERS
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+
+
+def prepare_tree(
+    work_dir: Path, n_samples: int, n_mutations: int, genome_length: int, jobs: int
+) -> Path:
+    """Generate a tree of the given scale unless it exists, return its description."""
+    tree_dir = work_dir / f"tree_s{n_samples}_m{n_mutations}_g{genome_length}"
+    tree_file = tree_dir / "tree.json"
+    if not tree_file.exists():
+        tree = generate_tree(
+            str(tree_dir), n_samples, n_mutations, genome_length, jobs=jobs
+        )
+        # written last, marks the tree as complete
+        with open(tree_file, "w") as file:
+            json.dump(tree, file, indent=2)
+    return tree_file
+
+
+def run_probe(
+    case: str,
+    tree_file: Path,
+    workers: int,
+    streaming: bool,
+    parser: str,
+    prefetch: int = 0,
+) -> dict:
+    """Run one case in a fresh process and parse its report."""
+    command = [
+        sys.executable,
+        str(BENCHMARK_DIR / "probe.py"),
+        case,
+        str(tree_file),
+        "--workers",
+        str(workers),
+        "--parser",
+        parser,
+        "--prefetch",
+        str(prefetch),
+    ]
+    if streaming:
+        command.append("--streaming")
+    completed = subprocess.run(command, check=True, capture_output=True, text=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+@click.command()
+@click.option("--samples", multiple=True, default=[100], type=click.IntRange(min=1))
+@click.option("--mutations", multiple=True, default=[10], type=click.IntRange(min=1))
+@click.option("--genome-length", default=29903, type=click.IntRange(min=1000))
+@click.option("--case", "cases", multiple=True, default=CASES, type=click.Choice(CASES))
+@click.option("--workers", default=1, type=click.IntRange(min=1))
+@click.option("--streaming", is_flag=True, help="Stream the coverage files.")
+@click.option(
+    "--parser",
+    default=DEFAULT_PARSER,
+    type=click.Choice(PARSERS),
+    help="Parser backend of the coverage files.",
+)
+@click.option(
+    "--prefetch",
+    default=0,
+    type=click.IntRange(min=0),
+    help="Threads prefetching the coverage files of serial loads.",
+)
+@click.option("--repeat", default=1, type=click.IntRange(min=1))
+@click.option(
+    "--work-dir",
+    default=".benchmarks",
+    type=click.Path(path_type=Path),
+    help="Directory of the generated trees, reused across runs.",
+)
+@click.option("-j", "--jobs", default=1, type=click.IntRange(min=1))
+@click.option("--output", default=None, type=click.Path(path_type=Path))
+def main(
+    samples,
+    mutations,
+    genome_length,
+    cases,
+    workers,
+    streaming,
+    parser,
+    prefetch,
+    repeat,
+    work_dir,
+    jobs,
+    output,
+):
+    """Benchmark the coverage analyses on synthetic V-pipe trees."""
+    records = []
+    click.echo(
+        f"{'case':<20}{'samples':>8}{'muts':>7}{'wall [s]':>10}"
+        f"{'RSS [MiB]':>11}{'worker RSS':>12}{'decompr. [MiB]':>16}"
+    )
+    for n_samples, n_mutations in itertools.product(samples, mutations):
+        tree_file = prepare_tree(work_dir, n_samples, n_mutations, genome_length, jobs)
+        for case, _ in itertools.product(cases, range(repeat)):
+            record = run_probe(case, tree_file, workers, streaming, parser, prefetch)
+            record.update(
+                samples=n_samples, mutations=n_mutations, genome_length=genome_length
+            )
+            records.append(record)
+            click.echo(
+                f"{case:<20}{n_samples:>8}{n_mutations:>7}"
+                f"{record['wall_time_s']:>10.2f}"
+                f"{record['peak_rss_bytes'] / 1024**2:>11.1f}"
+                f"{record['peak_worker_rss_bytes'] / 1024**2:>12.1f}"
+                f"{record['bytes_decompressed'] / 1024**2:>16.1f}"
+            )
+
+    if output is not None:
+        with open(output, "a") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Convert gzipped V-pipe coverage files to BGZF with a position index.
+
+The files are rewritten in place as block-gzipped (BGZF) files, which gzip,
+zcat and all the usefulgnom parsers still read, and a .idx.npz index of their
+blocks is written next to them. The analyses then only inflate the blocks
+holding the positions of interest, see usefulgnom.serialize.bgzf.
+
+Usage:
+To convert all basecnt and coverage files of a results tree, on 8 processes:
+
+```python ./convert_bgzf.py -j 8 results/*/*/alignments/basecnt.tsv.gz \
+    results/*/*/alignments/coverage.tsv.gz```
+
+Files with a current index are skipped, unless --force is given.
+
+This script is the `usefulgnom convert-bgzf` command, see usefulgnom.interface.cli.
+"""
+
+from usefulgnom.interface.cli import convert_bgzf as main
+
+if __name__ == "__main__":
+    main()
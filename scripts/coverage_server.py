@@ -0,0 +1,27 @@
+"""
+Serve queries over the coverage data of a V-pipe results tree.
+
+The server loads the timeline once and the coverage of each sample on its
+first query, keeps them in memory up to --max-memory and answers mutation x
+date-range x location queries over HTTP on the loopback interface, see
+usefulgnom.interface.server.
+
+Usage:
+To serve the Zürich samples, loaded up front, on port 8765:
+
+```python ./coverage_server.py \
+    -b "results/*/*/alignments/basecnt.tsv.gz" -t variants/timeline.tsv \
+    --preload "Zürich (ZH)" --port 8765```
+
+Then e.g. the frequencies of KP.2 and KP.3 in the six weeks to 2024-07-03:
+
+```curl "http://127.0.0.1:8765/query?mutation=G22599C&mutation=C23039G\
+&location=Z%C3%BCrich%20(ZH)&start=2024-05-22&end=2024-07-03"```
+
+This script is the `usefulgnom serve` command, see usefulgnom.interface.cli.
+"""
+
+from usefulgnom.interface.cli import serve as main
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,23 @@
-"""Usefeul Genome Utilities"""
+"""Usefeul Genome Utilities
 
-from usefulgnom import analyze
+The subpackages are imported on first access, e.g. `ug.analyze`, so that
+`import usefulgnom` and the command line interface start without loading
+pandas or matplotlib.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from usefulgnom import analyze
 
 __all__ = ["analyze"]
+
+SUBPACKAGES = ["analyze", "interface", "serialize", "store", "visualise"]
+
+
+def __getattr__(name: str):
+    """Import a subpackage on its first access."""
+    if name in SUBPACKAGES:
+        return importlib.import_module(f"usefulgnom.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
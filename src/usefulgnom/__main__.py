@@ -0,0 +1,6 @@
+"""Runs the command line interface, `python -m usefulgnom`."""
+
+from usefulgnom.interface.cli import main
+
+if __name__ == "__main__":
+    main(prog_name="usefulgnom")
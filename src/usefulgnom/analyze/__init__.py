@@ -2,6 +2,21 @@
 
 from usefulgnom.analyze.basecnt_coverage import run_basecnt_coverage
 from usefulgnom.analyze.total_coverage import run_total_coverage_depth
+from usefulgnom.analyze.frequency import run_mutation_frequency
+from usefulgnom.analyze.statistics import mutation_statistics
+from usefulgnom.analyze.depth_summary import (
+    DepthSummary,
+    merge_depth_summaries,
+    run_depth_summary,
+)
 
 
-__all__ = ["run_basecnt_coverage", "run_total_coverage_depth"]
+__all__ = [
+    "run_basecnt_coverage",
+    "run_total_coverage_depth",
+    "run_mutation_frequency",
+    "mutation_statistics",
+    "DepthSummary",
+    "merge_depth_summaries",
+    "run_depth_summary",
+]
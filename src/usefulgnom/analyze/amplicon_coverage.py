@@ -0,0 +1,255 @@
+"""Implements the relative amplicon coverage of a batch of samples.
+
+The coverage of an amplicon is the median depth over its query window, see
+usefulgnom.serialize.primer_scheme. The tables have one row per sample, the
+first column holds the sample name and the other ones the amplicons, e.g.:
+
+    sample,1,2,3,...
+    A1_05_2020_07_29,1203.0,877.5,0.0,...
+
+Credits:
+    - core code: @dr-david (drdavid@student.ethz.ch)
+    - implementation: @koehng (koehng@ethz.ch)
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from usefulgnom.serialize.metrics import MeasuredLoader, Metrics
+from usefulgnom.serialize.parsers import DEFAULT_PARSER, read_columns
+from usefulgnom.serialize.primer_scheme import PrimerScheme, amplicon_windows
+
+# estimated peak memory of parsing one coverage file, bounds the number of
+# samples in flight given a memory budget
+SAMPLE_MEMORY_BYTES = 16 * 1024**2
+
+
+def get_samples_paths(main_samples_path: Path, samplestsv) -> list[str]:
+    """Get list of paths to coverage files given from a samples.tsv list file.
+
+    Args:
+        main_samples_path: Path to the main samples directory.
+        samplestsv: Path to the samples.tsv file.
+
+    Returns:
+        sam_paths_list (list[str]): List of paths to coverage files.
+    """
+    main_samples_path_str = str(main_samples_path)
+    sam_paths_list = []
+    with open(samplestsv, "r") as f:
+        for line in f:
+            tmp = line.rstrip("\n").split("\t")
+            sam_paths_list.append(
+                main_samples_path_str
+                + "/"
+                + tmp[0]
+                + "/"
+                + tmp[1]
+                + "/alignments/coverage.tsv.gz"
+            )
+    return sam_paths_list
+
+
+def amplicon_medians(depth: np.ndarray, index: np.ndarray, valid: np.ndarray):
+    """Get the median coverage of all amplicons at once.
+
+    Args:
+        depth: Depth per row of the coverage file, of shape (positions,)
+            or a stack of samples of shape (samples, positions).
+        index: Row index matrix, see amplicon_windows.
+        valid: Mask of the valid entries of index.
+
+    Returns:
+        np.ndarray: Medians of shape (amplicons,) or (samples, amplicons).
+    """
+    windows = depth[..., index].astype(np.float64)
+    if valid.all():
+        return np.median(windows, axis=-1)
+    windows[..., ~valid] = np.nan
+    return np.nanmedian(windows, axis=-1)
+
+
+def get_count_reads(cov_df: pd.DataFrame, amplicons_df):
+    """Get coverage of all amplicons."""
+    index, valid = amplicon_windows(amplicons_df)
+    medians = amplicon_medians(cov_df.iloc[:, 2].to_numpy(), index, valid)
+    return pd.Series(medians, index=amplicons_df.index)
+
+
+def load_depth(sam: str, parser: str = DEFAULT_PARSER) -> np.ndarray:
+    """Read only the depth column of a coverage.tsv.gz file, as uint32."""
+    return read_columns(sam, [2], 1, parser)[:, 0]
+
+
+def load_sample_medians(
+    sam: str, index: np.ndarray, valid: np.ndarray, parser: str = DEFAULT_PARSER
+):
+    """Get the amplicon medians of one sample, None if its file is missing."""
+    try:
+        depth = load_depth(sam, parser)
+    except FileNotFoundError:
+        return None
+    return amplicon_medians(depth, index, valid)
+
+
+def iter_sample_medians(
+    sam_list: list[str],
+    index: np.ndarray,
+    valid: np.ndarray,
+    jobs: int,
+    max_in_flight: int,
+    parser: str = DEFAULT_PARSER,
+) -> Iterator[tuple[int, Optional[np.ndarray], dict]]:
+    """Compute amplicon medians over a process pool, streaming results back.
+
+    At most max_in_flight samples are submitted at a time.
+
+    Args:
+        sam_list: List of paths to coverage files.
+        index: Row index matrix, see amplicon_windows.
+        valid: Mask of the valid entries of index.
+        jobs: Number of worker processes.
+        max_in_flight: Maximum number of samples submitted at a time.
+        parser: Parser backend, see usefulgnom.serialize.parsers.
+
+    Yields:
+        tuple[int, np.ndarray, dict]: Position in sam_list, medians and
+            timing record (see MeasuredLoader) of a sample, in order of
+            completion.
+    """
+    loader = MeasuredLoader(
+        partial(load_sample_medians, index=index, valid=valid, parser=parser)
+    )
+    samples = iter(enumerate(sam_list))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = {}
+        while True:
+            for i, sam in samples:
+                future = executor.submit(loader, sam)
+                pending[future] = i
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                medians, record = future.result()
+                yield pending.pop(future), medians, record
+
+
+def coverage_tables(
+    samples: list[str], medians: np.ndarray, amplicons_df: pd.DataFrame
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Get the coverage and the relative coverage tables of the amplicons.
+
+    Args:
+        samples: Sample names, one per row of medians.
+        medians: Amplicon medians of shape (samples, amplicons).
+        amplicons_df: Amplicons of the primer scheme, their index labels the
+            columns.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: The coverages and the coverages
+            normalised by their sum over the amplicons of each sample.
+    """
+    all_covs = pd.DataFrame(medians, columns=amplicons_df.index)
+    all_covs_frac = all_covs.div(all_covs.sum(axis=1), axis=0)
+
+    all_covs = pd.concat(
+        [pd.DataFrame({"sample": samples}), all_covs.reset_index(drop=True)],
+        axis=1,
+        ignore_index=False,
+    )
+    all_covs_frac = pd.concat(
+        [pd.DataFrame({"sample": samples}), all_covs_frac.reset_index(drop=True)],
+        axis=1,
+        ignore_index=False,
+    )
+    return all_covs, all_covs_frac
+
+
+def amplicon_coverage_tables(
+    sam_list: list[str],
+    scheme: PrimerScheme,
+    n_workers: int = 1,
+    max_in_flight: Optional[int] = None,
+    parser: str = DEFAULT_PARSER,
+    metrics: Optional[Metrics] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> tuple[pd.DataFrame, pd.DataFrame, list[str]]:
+    """Compute the amplicon coverage tables of a batch of samples.
+
+    Serially, the depths of all samples are stacked and their medians taken
+    at once. With several workers, each sample is reduced to its medians in
+    a process pool, with at most max_in_flight samples submitted at a time.
+    Either way the rows follow the order of sam_list.
+
+    Args:
+        sam_list: List of paths to coverage files, see get_samples_paths.
+        scheme: Compiled primer scheme, see load_primer_scheme.
+        n_workers: Number of worker processes, 1 loads serially.
+        max_in_flight: Maximum number of samples submitted at a time, default
+            is twice the number of workers.
+        parser: Parser backend, see usefulgnom.serialize.parsers.
+        metrics: Optional sink of the stage durations and per-sample records.
+        progress: Optional callback, called with 1 after each sample.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame, list[str]]: The coverages, the
+            relative coverages (see coverage_tables) and the coverage files
+            that were not found.
+    """
+    if metrics is None:
+        metrics = Metrics()
+    index, valid = scheme.index, scheme.valid
+    n_amplicons = len(scheme.amplicons)
+    samples, missing = [], []
+    if n_workers > 1:
+        if max_in_flight is None:
+            max_in_flight = 2 * n_workers
+        sample_medians: list = [None] * len(sam_list)
+        with metrics.stage("load_samples"):
+            for i, medians, record in iter_sample_medians(
+                sam_list, index, valid, n_workers, max_in_flight, parser
+            ):
+                sample_medians[i] = medians
+                metrics.add_samples([record])
+                if progress is not None:
+                    progress(1)
+        rows = []
+        for sam, medians in zip(sam_list, sample_medians):
+            if medians is None:
+                missing.append(sam)
+                continue
+            samples.append(sam.split("/")[-4])
+            rows.append(medians)
+        medians = np.array(rows).reshape(len(rows), n_amplicons)
+    else:
+        depths = []
+        load_measured = MeasuredLoader(partial(load_depth, parser=parser))
+        with metrics.stage("load_samples"):
+            for sam in sam_list:
+                try:
+                    depth, record = load_measured(sam)
+                    depths.append(depth)
+                    metrics.add_samples([record])
+                    samples.append(sam.split("/")[-4])
+                except FileNotFoundError:
+                    missing.append(sam)
+                if progress is not None:
+                    progress(1)
+
+        # medians of all amplicons of all samples at once
+        with metrics.stage("medians"):
+            if len({depth.shape for depth in depths}) == 1:
+                medians = amplicon_medians(np.stack(depths), index, valid)
+            else:
+                medians = np.array(
+                    [amplicon_medians(depth, index, valid) for depth in depths]
+                ).reshape(len(depths), n_amplicons)
+    return *coverage_tables(samples, medians, scheme.amplicons), missing
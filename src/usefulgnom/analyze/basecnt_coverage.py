@@ -7,14 +7,27 @@
 """
 
 from usefulgnom.serialize import load_convert_bnc
-from usefulgnom.serialize import extract_sample_ID
+from usefulgnom.serialize.cache import CoverageCache, DEFAULT_MAX_BYTES
+from usefulgnom.serialize.manifest import write_manifest
+from usefulgnom.serialize.matrix import write_matrix
+from usefulgnom.serialize.metrics import Metrics
+from usefulgnom.serialize.parsers import DEFAULT_PARSER
+from usefulgnom.analyze.coverage import (
+    is_multi_location,
+    locate_sample_files,
+    location_output,
+    prefetched_files,
+    select_locations,
+    update_coverage_matrix,
+)
 
 
 from datetime import datetime
 import pandas as pd
 import re
-import glob
 import pathlib
+from functools import partial
+from typing import Optional, Union
 
 
 def extract_mutation_position_and_nt(mutations_of_interest_dir: str) -> list[tuple]:
@@ -58,7 +71,15 @@ def run_basecnt_coverage(
     output_file: str,
     startdate: str = "2024-01-01",
     enddate: str = "2024-07-03",
-    location: str = "Zürich (ZH)",
+    location: Union[str, list[str]] = "Zürich (ZH)",
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    n_workers: int = 1,
+    streaming: bool = False,
+    previous_output: Optional[str] = None,
+    metrics_output: Optional[str] = None,
+    parser: str = DEFAULT_PARSER,
+    prefetch_threads: int = 0,
 ) -> None:
     """
     Analyze the read nucleotide coverage data.
@@ -68,10 +89,32 @@ def run_basecnt_coverage(
         '...work-ww-lofreq-230405/results/*/*/alignments/basecnt.tsv.gz'
         timeline_file_dir (str): Path to the timeline file.
         mutations_of_interest_dir (str): Path to the mutations_of_interest file.
-        output_file (str): Path to the output file.
+        output_file (str): Path to the output file, with a "{location}"
+            placeholder if several locations are computed; written as CSV,
+            Parquet or Arrow IPC after its suffix (.csv, .parquet, .arrow).
         startdate (str): Start date of the time period, default is 2024-01-01.
         enddate (str): End date of the time period, default is 2024-07-03.
-        location (str): Location of the samples, default is Zürich (ZH).
+        location (str | list[str]): Location of the samples, default is
+            Zürich (ZH); a list of locations or "all" writes one output per
+            location from a single glob and timeline read.
+        cache_dir (str): Optional directory of the decoded coverage cache,
+            files are decoded on first touch and memory-mapped on later runs;
+            also holds the parsed timeline.
+        cache_max_bytes (int): Size bound of the decoded coverage cache.
+        n_workers (int): Number of processes to load the samples with,
+            default is 1 (serial).
+        streaming (bool): Only decompress each file up to the largest
+            position of interest, useful for targeted panels.
+        previous_output (str): Optional earlier output of this analysis, e.g.
+            `output_file` itself; only samples that are new or changed since,
+            and mutations missing from it, are loaded.
+        metrics_output (str): Optional path to write the per-stage durations,
+            I/O totals and slowest samples to, as JSON.
+        parser (str): Parser backend of the coverage files, one of
+            usefulgnom.serialize.parsers.PARSERS, default is pandas.
+        prefetch_threads (int): Number of threads reading and decompressing
+            the next coverage files while one is parsed, when loading
+            serially; default is 0 (no prefetching).
 
     Returns:
         None
@@ -90,35 +133,61 @@ def run_basecnt_coverage(
     #   3.3 Add this column to the matrix of coverage
     # 4. Output csv file
 
-    # get list of base coverage basecnt.tsv.gz files in the input directory
-    coverage_files = glob.glob(basecnt_fps, recursive=True)
-
+    metrics = Metrics()
     # get samples_IDs from the specified location, time and sequencing protocol
     startdatetime = datetime.strptime(startdate, "%Y-%m-%d")
     enddatetime = datetime.strptime(enddate, "%Y-%m-%d")
-    sample_IDs = extract_sample_ID(
-        timeline_file_dir, startdatetime, enddatetime, location
-    )
+    with metrics.stage("timeline"):
+        samples_by_location = select_locations(
+            timeline_file_dir, startdatetime, enddatetime, location, cache_dir
+        )
+    # the basecnt.tsv.gz files of the selected samples, built from their sample
+    # and batch directory names instead of listing the results tree
+    with metrics.stage("locate_files"):
+        files_by_location = locate_sample_files(basecnt_fps, samples_by_location)
     # get the position in the genome and mutated nt for which we want to
     #  find coverage
-    position_mutated_nt = extract_mutation_position_and_nt(mutations_of_interest_dir)
-
-    # record columns for df (one sample = one column of different mutations)
-    columns = pd.DataFrame()
-    # iterate over the basecnt.tsv.gz files from the list
-    for basecnt_file in coverage_files:
-        # extract the sample name from the directory name
-        sample_name = basecnt_file.split("/")[-4]
-        if sample_name in sample_IDs.iloc[:, 0].values:
-            # load the basecnt.tsv.gz file of that sample, and extract the
-            # column with the mutation coverages
-            df = load_convert_bnc(basecnt_file, position_mutated_nt)
-            date = sample_IDs.loc[sample_IDs.loc[:, "sample"] == sample_name, "date"]
-            columns[date] = df
+    with metrics.stage("mutations"):
+        position_mutated_nt = extract_mutation_position_and_nt(
+            mutations_of_interest_dir
+        )
+    # decoded coverage cache, shared across runs
+    cache = CoverageCache(cache_dir, cache_max_bytes) if cache_dir else None
 
     # wrangle the data to have the same order of columns as in the mutations_of_interest
     ind = pd.read_csv(mutations_of_interest_dir, usecols=["mut"])
-    sorted_df = columns.sort_index(axis=1)
-    sorted_df = sorted_df.set_index(ind["mut"])
-    # save the output to a csv file
-    sorted_df.to_csv(output_file)
+
+    def make_loader(rows: list[int]) -> partial:
+        """Loader of the coverages of the given mutations."""
+        return partial(
+            load_convert_bnc,
+            pos_mut=[position_mutated_nt[row] for row in rows],
+            cache=cache,
+            streaming=streaming,
+            parser=parser,
+        )
+
+    multi_location = is_multi_location(location)
+    for name, sample_IDs in samples_by_location.items():
+        selected_files = files_by_location[name]
+        location_output_file = location_output(output_file, name, multi_location)
+        # load the basecnt.tsv.gz file of each new or changed sample, and extract
+        # the column with the mutation coverages
+        with metrics.stage("load_samples"):
+            sorted_df, manifest = update_coverage_matrix(
+                make_loader,
+                selected_files,
+                sample_IDs,
+                ind["mut"],
+                location_output(previous_output, name, multi_location),
+                n_workers,
+                metrics,
+                prefetch_threads,
+                partial(prefetched_files, cache=cache),
+            )
+        # save the output matrix, with the manifest of the samples next to it
+        with metrics.stage("write"):
+            write_matrix(sorted_df, location_output_file)
+            write_manifest(manifest, location_output_file)
+    if metrics_output is not None:
+        metrics.write(metrics_output)
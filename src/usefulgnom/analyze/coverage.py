@@ -0,0 +1,583 @@
+"""Shared analysis functions for coverage data."""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Callable, Iterable, Optional, TypeVar, Union
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from usefulgnom.serialize.bgzf import index_path
+from usefulgnom.serialize.cache import CoverageCache
+from usefulgnom.serialize.manifest import build_manifest, read_manifest
+from usefulgnom.serialize.matrix import read_matrix
+from usefulgnom.serialize.metrics import MeasuredLoader, Metrics
+from usefulgnom.serialize.prefetch import prefetch
+from usefulgnom.serialize.timeline import load_timeline_index
+
+T = TypeVar("T")
+
+# location argument selecting every location of the timeline
+ALL_LOCATIONS = "all"
+
+
+def load_samples(
+    loader: Callable[[str], T],
+    coverage_files: list[str],
+    n_workers: int = 1,
+    metrics: Optional[Metrics] = None,
+    prefetch_threads: int = 0,
+    sample_files: Optional[Callable[[str], list[str]]] = None,
+) -> list[T]:
+    """
+    Load the per-sample coverage vectors of the given files.
+
+    With more than one worker the files are decompressed and parsed in a
+    process pool, only the small per-sample vectors are sent back. Loading
+    serially, prefetch threads can instead read and decompress the next
+    files while the current one is parsed, see usefulgnom.serialize.prefetch.
+
+    Args:
+        loader (Callable): Picklable function loading one coverage file,
+            e.g. a functools.partial of load_convert_bnc.
+        coverage_files (list[str]): Paths to the coverage files.
+        n_workers (int): Number of processes to use, 1 loads serially.
+        metrics (Metrics): Optional sink of the timing and reads of each sample.
+        prefetch_threads (int): Number of threads prefetching the files when
+            loading serially, 0 disables prefetching.
+        sample_files (Callable): Files the loader reads for a coverage file,
+            to prefetch them all; default is the coverage file itself.
+
+    Returns:
+        list: Loader results, e.g. coverage vectors, in the order of
+            `coverage_files`.
+    """
+    if metrics is not None:
+        measured = load_samples(
+            MeasuredLoader(loader),
+            coverage_files,
+            n_workers,
+            prefetch_threads=prefetch_threads,
+            sample_files=sample_files,
+        )
+        metrics.add_samples([record for _, record in measured])
+        return [result for result, _ in measured]
+
+    if n_workers <= 1 or len(coverage_files) <= 1:
+        paths: Iterable[str] = coverage_files
+        if prefetch_threads > 0:
+            paths = prefetch(
+                coverage_files, prefetch_threads, sample_files=sample_files
+            )
+        return [loader(coverage_file) for coverage_file in paths]
+
+    n_workers = min(n_workers, len(coverage_files))
+    # a few chunks per worker to balance uneven file sizes
+    chunksize = max(1, len(coverage_files) // (n_workers * 4))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        # map returns results in submission order, as the serial path
+        return list(executor.map(loader, coverage_files, chunksize=chunksize))
+
+
+def prefetched_files(
+    coverage_file: str,
+    sample_files: Optional[Callable[[str], list[str]]] = None,
+    cache: Optional[CoverageCache] = None,
+    indexed: bool = True,
+) -> list[str]:
+    """
+    Files of a sample its loader reads in full, the ones worth prefetching.
+
+    Files in the decoded cache are memory-mapped, and without a cache the
+    BGZF files with a position index only have a few blocks inflated; both
+    would be read and decompressed in full for nothing if prefetched.
+
+    Args:
+        coverage_file (str): Path to the coverage file of the sample.
+        sample_files (Callable): Files the loader reads for a coverage file,
+            default is the coverage file itself.
+        cache (CoverageCache): Cache of decoded coverage files of the loader.
+        indexed (bool): Whether the loader reads BGZF files by their position
+            index, see usefulgnom.serialize.bgzf.
+
+    Returns:
+        list[str]: The files to prefetch.
+    """
+    files = sample_files(coverage_file) if sample_files else [coverage_file]
+    if cache is not None:
+        return [file for file in files if not cache.contains(file)]
+    if indexed:
+        return [file for file in files if not os.path.exists(index_path(file))]
+    return files
+
+
+def is_multi_location(location: Union[str, list[str]]) -> bool:
+    """
+    Whether a location argument selects several locations.
+
+    Args:
+        location (str | list[str]): A location, a list of locations or "all".
+
+    Returns:
+        bool: False for a single location name.
+    """
+    return not isinstance(location, str) or location == ALL_LOCATIONS
+
+
+def select_locations(
+    timeline_file_dir: str,
+    startdate: datetime,
+    enddate: datetime,
+    location: Union[str, list[str]],
+    cache_dir: Optional[str] = None,
+) -> dict[str, pd.DataFrame]:
+    """
+    Select the samples of one or more locations from a single timeline read.
+
+    Args:
+        timeline_file_dir (str): Path to the timeline file.
+        startdate (datetime): Start date of the time period.
+        enddate (datetime): End date of the time period.
+        location (str | list[str]): A location, a list of locations, or "all"
+            for every location with samples in the time period.
+        cache_dir (str): Optional directory of the parsed timeline.
+
+    Returns:
+        dict[str, pd.DataFrame]: Selected samples of each location, see
+            extract_sample_ID, with their batch if the timeline lists it.
+    """
+    if not is_multi_location(location):
+        locations = [location]
+    elif location == ALL_LOCATIONS:
+        locations = list(load_timeline_index(timeline_file_dir, cache_dir).locations)
+    else:
+        locations = list(location)
+
+    index = load_timeline_index(timeline_file_dir, cache_dir)
+    selected = {}
+    for name in locations:
+        sample_IDs = index.query(startdate, enddate, name, batch=True)
+        if location == ALL_LOCATIONS and sample_IDs.empty:
+            continue
+        selected[name] = sample_IDs
+    return selected
+
+
+def location_output(
+    output_file: Optional[str], location: str, multi_location: bool
+) -> Optional[str]:
+    """
+    Path of the output of one location.
+
+    Args:
+        output_file (str): Output path, with a "{location}" placeholder if
+            several locations are computed.
+        location (str): The location.
+        multi_location (bool): Whether several locations are computed.
+
+    Returns:
+        str: The path with the placeholder replaced, `output_file` as is for
+            a single location.
+
+    Raises:
+        ValueError: If several locations are computed and the path has no
+            "{location}" placeholder.
+    """
+    if output_file is None or not multi_location:
+        return output_file
+    if "{location}" not in output_file:
+        raise ValueError(
+            f"Output {output_file} of several locations needs a {{location}} "
+            "placeholder."
+        )
+    return output_file.replace("{location}", location)
+
+
+def sample_name(coverage_file: str) -> str:
+    """
+    Extract the sample name from the path of a V-pipe coverage file.
+
+    Args:
+        coverage_file (str): Path like results/<sample>/<batch>/alignments/<file>.
+
+    Returns:
+        str: The sample name.
+    """
+    return coverage_file.split("/")[-4]
+
+
+def select_sample_files(
+    coverage_files: list[str], sample_IDs: pd.DataFrame
+) -> list[str]:
+    """
+    Select the coverage files of the given samples.
+
+    Args:
+        coverage_files (list[str]): Paths to the coverage files.
+        sample_IDs (pd.DataFrame): Selected samples, see extract_sample_ID.
+
+    Returns:
+        list[str]: The coverage files of the selected samples, in input order.
+    """
+    samples = set(sample_IDs.loc[:, "sample"].values)
+    return [
+        coverage_file
+        for coverage_file in coverage_files
+        if sample_name(coverage_file) in samples
+    ]
+
+
+def split_results_pattern(pattern: str) -> Optional[tuple[str, str]]:
+    """
+    Split a path pattern of the form <root>/*/*/<file> of V-pipe's results.
+
+    Args:
+        pattern (str): Path pattern, e.g. 'results/*/*/alignments/basecnt.tsv.gz'.
+
+    Returns:
+        tuple[str, str]: The root and the file below the batch directory, e.g.
+            ('results', 'alignments/basecnt.tsv.gz'), None if the pattern has
+            other wildcards.
+    """
+    parts = pattern.split("/")
+    for i in range(len(parts) - 2):
+        if parts[i] == parts[i + 1] == "*":
+            root, rest = "/".join(parts[:i]), "/".join(parts[i + 2 :])
+            if rest and not glob.has_magic(root) and not glob.has_magic(rest):
+                return root, rest
+            return None
+    return None
+
+
+def resolve_sample_files(pattern: str, sample_IDs: pd.DataFrame) -> list[str]:
+    """
+    Build the paths of the coverage files of the samples from their batch.
+
+    Only the paths of the selected samples are checked for existence, the
+    results tree is never listed.
+
+    Args:
+        pattern (str): Path pattern of the form <root>/*/*/<file>.
+        sample_IDs (pd.DataFrame): Selected samples with their batch, see
+            select_locations.
+
+    Returns:
+        list[str]: The existing coverage files, in timeline order.
+
+    Raises:
+        ValueError: If the pattern is not of the form <root>/*/*/<file>.
+    """
+    split = split_results_pattern(pattern)
+    if split is None:
+        raise ValueError(f"Cannot resolve {pattern} without listing directories.")
+    root, rest = split
+    pairs = dict.fromkeys(zip(sample_IDs["sample"], sample_IDs["batch"]))
+    paths = (f"{root}/{sample}/{batch}/{rest}" for sample, batch in pairs)
+    return [path for path in paths if os.path.exists(path)]
+
+
+def locate_sample_files(
+    pattern: str, samples_by_location: dict[str, pd.DataFrame]
+) -> dict[str, list[str]]:
+    """
+    Find the coverage files of the selected samples of each location.
+
+    Patterns of the form <root>/*/*/<file> are resolved from the sample and
+    batch of the timeline, see resolve_sample_files; so sample directories
+    of batches missing from the timeline are not used. Other patterns, or
+    timelines without batch column, are globbed once for all locations.
+
+    Args:
+        pattern (str): Path pattern to the coverage files, e.g.
+            '.../results/*/*/alignments/basecnt.tsv.gz'
+        samples_by_location (dict[str, pd.DataFrame]): Selected samples of
+            each location, see select_locations.
+
+    Returns:
+        dict[str, list[str]]: The coverage files of each location.
+    """
+    resolvable = split_results_pattern(pattern) is not None and all(
+        "batch" in sample_IDs for sample_IDs in samples_by_location.values()
+    )
+    if resolvable:
+        return {
+            location: resolve_sample_files(pattern, sample_IDs)
+            for location, sample_IDs in samples_by_location.items()
+        }
+    coverage_files = glob.glob(pattern, recursive=True)
+    return {
+        location: select_sample_files(coverage_files, sample_IDs)
+        for location, sample_IDs in samples_by_location.items()
+    }
+
+
+def coverage_matrix(
+    coverage_files: list[str],
+    coverages: list[np.ndarray],
+    sample_IDs: pd.DataFrame,
+    index: pd.Series,
+) -> pd.DataFrame:
+    """
+    Assemble per-sample coverage vectors into a mutation x date matrix.
+
+    Args:
+        coverage_files (list[str]): Paths to the coverage files of the samples.
+        coverages (list[np.ndarray]): Coverage vector of each file.
+        sample_IDs (pd.DataFrame): Selected samples, see extract_sample_ID.
+        index (pd.Series): Mutations, the rows of the matrix.
+
+    Returns:
+        pd.DataFrame: Matrix with one column per sample date, sorted by date.
+    """
+    # record columns for df (one sample = one column of different mutations)
+    columns = {}
+    for coverage_file, coverage in zip(coverage_files, coverages):
+        name = sample_name(coverage_file)
+        date = sample_IDs.loc[sample_IDs.loc[:, "sample"] == name, "date"]
+        for sample_date in date:
+            columns[sample_date] = coverage
+
+    matrix = pd.DataFrame(columns, index=range(len(index))).sort_index(axis=1)
+    return matrix.set_index(index)
+
+
+def load_as_tuple(loader: Callable[[str], T], coverage_file: str) -> tuple[T]:
+    """Wrap the result of a single-matrix loader, see update_coverage_matrices."""
+    return (loader(coverage_file),)
+
+
+def previous_columns(
+    manifest: pd.DataFrame, previous_manifests: list[pd.DataFrame]
+) -> dict[str, pd.Timestamp]:
+    """
+    Find the column of the previous matrices each unchanged file can reuse.
+
+    Samples sharing a date share a column, which holds the coverage of the
+    last of them, as assembled by coverage_matrix. So a file can only reuse
+    a column its own sample filled, whatever other samples share the date.
+
+    Args:
+        manifest (pd.DataFrame): Manifest of the current run, see build_manifest.
+        previous_manifests (list[pd.DataFrame]): Manifests of the previous
+            matrices.
+
+    Returns:
+        dict[str, pd.Timestamp]: Reusable column of each file whose (path,
+            mtime, size) and dates are unchanged in every previous manifest.
+    """
+    identity = ["sample", "path", "mtime_ns", "size", "date"]
+    reusable = None
+    for previous_manifest in previous_manifests:
+        # a file is unchanged if all its (file, date) records are still there
+        known = manifest.merge(
+            previous_manifest[identity].drop_duplicates(),
+            on=identity,
+            how="left",
+            indicator=True,
+        )
+        unchanged = known.groupby("path")["_merge"].transform(
+            lambda x: (x == "both").all()
+        )
+        # the sample and file whose coverage fills each date column
+        owners = previous_manifest.drop_duplicates("date", keep="last")
+        owned = manifest.merge(
+            owners[["sample", "path", "date"]], how="left", indicator=True
+        )
+        owned = owned["_merge"] == "both"
+        records = set(
+            zip(
+                manifest.loc[unchanged & owned, "path"],
+                manifest.loc[unchanged & owned, "date"],
+            )
+        )
+        reusable = records if reusable is None else reusable & records
+
+    columns: dict[str, pd.Timestamp] = {}
+    for path, date in sorted(reusable or ()):
+        columns.setdefault(path, date)
+    return columns
+
+
+def update_coverage_matrices(
+    make_loader: Callable[[list[int]], Callable[[str], tuple[np.ndarray, ...]]],
+    selected_files: list[str],
+    sample_IDs: pd.DataFrame,
+    index: pd.Series,
+    previous_outputs: list[Optional[str]],
+    n_workers: int = 1,
+    metrics: Optional[Metrics] = None,
+    prefetch_threads: int = 0,
+    sample_files: Optional[Callable[[str], list[str]]] = None,
+) -> tuple[list[pd.DataFrame], pd.DataFrame]:
+    """
+    Compute coverage matrices, reusing what is still valid of previous outputs.
+
+    Samples whose file (path, mtime, size) and dates are unchanged since the
+    previous outputs keep the column their sample filled, only mutations
+    missing from a previous matrix are loaded for them. New or changed
+    samples are loaded in full.
+
+    Args:
+        make_loader (Callable): Returns a picklable loader extracting the
+            coverages of the given rows of `index` from a coverage file, one
+            vector per matrix.
+        selected_files (list[str]): Coverage files of the selected samples.
+        sample_IDs (pd.DataFrame): Selected samples, see extract_sample_ID.
+        index (pd.Series): Mutations, the rows of the matrices.
+        previous_outputs (list[str]): Earlier output of each matrix, with
+            its manifest next to it, in any format of
+            usefulgnom.serialize.matrix; None, or a missing matrix or
+            manifest, loads every sample in full.
+        n_workers (int): Number of processes to load the samples with.
+        metrics (Metrics): Optional sink of the timing and reads of each sample.
+        prefetch_threads (int): Number of threads prefetching the files when
+            loading serially, see load_samples.
+        sample_files (Callable): Files the loader reads for a coverage file,
+            see load_samples.
+
+    Returns:
+        tuple[list[pd.DataFrame], pd.DataFrame]: The coverage matrices and
+            their manifest.
+    """
+    mutations = [str(mutation) for mutation in index]
+    manifest = build_manifest(selected_files, sample_IDs)
+    all_rows = list(range(len(mutations)))
+
+    previous_manifests = [
+        read_manifest(previous_output)
+        for previous_output in previous_outputs
+        if previous_output is not None and os.path.exists(previous_output)
+    ]
+    if len(previous_manifests) < len(previous_outputs) or any(
+        previous_manifest is None for previous_manifest in previous_manifests
+    ):
+        coverages = load_samples(
+            make_loader(all_rows),
+            selected_files,
+            n_workers,
+            metrics,
+            prefetch_threads,
+            sample_files,
+        )
+        matrices = [
+            coverage_matrix(selected_files, list(matrix), sample_IDs, index)
+            for matrix in zip(*coverages)
+        ] or [coverage_matrix([], [], sample_IDs, index) for _ in previous_outputs]
+        return matrices, manifest
+
+    previous = [read_matrix(previous_output) for previous_output in previous_outputs]
+    # row of each mutation in the previous matrices, -1 if it was not computed
+    previous_rows = []
+    for matrix in previous:
+        if matrix.index.is_unique:
+            previous_rows.append(matrix.index.get_indexer(mutations))
+        else:
+            previous_rows.append(np.full(len(mutations), -1))
+    missing_rows = [row for row in all_rows if min(r[row] for r in previous_rows) < 0]
+    reused_rows = [row for row in all_rows if min(r[row] for r in previous_rows) >= 0]
+
+    columns = previous_columns(manifest, previous_manifests)
+    reusable = {
+        path: date
+        for path, date in columns.items()
+        if all(date in matrix.columns for matrix in previous)
+    }
+    full_files = [path for path in selected_files if path not in reusable]
+    partial_files = [path for path in selected_files if path in reusable]
+    full_coverages = load_samples(
+        make_loader(all_rows),
+        full_files,
+        n_workers,
+        metrics,
+        prefetch_threads,
+        sample_files,
+    )
+    loaded = dict(zip(full_files, full_coverages))
+    if missing_rows:
+        partial_coverages = load_samples(
+            make_loader(missing_rows),
+            partial_files,
+            n_workers,
+            metrics,
+            prefetch_threads,
+            sample_files,
+        )
+    else:
+        partial_coverages = [
+            tuple(np.empty(0, dtype=np.uint32) for _ in previous)
+        ] * len(partial_files)
+
+    for path, missing_coverages in zip(partial_files, partial_coverages):
+        sample_coverages = []
+        for matrix, rows, missing_coverage in zip(
+            previous, previous_rows, missing_coverages
+        ):
+            coverage = np.zeros(len(mutations), dtype=np.uint32)
+            previous_column = matrix[reusable[path]].to_numpy()
+            coverage[reused_rows] = previous_column[rows[reused_rows]]
+            coverage[missing_rows] = missing_coverage
+            sample_coverages.append(coverage)
+        loaded[path] = tuple(sample_coverages)
+
+    matrices = [
+        coverage_matrix(
+            selected_files,
+            [loaded[path][i] for path in selected_files],
+            sample_IDs,
+            index,
+        )
+        for i in range(len(previous))
+    ]
+    return matrices, manifest
+
+
+def update_coverage_matrix(
+    make_loader: Callable[[list[int]], Callable[[str], np.ndarray]],
+    selected_files: list[str],
+    sample_IDs: pd.DataFrame,
+    index: pd.Series,
+    previous_output: Optional[str] = None,
+    n_workers: int = 1,
+    metrics: Optional[Metrics] = None,
+    prefetch_threads: int = 0,
+    sample_files: Optional[Callable[[str], list[str]]] = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Compute a coverage matrix, reusing what is still valid of a previous output.
+
+    See update_coverage_matrices, of which this is the single-matrix case.
+
+    Args:
+        make_loader (Callable): Returns a picklable loader extracting the
+            coverages of the given rows of `index` from a coverage file.
+        selected_files (list[str]): Coverage files of the selected samples.
+        sample_IDs (pd.DataFrame): Selected samples, see extract_sample_ID.
+        index (pd.Series): Mutations, the rows of the matrix.
+        previous_output (str): Optional earlier output matrix of the same
+            analysis, with its manifest next to it, in any format of
+            usefulgnom.serialize.matrix.
+        n_workers (int): Number of processes to load the samples with.
+        metrics (Metrics): Optional sink of the timing and reads of each sample.
+        prefetch_threads (int): Number of threads prefetching the files when
+            loading serially, see load_samples.
+        sample_files (Callable): Files to prefetch for a coverage file, see
+            load_samples.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: The coverage matrix and its manifest.
+    """
+    matrices, manifest = update_coverage_matrices(
+        lambda rows: partial(load_as_tuple, make_loader(rows)),
+        selected_files,
+        sample_IDs,
+        index,
+        [previous_output],
+        n_workers,
+        metrics,
+        prefetch_threads,
+        sample_files,
+    )
+    return matrices[0], manifest
@@ -0,0 +1,562 @@
+"""Implements genome-wide depth summaries over many samples, out of core.
+
+The coverage.tsv.gz files of the selected samples are read one at a time
+and folded into running statistics of the depth of every position: count,
+mean and variance (Welford), minimum, maximum, the number of samples below a
+low depth and a histogram sketch of the depths. The sketch has log-spaced
+bins, so its quantiles are within a relative accuracy of the exact ones
+(as DDSketch), and it takes a fixed memory of positions x bins counts,
+e.g. about 17 MB for SARS-CoV-2 at 5 %, whatever the number of samples.
+Summaries of disjoint sets of samples merge exactly, so they can be computed
+by several workers, or by several jobs that store them with `save`.
+
+e.g. of the summary table, one row per position:
+
+    pos,mean,std,min,max,q05,q25,q50,q75,q95,below_20x
+    1,0.8,1.3,0,9,0.0,0.0,0.0,0.97,2.97,1.0
+    ...
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from usefulgnom.analyze.coverage import (
+    is_multi_location,
+    locate_sample_files,
+    location_output,
+    prefetched_files,
+    select_locations,
+)
+from usefulgnom.serialize.cache import DEFAULT_MAX_BYTES, CoverageCache
+from usefulgnom.serialize.matrix import write_matrix
+from usefulgnom.serialize.metrics import MeasuredLoader, Metrics
+from usefulgnom.serialize.parsers import DEFAULT_PARSER
+from usefulgnom.serialize.prefetch import prefetch
+from usefulgnom.serialize.total_coverage import read_total_array
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# relative accuracy of the quantiles of the sketch
+DEFAULT_RELATIVE_ACCURACY = 0.05
+
+# depths above are counted in the last bin of the sketch
+DEFAULT_MAX_DEPTH = 2**20
+
+
+@dataclass
+class DepthSummary:
+    """
+    Mergeable running statistics of the depth of every position.
+
+    Create empty summaries with `empty`, fold samples in with `add` and
+    combine summaries of disjoint samples with `merge`.
+
+    Attributes:
+        n_samples: Number of samples added.
+        mean: float64 mean depth of each position.
+        m2: float64 sum of the squared deviations from the mean.
+        minimum: uint32 minimum depth of each position.
+        maximum: uint32 maximum depth of each position.
+        below: uint32 number of samples below `low_depth` at each position.
+        bins: uint32 sketch of shape (positions, bins), see `bin_index`.
+        relative_accuracy: Relative accuracy of the quantiles.
+        max_depth: Largest depth with its own bin.
+        low_depth: Depth threshold of `below`.
+    """
+
+    n_samples: int
+    mean: np.ndarray
+    m2: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+    below: np.ndarray
+    bins: np.ndarray
+    relative_accuracy: float
+    max_depth: int
+    low_depth: int
+
+    @classmethod
+    def empty(
+        cls,
+        genome_length: int,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        low_depth: int = 20,
+    ) -> "DepthSummary":
+        """
+        Summary of no samples.
+
+        Args:
+            genome_length (int): Number of positions.
+            relative_accuracy (float): Relative accuracy of the quantiles,
+                in (0, 1); smaller values take more bins.
+            max_depth (int): Largest depth with its own bin.
+            low_depth (int): Depth threshold of the fraction of samples below.
+
+        Returns:
+            DepthSummary: The empty summary.
+
+        Raises:
+            ValueError: If the relative accuracy is not in (0, 1).
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(
+                f"Relative accuracy must be in (0, 1), got {relative_accuracy}."
+            )
+        summary = cls(
+            n_samples=0,
+            mean=np.zeros(genome_length),
+            m2=np.zeros(genome_length),
+            minimum=np.full(genome_length, np.iinfo(np.uint32).max, dtype=np.uint32),
+            maximum=np.zeros(genome_length, dtype=np.uint32),
+            below=np.zeros(genome_length, dtype=np.uint32),
+            bins=np.zeros((genome_length, 0), dtype=np.uint32),
+            relative_accuracy=relative_accuracy,
+            max_depth=max_depth,
+            low_depth=low_depth,
+        )
+        n_bins = int(summary.bin_index(np.array([max_depth]))[0]) + 1
+        summary.bins = np.zeros((genome_length, n_bins), dtype=np.uint32)
+        return summary
+
+    @property
+    def gamma(self) -> float:
+        """Ratio of the bounds of a bin."""
+        return (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+
+    @property
+    def genome_length(self) -> int:
+        """Number of positions."""
+        return len(self.mean)
+
+    def bin_index(self, depth: np.ndarray) -> np.ndarray:
+        """
+        Bin of each depth: 0 for no reads, k >= 1 for (gamma^(k-2), gamma^(k-1)].
+
+        Args:
+            depth (np.ndarray): Depths, at least 0.
+
+        Returns:
+            np.ndarray: intp bin of each depth, depths above `max_depth` fall
+                in the bin of `max_depth`.
+        """
+        depth = np.minimum(depth, self.max_depth).astype(np.float64)
+        index = np.zeros(depth.shape, dtype=np.intp)
+        covered = depth > 0
+        index[covered] = 1 + np.ceil(
+            np.log(depth[covered]) / np.log(self.gamma) - 1e-9
+        ).astype(np.intp)
+        return index
+
+    def bin_values(self) -> np.ndarray:
+        """Estimate of the depths in each bin, within the relative accuracy."""
+        k = np.arange(self.bins.shape[1])
+        values = 2 * self.gamma ** (k - 1.0) / (self.gamma + 1)
+        values[0] = 0.0
+        return values
+
+    def add(self, depth: np.ndarray) -> None:
+        """
+        Fold the depths of one sample into the summary.
+
+        Args:
+            depth (np.ndarray): Depth of each position, entry i for position
+                i + 1; shorter arrays are padded with depth 0.
+
+        Raises:
+            ValueError: If the sample has more positions than the summary.
+        """
+        if len(depth) > self.genome_length:
+            raise ValueError(
+                f"Sample of {len(depth)} positions, expected at most "
+                f"{self.genome_length}."
+            )
+        if len(depth) < self.genome_length:
+            depth = np.pad(depth, (0, self.genome_length - len(depth)))
+        depth = np.asarray(depth, dtype=np.uint32)
+
+        self.n_samples += 1
+        delta = depth - self.mean
+        self.mean += delta / self.n_samples
+        self.m2 += delta * (depth - self.mean)
+        np.minimum(self.minimum, depth, out=self.minimum)
+        np.maximum(self.maximum, depth, out=self.maximum)
+        self.below += depth < self.low_depth
+        self.bins[np.arange(self.genome_length), self.bin_index(depth)] += 1
+
+    def merge(self, other: "DepthSummary") -> None:
+        """
+        Fold a summary of other samples into this one.
+
+        Args:
+            other (DepthSummary): Summary of a disjoint set of samples.
+
+        Raises:
+            ValueError: If the summaries differ in positions or parameters.
+        """
+        parameters = ("genome_length", "relative_accuracy", "max_depth", "low_depth")
+        for name in parameters:
+            if getattr(self, name) != getattr(other, name):
+                raise ValueError(
+                    f"Cannot merge summaries of {name} {getattr(self, name)} "
+                    f"and {getattr(other, name)}."
+                )
+        if other.n_samples == 0:
+            return
+        n_samples = self.n_samples + other.n_samples
+        # parallel variance of Chan et al.
+        delta = other.mean - self.mean
+        self.mean += delta * (other.n_samples / n_samples)
+        self.m2 += other.m2 + delta**2 * (self.n_samples * other.n_samples / n_samples)
+        self.n_samples = n_samples
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.below += other.below
+        self.bins += other.bins
+
+    def quantiles(self, quantiles: Iterable[float] = DEFAULT_QUANTILES) -> np.ndarray:
+        """
+        Estimate quantiles of the depth of every position from the sketch.
+
+        The estimate of quantile q is within the relative accuracy of the
+        depth of rank floor(q * (n_samples - 1)), i.e. numpy's "lower" method.
+
+        Args:
+            quantiles (Iterable[float]): Quantiles in [0, 1].
+
+        Returns:
+            np.ndarray: float64 array of shape (positions, quantiles), NaN
+                without samples.
+        """
+        quantiles = list(quantiles)
+        estimates = np.full((self.genome_length, len(quantiles)), np.nan)
+        if self.n_samples == 0:
+            return estimates
+        cumulative = np.cumsum(self.bins, axis=1, dtype=np.uint32)
+        values = self.bin_values()
+        for i, q in enumerate(quantiles):
+            rank = np.floor(q * (self.n_samples - 1))
+            estimates[:, i] = values[np.argmax(cumulative > rank, axis=1)]
+        return estimates
+
+    def to_frame(
+        self, quantiles: Iterable[float] = DEFAULT_QUANTILES, decimals: int = 2
+    ) -> pd.DataFrame:
+        """
+        Summary table of the positions.
+
+        Args:
+            quantiles (Iterable[float]): Quantiles to report, e.g. 0.05 as q05.
+            decimals (int): Number of decimals of the mean, std and quantiles.
+
+        Returns:
+            pd.DataFrame: One row per position, indexed by pos from 1, with
+                the mean, sample standard deviation, min, max, quantiles and
+                the fraction of samples below `low_depth` (below_<low_depth>x);
+                NaN without samples.
+        """
+        quantiles = list(quantiles)
+        n = self.n_samples
+        std = (
+            np.sqrt(self.m2 / (n - 1)) if n > 1 else np.full(self.genome_length, np.nan)
+        )
+        columns: dict[str, np.ndarray] = {
+            "mean": self.mean.round(decimals) if n else self.mean * np.nan,
+            "std": std.round(decimals),
+            "min": self.minimum if n else np.full(self.genome_length, np.nan),
+            "max": self.maximum if n else np.full(self.genome_length, np.nan),
+        }
+        for q, estimates in zip(quantiles, self.quantiles(quantiles).T):
+            columns[quantile_label(q)] = estimates.round(decimals)
+        columns[f"below_{self.low_depth}x"] = (
+            (self.below / n).round(4) if n else np.full(self.genome_length, np.nan)
+        )
+        return pd.DataFrame(
+            columns, index=pd.RangeIndex(1, self.genome_length + 1, name="pos")
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Write the summary as .npz, atomically, to merge it later.
+
+        Args:
+            path (str): Path to the summary file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez_compressed(
+                    file,
+                    n_samples=self.n_samples,
+                    mean=self.mean,
+                    m2=self.m2,
+                    minimum=self.minimum,
+                    maximum=self.maximum,
+                    below=self.below,
+                    bins=self.bins,
+                    relative_accuracy=self.relative_accuracy,
+                    max_depth=self.max_depth,
+                    low_depth=self.low_depth,
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "DepthSummary":
+        """
+        Read a summary written by `save`.
+
+        Args:
+            path (str): Path to the summary file.
+
+        Returns:
+            DepthSummary: The summary.
+        """
+        with np.load(path) as stored:
+            return cls(
+                n_samples=int(stored["n_samples"]),
+                mean=stored["mean"],
+                m2=stored["m2"],
+                minimum=stored["minimum"],
+                maximum=stored["maximum"],
+                below=stored["below"],
+                bins=stored["bins"],
+                relative_accuracy=float(stored["relative_accuracy"]),
+                max_depth=int(stored["max_depth"]),
+                low_depth=int(stored["low_depth"]),
+            )
+
+
+def quantile_label(q: float) -> str:
+    """Column of a quantile, e.g. q05 for 0.05 and q99.9 for 0.999."""
+    return f"q{100 * q:02g}"
+
+
+def merge_depth_summaries(summary_files: list[str]) -> DepthSummary:
+    """
+    Merge summaries stored by DepthSummary.save.
+
+    Args:
+        summary_files (list[str]): Paths to summaries of disjoint samples.
+
+    Returns:
+        DepthSummary: The summary of all their samples.
+
+    Raises:
+        ValueError: If no file is given or the summaries do not match.
+    """
+    if not summary_files:
+        raise ValueError("No depth summaries to merge.")
+    summary = DepthSummary.load(summary_files[0])
+    for summary_file in summary_files[1:]:
+        summary.merge(DepthSummary.load(summary_file))
+    return summary
+
+
+def load_total_depth(
+    coverage_path: str,
+    cache: Optional[CoverageCache] = None,
+    parser: str = DEFAULT_PARSER,
+) -> np.ndarray:
+    """
+    Load the depth of every position of a coverage.tsv.gz file.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+        cache (CoverageCache): Optional cache of decoded coverage files.
+        parser (str): Parser backend, see usefulgnom.serialize.parsers.
+
+    Returns:
+        np.ndarray: uint32 depth, entry i for position i + 1.
+    """
+    if cache is not None:
+        return cache.load(
+            coverage_path, "total", partial(read_total_array, parser=parser)
+        )
+    return read_total_array(coverage_path, parser)
+
+
+def summarize_depths(
+    coverage_files: list[str],
+    summary: DepthSummary,
+    cache: Optional[CoverageCache] = None,
+    parser: str = DEFAULT_PARSER,
+    prefetch_threads: int = 0,
+    metrics: Optional[Metrics] = None,
+) -> DepthSummary:
+    """
+    Fold the coverage files into a summary, one sample in memory at a time.
+
+    Args:
+        coverage_files (list[str]): Paths to the coverage.tsv.gz files.
+        summary (DepthSummary): Summary to fold the samples into.
+        cache (CoverageCache): Optional cache of decoded coverage files.
+        parser (str): Parser backend, see usefulgnom.serialize.parsers.
+        prefetch_threads (int): Number of threads reading and decompressing
+            the next files while one is parsed, 0 disables prefetching.
+        metrics (Metrics): Optional sink of the timing and reads of each sample.
+
+    Returns:
+        DepthSummary: The summary, updated in place.
+    """
+    paths: Iterable[str] = coverage_files
+    if prefetch_threads > 0:
+        # the files in the cache are memory-mapped, not read
+        paths = prefetch(
+            coverage_files,
+            prefetch_threads,
+            sample_files=partial(prefetched_files, cache=cache, indexed=False),
+        )
+    loader = MeasuredLoader(partial(load_total_depth, cache=cache, parser=parser))
+    for coverage_path in paths:
+        depth, record = loader(coverage_path)
+        summary.add(depth)
+        if metrics is not None:
+            metrics.add_samples([record])
+    return summary
+
+
+def summarize_chunk(
+    coverage_files: list[str],
+    genome_length: int,
+    relative_accuracy: float,
+    max_depth: int,
+    low_depth: int,
+    cache: Optional[CoverageCache],
+    parser: str,
+) -> DepthSummary:
+    """Summary of a chunk of coverage files, in a worker process."""
+    summary = DepthSummary.empty(genome_length, relative_accuracy, max_depth, low_depth)
+    return summarize_depths(coverage_files, summary, cache, parser)
+
+
+def run_depth_summary(
+    coverage_tsv_fps: str,
+    timeline_file_dir: str,
+    output_file: str,
+    startdate: str = "2024-01-01",
+    enddate: str = "2024-07-03",
+    location: Union[str, list[str]] = "Zürich (ZH)",
+    genome_length: int = 29903,
+    quantiles: Iterable[float] = DEFAULT_QUANTILES,
+    low_depth: int = 20,
+    relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    summary_output: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    n_workers: int = 1,
+    metrics_output: Optional[str] = None,
+    parser: str = DEFAULT_PARSER,
+    prefetch_threads: int = 0,
+) -> Union[DepthSummary, dict[str, DepthSummary]]:
+    """
+    Summarize the depth of every position over the samples of a time period.
+
+    Each worker folds its share of the samples into a DepthSummary, one
+    sample at a time, so memory does not grow with the number of samples;
+    the summaries of the workers are then merged.
+
+    Args:
+        coverage_tsv_fps (str): Path pattern to the coverage.tsv.gz files.
+        timeline_file_dir (str): Path to the timeline file.
+        output_file (str): Path to the summary table, with a "{location}"
+            placeholder if several locations are computed; written as CSV,
+            Parquet or Arrow IPC after its suffix (.csv, .parquet, .arrow).
+        startdate (str): Start date of the time period, default is 2024-01-01.
+        enddate (str): End date of the time period, default is 2024-07-03.
+        location (str | list[str]): Location of the samples, default is
+            Zürich (ZH); a list of locations or "all" writes one table per
+            location.
+        genome_length (int): Number of positions, default is SARS-CoV-2.
+        quantiles (Iterable[float]): Quantiles of the table.
+        low_depth (int): Depth below which a sample counts as a dropout,
+            default is 20.
+        relative_accuracy (float): Relative accuracy of the quantiles.
+        max_depth (int): Largest depth with its own bin of the sketch.
+        summary_output (str): Optional path to also store the mergeable
+            summary as .npz, see merge_depth_summaries; with a "{location}"
+            placeholder if several locations are computed.
+        cache_dir (str): Optional directory of the decoded coverage cache
+            and of the parsed timeline.
+        cache_max_bytes (int): Size bound of the decoded coverage cache.
+        n_workers (int): Number of processes to load the samples with,
+            default is 1 (serial).
+        metrics_output (str): Optional path to write the per-stage durations,
+            I/O totals and slowest samples to, as JSON.
+        parser (str): Parser backend of the coverage files, one of
+            usefulgnom.serialize.parsers.PARSERS, default is pandas.
+        prefetch_threads (int): Number of threads reading and decompressing
+            the next coverage files while one is parsed, when loading
+            serially; default is 0 (no prefetching).
+
+    Returns:
+        DepthSummary: The summary, or a dict of the summary of each location
+            if several locations are computed.
+    """
+    metrics = Metrics()
+    with metrics.stage("timeline"):
+        samples_by_location = select_locations(
+            timeline_file_dir,
+            datetime.strptime(startdate, "%Y-%m-%d"),
+            datetime.strptime(enddate, "%Y-%m-%d"),
+            location,
+            cache_dir,
+        )
+    with metrics.stage("locate_files"):
+        files_by_location = locate_sample_files(coverage_tsv_fps, samples_by_location)
+    cache = CoverageCache(cache_dir, cache_max_bytes) if cache_dir else None
+    quantiles = list(quantiles)
+
+    multi_location = is_multi_location(location)
+    summaries = {}
+    for name, coverage_files in files_by_location.items():
+        summary = DepthSummary.empty(
+            genome_length, relative_accuracy, max_depth, low_depth
+        )
+        with metrics.stage("load_samples"):
+            if n_workers <= 1 or len(coverage_files) <= 1:
+                summarize_depths(
+                    coverage_files, summary, cache, parser, prefetch_threads, metrics
+                )
+            else:
+                n_chunks = min(n_workers, len(coverage_files))
+                chunks = [
+                    list(chunk) for chunk in np.array_split(coverage_files, n_chunks)
+                ]
+                summarize = partial(
+                    summarize_chunk,
+                    genome_length=genome_length,
+                    relative_accuracy=relative_accuracy,
+                    max_depth=max_depth,
+                    low_depth=low_depth,
+                    cache=cache,
+                    parser=parser,
+                )
+                with ProcessPoolExecutor(max_workers=n_chunks) as executor:
+                    for chunk_summary in executor.map(summarize, chunks):
+                        summary.merge(chunk_summary)
+        with metrics.stage("write"):
+            write_matrix(
+                summary.to_frame(quantiles),
+                location_output(output_file, name, multi_location),
+            )
+            if summary_output is not None:
+                summary.save(location_output(summary_output, name, multi_location))
+        summaries[name] = summary
+    if metrics_output is not None:
+        metrics.write(metrics_output)
+    if multi_location:
+        return summaries
+    return summaries[location]
@@ -0,0 +1,457 @@
+"""Implements the fused basecnt + total coverage and frequency analysis.
+
+Visits each selected sample directory once, reads its basecnt.tsv.gz and
+coverage.tsv.gz back to back and emits the basecnt coverage, total
+coverage and masked frequency matrices together.
+
+Credits:
+    - core code: @AugusteRi (arimaite@ethz.ch)
+    - implementation: @koehng (koehng@ethz.ch)
+"""
+
+from usefulgnom.serialize.basecnt_coverage import NUCLEOTIDES, load_basecnt_rows
+from usefulgnom.serialize.total_coverage import load_convert_total
+from usefulgnom.serialize.cache import CoverageCache, DEFAULT_MAX_BYTES
+from usefulgnom.serialize.manifest import build_manifest, write_manifest
+from usefulgnom.serialize.matrix import MatrixWriter, write_matrix
+from usefulgnom.serialize.metrics import Metrics
+from usefulgnom.serialize.parsers import DEFAULT_PARSER
+from usefulgnom.analyze.basecnt_coverage import extract_mutation_position_and_nt
+from usefulgnom.analyze.coverage import (
+    coverage_matrix,
+    is_multi_location,
+    load_samples,
+    locate_sample_files,
+    location_output,
+    prefetched_files,
+    select_locations,
+    update_coverage_matrices,
+)
+
+from datetime import datetime
+from functools import partial
+from typing import Iterator, Optional, Union
+import os
+
+import numpy as np
+import pandas as pd
+
+# mutations whose frequencies are computed at a time by the chunked engine
+DEFAULT_CHUNK_ROWS = 4096
+
+
+def total_coverage_file(basecnt_file: str) -> str:
+    """Path of the coverage.tsv.gz next to a basecnt.tsv.gz file."""
+    return os.path.join(os.path.dirname(basecnt_file), "coverage.tsv.gz")
+
+
+def sample_coverage_files(
+    basecnt_file: str, depth_from_basecnt: bool = False
+) -> list[str]:
+    """
+    Coverage files read by load_sample_coverages for one sample.
+
+    Args:
+        basecnt_file (str): Path to the basecnt.tsv.gz file of the sample.
+        depth_from_basecnt (bool): Whether the total coverage is derived from
+            the basecnt file.
+
+    Returns:
+        list[str]: The basecnt.tsv.gz, and coverage.tsv.gz if it is read.
+    """
+    if depth_from_basecnt:
+        return [basecnt_file]
+    return [basecnt_file, total_coverage_file(basecnt_file)]
+
+
+def load_sample_coverages(
+    basecnt_file: str,
+    pos_mut: list[tuple],
+    cache: Optional[CoverageCache] = None,
+    streaming: bool = False,
+    depth_from_basecnt: bool = False,
+    parser: str = DEFAULT_PARSER,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Load the basecnt and total coverage of the mutations of one sample.
+
+    Args:
+        basecnt_file (str): Path to the basecnt.tsv.gz file of the sample,
+            the coverage.tsv.gz is expected next to it.
+        pos_mut (list[tuple]): List of tuples containing position and new nucleotide.
+        cache (CoverageCache): Optional cache of decoded coverage files.
+        streaming (bool): Only decompress up to the largest position of interest.
+        depth_from_basecnt (bool): Derive the total coverage as the sum of the
+            per-base counts instead of reading coverage.tsv.gz.
+        parser (str): Parser backend of the coverage files.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: uint32 vectors of the basecnt and total
+            coverage, in the order of `pos_mut`.
+    """
+    positions = [position for position, _ in pos_mut]
+    nt_index = [NUCLEOTIDES.index(nt) for _, nt in pos_mut]
+
+    counts = load_basecnt_rows(basecnt_file, positions, cache, streaming, parser)
+    basecnt = counts[np.arange(len(pos_mut)), nt_index]
+    if depth_from_basecnt:
+        total = counts.sum(axis=1, dtype=np.uint32)
+    else:
+        coverage_file = total_coverage_file(basecnt_file)
+        total = load_convert_total(coverage_file, positions, cache, streaming, parser)
+    return basecnt, total
+
+
+def load_mutation_coverages(
+    basecnt_file: str,
+    rows: list[int],
+    pos_mut: list[tuple],
+    **loader_kwargs,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Load the coverages of the given rows of `pos_mut`, see load_sample_coverages."""
+    return load_sample_coverages(
+        basecnt_file, [pos_mut[row] for row in rows], **loader_kwargs
+    )
+
+
+def mutation_frequency(
+    basecnt: pd.DataFrame, totalcnt: pd.DataFrame, min_depth: int = 20
+) -> pd.DataFrame:
+    """
+    Compute the mutation frequencies from the basecnt and total coverage.
+
+    Args:
+        basecnt (pd.DataFrame): Matrix of the reads with the mutation.
+        totalcnt (pd.DataFrame): Matrix of the reads covering the position.
+        min_depth (int): Positions covered by fewer reads are masked (NaN),
+            default is 20.
+
+    Returns:
+        pd.DataFrame: Matrix of the mutation frequencies.
+    """
+    # If position is covered less than min_depth reads -> not enough information
+    totalcnt = totalcnt.astype(float).where(totalcnt >= min_depth)
+    return basecnt / totalcnt
+
+
+def masked_frequency(
+    basecnt: np.ndarray,
+    totalcnt: np.ndarray,
+    min_depth: int = 20,
+    dtype: type = np.float32,
+) -> np.ndarray:
+    """
+    Compute the mutation frequencies of integer count arrays.
+
+    Args:
+        basecnt (np.ndarray): Counts of the reads with the mutation.
+        totalcnt (np.ndarray): Counts of the reads covering the position,
+            same shape as `basecnt`.
+        min_depth (int): Positions covered by fewer reads are masked (NaN),
+            default is 20.
+        dtype (type): Float type of the frequencies, default is float32.
+
+    Returns:
+        np.ndarray: Frequencies, NaN where the depth is below `min_depth` or 0.
+    """
+    frequency = np.full(basecnt.shape, np.nan, dtype=dtype)
+    covered = (totalcnt >= min_depth) & (totalcnt > 0)
+    np.divide(basecnt, totalcnt, out=frequency, where=covered, casting="same_kind")
+    return frequency
+
+
+def iter_frequency_chunks(
+    basecnt: np.ndarray,
+    totalcnt: np.ndarray,
+    min_depth: int = 20,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    dtype: type = np.float32,
+) -> Iterator[tuple[slice, np.ndarray]]:
+    """
+    Compute the mutation frequencies a block of rows at a time.
+
+    Only one block of frequencies is held at a time, so genome-scale
+    mutation sets need no more memory than their count matrices.
+
+    Args:
+        basecnt (np.ndarray): Counts of the reads with the mutation, one row
+            per mutation and one column per sample.
+        totalcnt (np.ndarray): Counts of the reads covering the position.
+        min_depth (int): Positions covered by fewer reads are masked (NaN).
+        chunk_rows (int): Number of rows per block.
+        dtype (type): Float type of the frequencies, default is float32.
+
+    Yields:
+        tuple[slice, np.ndarray]: The rows of the block and their frequencies.
+
+    Raises:
+        ValueError: If `chunk_rows` is not positive.
+    """
+    if chunk_rows < 1:
+        raise ValueError(f"chunk_rows must be positive, got {chunk_rows}.")
+    for start in range(0, basecnt.shape[0], chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        yield rows, masked_frequency(basecnt[rows], totalcnt[rows], min_depth, dtype)
+
+
+def write_frequency_matrix(
+    basecnt: pd.DataFrame,
+    totalcnt: pd.DataFrame,
+    output_file: str,
+    min_depth: int = 20,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    dtype: type = np.float32,
+) -> None:
+    """
+    Compute the frequency matrix in blocks of rows and write it incrementally.
+
+    Writes the same matrix as `write_matrix(mutation_frequency(...), output_file)`,
+    without holding the whole float matrix in memory.
+
+    Args:
+        basecnt (pd.DataFrame): Matrix of the reads with the mutation.
+        totalcnt (pd.DataFrame): Matrix of the reads covering the position,
+            same index and columns as `basecnt`.
+        output_file (str): Path to the frequency matrix output file, as CSV,
+            Parquet or Arrow IPC after its suffix, see usefulgnom.serialize.matrix.
+        min_depth (int): Positions covered by fewer reads are masked (NaN).
+        chunk_rows (int): Number of mutations computed and written at a time.
+        dtype (type): Float type of the frequencies, default is float32.
+    """
+    with MatrixWriter(output_file) as writer:
+        # header only, so an empty matrix still gets its columns
+        writer.write(
+            pd.DataFrame(
+                np.empty((0, basecnt.shape[1]), dtype=dtype),
+                index=basecnt.index[:0],
+                columns=basecnt.columns,
+            )
+        )
+        for rows, frequency in iter_frequency_chunks(
+            basecnt.to_numpy(),
+            totalcnt.to_numpy(),
+            min_depth,
+            chunk_rows,
+            dtype,
+        ):
+            writer.write(
+                pd.DataFrame(
+                    frequency, index=basecnt.index[rows], columns=basecnt.columns
+                )
+            )
+
+
+def run_mutation_frequency(
+    basecnt_fps: str,
+    timeline_file_dir: str,
+    mutations_of_interest_dir: str,
+    basecnt_output_file: str,
+    total_output_file: str,
+    frequency_output_file: str,
+    startdate: str = "2024-01-01",
+    enddate: str = "2024-07-03",
+    location: Union[str, list[str]] = "Zürich (ZH)",
+    min_depth: int = 20,
+    depth_from_basecnt: bool = False,
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    n_workers: int = 1,
+    streaming: bool = False,
+    metrics_output: Optional[str] = None,
+    parser: str = DEFAULT_PARSER,
+    chunk_rows: Optional[int] = None,
+    prefetch_threads: int = 0,
+    previous_basecnt_output: Optional[str] = None,
+    previous_total_output: Optional[str] = None,
+) -> Union[
+    tuple[pd.DataFrame, pd.DataFrame, Optional[pd.DataFrame]],
+    dict[str, tuple[pd.DataFrame, pd.DataFrame, Optional[pd.DataFrame]]],
+]:
+    """
+    Compute the basecnt coverage, total coverage and frequency matrices in one pass.
+
+    Args:
+        basecnt_fps (str): Path pattern to the basecnt.tsv.gz files.
+        '...work-ww-lofreq-230405/results/*/*/alignments/basecnt.tsv.gz'
+        timeline_file_dir (str): Path to the timeline file.
+        mutations_of_interest_dir (str): Path to the mutations_of_interest file.
+        basecnt_output_file (str): Path to the basecnt coverage output file.
+        total_output_file (str): Path to the total coverage output file.
+        frequency_output_file (str): Path to the frequency matrix output file.
+            The output paths need a "{location}" placeholder if several
+            locations are computed; each is written as CSV, Parquet or Arrow
+            IPC after its suffix (.csv, .parquet, .arrow).
+        startdate (str): Start date of the time period, default is 2024-01-01.
+        enddate (str): End date of the time period, default is 2024-07-03.
+        location (str | list[str]): Location of the samples, default is
+            Zürich (ZH); a list of locations or "all" loads the samples of all
+            of them in one pass and writes the outputs of each location.
+        min_depth (int): Minimum total coverage for a frequency, default is 20.
+        depth_from_basecnt (bool): Derive the total coverage from the basecnt
+            files instead of reading the coverage.tsv.gz files.
+        cache_dir (str): Optional directory of the decoded coverage cache and
+            of the parsed timeline.
+        cache_max_bytes (int): Size bound of the decoded coverage cache.
+        n_workers (int): Number of processes to load the samples with,
+            default is 1 (serial).
+        streaming (bool): Only decompress each file up to the largest
+            position of interest, useful for targeted panels.
+        metrics_output (str): Optional path to write the per-stage durations,
+            I/O totals and slowest samples to, as JSON.
+        parser (str): Parser backend of the coverage files, one of
+            usefulgnom.serialize.parsers.PARSERS, default is pandas.
+        chunk_rows (int): Optional number of mutations to compute the
+            frequencies of at a time, in float32, writing them as they are
+            computed; for genome-scale mutation sets. The frequency matrix
+            is then not returned.
+        prefetch_threads (int): Number of threads reading and decompressing
+            the next coverage files while one is parsed, when loading
+            serially; default is 0 (no prefetching).
+        previous_basecnt_output (str): Optional earlier basecnt coverage
+            output of this analysis, e.g. of the previous week; together with
+            `previous_total_output`, only samples that are new or changed
+            since, and mutations missing from them, are loaded. With a
+            "{location}" placeholder if several locations are computed.
+        previous_total_output (str): Optional earlier total coverage output,
+            see `previous_basecnt_output`.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame, Optional[pd.DataFrame]]: The basecnt
+            coverage, total coverage and frequency matrices; the frequency
+            matrix is None if `chunk_rows` is given. For several locations,
+            a dict of these per location.
+    """
+    metrics = Metrics()
+    # get samples_IDs from the specified location, time and sequencing protocol
+    startdatetime = datetime.strptime(startdate, "%Y-%m-%d")
+    enddatetime = datetime.strptime(enddate, "%Y-%m-%d")
+    with metrics.stage("timeline"):
+        samples_by_location = select_locations(
+            timeline_file_dir, startdatetime, enddatetime, location, cache_dir
+        )
+    # the basecnt.tsv.gz files of the selected samples, built from their sample
+    # and batch directory names instead of listing the results tree
+    with metrics.stage("locate_files"):
+        files_by_location = locate_sample_files(basecnt_fps, samples_by_location)
+    with metrics.stage("mutations"):
+        position_mutated_nt = extract_mutation_position_and_nt(
+            mutations_of_interest_dir
+        )
+    cache = CoverageCache(cache_dir, cache_max_bytes) if cache_dir else None
+
+    loader_kwargs = dict(
+        cache=cache,
+        streaming=streaming,
+        depth_from_basecnt=depth_from_basecnt,
+        parser=parser,
+    )
+    # the files to prefetch, not those the cache or a position index answers
+    sample_files = partial(
+        prefetched_files,
+        sample_files=partial(
+            sample_coverage_files, depth_from_basecnt=depth_from_basecnt
+        ),
+        cache=cache,
+    )
+    incremental = (
+        previous_basecnt_output is not None and previous_total_output is not None
+    )
+    sample_coverages = {}
+    if not incremental:
+        # one pool over the samples of all locations
+        selected_files = list(
+            dict.fromkeys(
+                path for files in files_by_location.values() for path in files
+            )
+        )
+        # read basecnt.tsv.gz and coverage.tsv.gz of each sample back to back
+        with metrics.stage("load_samples"):
+            sample_coverages = dict(
+                zip(
+                    selected_files,
+                    load_samples(
+                        partial(
+                            load_sample_coverages,
+                            pos_mut=position_mutated_nt,
+                            **loader_kwargs,
+                        ),
+                        selected_files,
+                        n_workers,
+                        metrics,
+                        prefetch_threads,
+                        sample_files,
+                    ),
+                )
+            )
+
+    def make_loader(rows: list[int]) -> partial:
+        """Loader of the coverages of the given mutations."""
+        return partial(
+            load_mutation_coverages,
+            rows=rows,
+            pos_mut=position_mutated_nt,
+            **loader_kwargs,
+        )
+
+    ind = pd.read_csv(mutations_of_interest_dir, usecols=["mut"])
+    multi_location = is_multi_location(location)
+    matrices = {}
+    for name, sample_IDs in samples_by_location.items():
+        files = files_by_location[name]
+        if incremental:
+            # load the new or changed samples of this location only
+            with metrics.stage("load_samples"):
+                (basecnt, totalcnt), manifest = update_coverage_matrices(
+                    make_loader,
+                    files,
+                    sample_IDs,
+                    ind["mut"],
+                    [
+                        location_output(previous_basecnt_output, name, multi_location),
+                        location_output(previous_total_output, name, multi_location),
+                    ],
+                    n_workers,
+                    metrics,
+                    prefetch_threads,
+                    sample_files,
+                )
+        with metrics.stage("assemble"):
+            if not incremental:
+                basecnt = coverage_matrix(
+                    files,
+                    [sample_coverages[path][0] for path in files],
+                    sample_IDs,
+                    ind["mut"],
+                )
+                totalcnt = coverage_matrix(
+                    files,
+                    [sample_coverages[path][1] for path in files],
+                    sample_IDs,
+                    ind["mut"],
+                )
+                manifest = build_manifest(files, sample_IDs)
+            frequency = None
+            if chunk_rows is None:
+                frequency = mutation_frequency(basecnt, totalcnt, min_depth)
+
+        frequency_file = location_output(frequency_output_file, name, multi_location)
+        basecnt_file = location_output(basecnt_output_file, name, multi_location)
+        total_file = location_output(total_output_file, name, multi_location)
+        # the coverage matrices, with the manifest of the samples next to them
+        with metrics.stage("write"):
+            write_matrix(basecnt, basecnt_file)
+            write_manifest(manifest, basecnt_file)
+            write_matrix(totalcnt, total_file)
+            write_manifest(manifest, total_file)
+            if frequency is not None:
+                write_matrix(frequency, frequency_file)
+            else:
+                write_frequency_matrix(
+                    basecnt, totalcnt, frequency_file, min_depth, chunk_rows
+                )
+        matrices[name] = (basecnt, totalcnt, frequency)
+    if metrics_output is not None:
+        metrics.write(metrics_output)
+    if multi_location:
+        return matrices
+    return basecnt, totalcnt, frequency
@@ -0,0 +1,131 @@
+"""Implements the rolling-window statistics of the mutation frequencies.
+
+For each window of the most recent weeks, the median, IQR, Q1 and Q3 of
+the frequency of every mutation over the samples of the window, e.g.:
+
+    mutation,time,statistic,value
+    C23039G,2weeks,Median,0.412
+    C23039G,2weeks,IQR,0.051
+    ...
+
+Credits:
+    - core code: @AugusteRi (arimaite@ethz.ch)
+    - implementation: @koehng (koehng@ethz.ch)
+"""
+
+from datetime import timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+STATISTICS = ["Median", "IQR", "Q1", "Q3"]
+
+DEFAULT_WINDOWS = (2, 6, 12, 24)
+
+
+def sorted_quantiles(values: np.ndarray, q: float) -> np.ndarray:
+    """
+    Linear quantile of each row of a row-wise sorted array, ignoring NaN.
+
+    Args:
+        values (np.ndarray): 2D array, each row sorted with NaN at its end.
+        q (float): Quantile in [0, 1].
+
+    Returns:
+        np.ndarray: The quantile of each row, NaN for rows without values.
+    """
+    counts = (~np.isnan(values)).sum(axis=1)
+    position = q * np.maximum(counts - 1, 0)
+    below = np.floor(position).astype(np.intp)
+    above = np.minimum(below + 1, np.maximum(counts - 1, 0))
+    a = np.take_along_axis(values, below[:, None], axis=1)[:, 0]
+    b = np.take_along_axis(values, above[:, None], axis=1)[:, 0]
+    t = position - below
+    # same interpolation as numpy's "linear" method
+    quantiles = np.where(t >= 0.5, b - (b - a) * (1 - t), a + (b - a) * t)
+    quantiles[counts == 0] = np.nan
+    return quantiles
+
+
+def window_statistics(values: np.ndarray) -> np.ndarray:
+    """
+    Median, IQR, Q1 and Q3 of each row of a frequency matrix, ignoring NaN.
+
+    Args:
+        values (np.ndarray): Frequencies of shape (mutations, samples).
+
+    Returns:
+        np.ndarray: Array of shape (mutations, 4) in the order of STATISTICS.
+    """
+    if values.shape[1] == 0:
+        return np.full((values.shape[0], len(STATISTICS)), np.nan)
+    ordered = np.sort(values, axis=1)
+    counts = (~np.isnan(ordered)).sum(axis=1)
+    # median as the mean of the two middle values, as pandas
+    middle = np.maximum(counts - 1, 0)
+    low = np.take_along_axis(ordered, (middle // 2)[:, None], axis=1)[:, 0]
+    high = np.take_along_axis(ordered, ((middle + 1) // 2)[:, None], axis=1)[:, 0]
+    median = np.where(counts > 0, (low + high) / 2, np.nan)
+    q1 = sorted_quantiles(ordered, 0.25)
+    q3 = sorted_quantiles(ordered, 0.75)
+    return np.column_stack([median, q3 - q1, q1, q3])
+
+
+def mutation_statistics(
+    frequency_matrix: pd.DataFrame,
+    windows: tuple[int, ...] = DEFAULT_WINDOWS,
+    decimals: Optional[int] = 3,
+) -> pd.DataFrame:
+    """
+    Compute the statistics of the mutation frequencies over recent windows.
+
+    A window of w weeks holds the samples dated at most w weeks before the
+    most recent sample. The columns are sorted by date once, each window is
+    a suffix of them and its statistics are computed for all mutations at once.
+
+    Args:
+        frequency_matrix (pd.DataFrame): Mutation frequencies with one row per
+            mutation and one column per sample date, see run_mutation_frequency.
+        windows (tuple[int, ...]): Window lengths in weeks, default is
+            2, 6, 12 and 24 weeks.
+        decimals (int): Number of decimals to round to, None to not round.
+
+    Returns:
+        pd.DataFrame: Tidy table of columns [mutation, time, statistic, value],
+            e.g. (C23039G, 2weeks, Median, 0.412), ordered by mutation, window
+            and statistic.
+    """
+    dates = pd.to_datetime(frequency_matrix.columns)
+    order = np.argsort(dates.to_numpy(), kind="stable")
+    dates = dates[order]
+    values = frequency_matrix.to_numpy(dtype=float)[:, order]
+
+    statistics = np.empty((len(frequency_matrix), len(windows), len(STATISTICS)))
+    if len(dates):
+        most_recent_date = dates[-1]
+        starts = dates.searchsorted(
+            [most_recent_date - timedelta(weeks=weeks) for weeks in windows],
+            side="left",
+        )
+        for i, start in enumerate(starts):
+            statistics[:, i] = window_statistics(values[:, start:])
+    else:
+        statistics.fill(np.nan)
+    if decimals is not None:
+        statistics = statistics.round(decimals)
+
+    n_mutations = len(frequency_matrix)
+    return pd.DataFrame(
+        {
+            "mutation": np.repeat(
+                frequency_matrix.index.to_numpy(), len(windows) * len(STATISTICS)
+            ),
+            "time": np.tile(
+                np.repeat([f"{weeks}weeks" for weeks in windows], len(STATISTICS)),
+                n_mutations,
+            ),
+            "statistic": np.tile(STATISTICS, n_mutations * len(windows)),
+            "value": statistics.ravel(),
+        }
+    )
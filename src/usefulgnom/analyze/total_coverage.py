@@ -6,12 +6,25 @@
 """
 
 from usefulgnom.serialize import load_convert_total
-from usefulgnom.serialize.coverage import extract_sample_ID
+from usefulgnom.serialize.cache import CoverageCache, DEFAULT_MAX_BYTES
+from usefulgnom.serialize.manifest import write_manifest
+from usefulgnom.serialize.matrix import write_matrix
+from usefulgnom.serialize.metrics import Metrics
+from usefulgnom.serialize.parsers import DEFAULT_PARSER
+from usefulgnom.analyze.coverage import (
+    is_multi_location,
+    locate_sample_files,
+    location_output,
+    prefetched_files,
+    select_locations,
+    update_coverage_matrix,
+)
 
 from datetime import datetime
 import pandas as pd
-import glob
 import re
+from functools import partial
+from typing import Optional, Union
 
 
 def extract_mutation_position(mutations_of_interest_fp: str) -> list[str]:
@@ -51,7 +64,15 @@ def run_total_coverage_depth(
     output_file: str,
     startdate: str = "2024-01-01",
     enddate: str = "2024-07-03",
-    location: str = "Zürich (ZH)",
+    location: Union[str, list[str]] = "Zürich (ZH)",
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    n_workers: int = 1,
+    streaming: bool = False,
+    previous_output: Optional[str] = None,
+    metrics_output: Optional[str] = None,
+    parser: str = DEFAULT_PARSER,
+    prefetch_threads: int = 0,
 ) -> None:
     """
     Extract the coverage of the positions of interest from the coverage files.
@@ -61,10 +82,32 @@ def run_total_coverage_depth(
             e.g.: cluster/project/pangolin/work-vp-test/variants/coverage.csv
         mutations_of_interest_fp (str): Path to the mutations of interest file.
         timeline_file_dir (str): Path to the timeline file.
-        output_file (str): Path to the output file.
+        output_file (str): Path to the output file, with a "{location}"
+            placeholder if several locations are computed; written as CSV,
+            Parquet or Arrow IPC after its suffix (.csv, .parquet, .arrow).
         startdate (str): Start date of the time period, default is 2024-01-01.
         enddate (str): End date of the time period, default is 2024-07-03.
-        location (str): Location of the samples, default is Zürich (ZH).
+        location (str | list[str]): Location of the samples, default is
+            Zürich (ZH); a list of locations or "all" writes one output per
+            location from a single glob and timeline read.
+        cache_dir (str): Optional directory of the decoded coverage cache,
+            files are decoded on first touch and memory-mapped on later runs;
+            also holds the parsed timeline.
+        cache_max_bytes (int): Size bound of the decoded coverage cache.
+        n_workers (int): Number of processes to load the samples with,
+            default is 1 (serial).
+        streaming (bool): Only decompress each file up to the largest
+            position of interest, useful for targeted panels.
+        previous_output (str): Optional earlier output of this analysis, e.g.
+            `output_file` itself; only samples that are new or changed since,
+            and mutations missing from it, are loaded.
+        metrics_output (str): Optional path to write the per-stage durations,
+            I/O totals and slowest samples to, as JSON.
+        parser (str): Parser backend of the coverage files, one of
+            usefulgnom.serialize.parsers.PARSERS, default is pandas.
+        prefetch_threads (int): Number of threads reading and decompressing
+            the next coverage files while one is parsed, when loading
+            serially; default is 0 (no prefetching).
 
     Returns:
         None
@@ -86,37 +129,58 @@ def run_total_coverage_depth(
     # result: matrix
     # entries: how many reads cover that position
 
-    # get list of coverage.tsv.gz files in the input directory
-    coverage_files = glob.glob(coverage_tsv_fps, recursive=True)
+    metrics = Metrics()
     # get samples_IDs from the specified location, time and sequencing protocol
     startdatetime = datetime.strptime(startdate, "%Y-%m-%d")
     enddatetime = datetime.strptime(enddate, "%Y-%m-%d")
-    sample_IDs = extract_sample_ID(
-        timeline_file_dir, startdatetime, enddatetime, location
-    )
+    with metrics.stage("timeline"):
+        samples_by_location = select_locations(
+            timeline_file_dir, startdatetime, enddatetime, location, cache_dir
+        )
+    # the coverage.tsv.gz files of the selected samples, built from their sample
+    # and batch directory names instead of listing the results tree
+    with metrics.stage("locate_files"):
+        files_by_location = locate_sample_files(coverage_tsv_fps, samples_by_location)
     # get the position in the genome for which we want to find coverage
-    position = extract_mutation_position(mutations_of_interest_fp)
-    # record columns for df (one sample = one column of different mutations)
-    columns = pd.DataFrame()
-    # iterate over the basecnt.tsv.gz files from the list
-    for cov_file in coverage_files:
-        # extract the sample name from the directory name
-
-        sample_name = cov_file.split("/")[-4]
-
-        if sample_name in sample_IDs.loc[:, "sample"].values:
-            # load the coverage.tsv.gz file of that sample,
-            # and extract the column with the mutation coverages
-            df = load_convert_total(cov_file, position)
-
-            date = sample_IDs.loc[sample_IDs.loc[:, "sample"] == sample_name, "date"]
-
-            columns[date] = df
-
+    with metrics.stage("mutations"):
+        position = extract_mutation_position(mutations_of_interest_fp)
+    # decoded coverage cache, shared across runs
+    cache = CoverageCache(cache_dir, cache_max_bytes) if cache_dir else None
     ind = pd.read_csv(mutations_of_interest_fp, usecols=["mut"])
 
-    sorted_df = columns.sort_index(axis=1)
-    # note that the index show the mutation
-    # (actually we find total coverage per position = independent on the mutated nt)
-    sorted_df = sorted_df.set_index(ind["mut"])
-    sorted_df.to_csv(output_file)
+    def make_loader(rows: list[int]) -> partial:
+        """Loader of the coverages of the given mutations."""
+        return partial(
+            load_convert_total,
+            pos=[position[row] for row in rows],
+            cache=cache,
+            streaming=streaming,
+            parser=parser,
+        )
+
+    multi_location = is_multi_location(location)
+    for name, sample_IDs in samples_by_location.items():
+        selected_files = files_by_location[name]
+        location_output_file = location_output(output_file, name, multi_location)
+        # load the coverage.tsv.gz file of each new or changed sample,
+        # and extract the column with the mutation coverages
+        # note that the index show the mutation
+        # (actually we find total coverage per position = independent on the
+        # mutated nt)
+        with metrics.stage("load_samples"):
+            sorted_df, manifest = update_coverage_matrix(
+                make_loader,
+                selected_files,
+                sample_IDs,
+                ind["mut"],
+                location_output(previous_output, name, multi_location),
+                n_workers,
+                metrics,
+                prefetch_threads,
+                partial(prefetched_files, cache=cache),
+            )
+        with metrics.stage("write"):
+            write_matrix(sorted_df, location_output_file)
+            write_manifest(manifest, location_output_file)
+    if metrics_output is not None:
+        metrics.write(metrics_output)
@@ -1 +1,28 @@
-"""Provide data intefaces."""
+"""Provide data intefaces.
+
+The command line interface lives in usefulgnom.interface.cli. The client and
+server are imported on first access, as they load pandas.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from usefulgnom.interface.client import CoverageClient
+    from usefulgnom.interface.server import CoverageServer, CoverageService
+
+__all__ = ["CoverageClient", "CoverageServer", "CoverageService"]
+
+# module of each lazily imported name
+LAZY_IMPORTS = {
+    "CoverageClient": "usefulgnom.interface.client",
+    "CoverageServer": "usefulgnom.interface.server",
+    "CoverageService": "usefulgnom.interface.server",
+}
+
+
+def __getattr__(name: str):
+    """Import the client and server on their first access."""
+    if name in LAZY_IMPORTS:
+        return getattr(importlib.import_module(LAZY_IMPORTS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,858 @@
+"""Implements the `usefulgnom` command line interface.
+
+e.g. the frequency matrix and statistics of the Zürich samples:
+
+    usefulgnom mutation-frequency -b "results/*/*/alignments/basecnt.tsv.gz" \
+        -t variants/timeline.tsv -m mutations_of_interest.csv -o out/
+    usefulgnom mutation-statistics out/frequency_data_matrix.csv \
+        -o out/mutations_statistics.csv
+
+Only click is imported at start-up: numpy, pandas and matplotlib are imported
+inside the commands that use them, so that `usefulgnom --help` and the
+snakemake jobs calling it do not pay for them. The choices of the options
+below mirror constants of those modules, tests/interface/test_cli.py keeps
+them in sync.
+"""
+
+import os
+from pathlib import Path
+from typing import Optional
+
+import click
+
+# usefulgnom.serialize.parsers.PARSERS and DEFAULT_PARSER
+PARSERS = ["pandas", "pyarrow", "numpy", "compare"]
+DEFAULT_PARSER = "pandas"
+
+# usefulgnom.serialize.matrix.MATRIX_FORMATS
+MATRIX_FORMATS = ["csv", "parquet", "arrow"]
+
+# usefulgnom.serialize.cache.DEFAULT_MAX_BYTES, in MiB
+DEFAULT_CACHE_MEMORY = 2048
+
+# usefulgnom.serialize.bgzf.DEFAULT_BLOCK_SIZE
+DEFAULT_BLOCK_SIZE = 4 * 1024
+
+# usefulgnom.analyze.statistics.DEFAULT_WINDOWS
+DEFAULT_WINDOWS = (2, 6, 12, 24)
+
+# usefulgnom.analyze.depth_summary.DEFAULT_QUANTILES and
+# DEFAULT_RELATIVE_ACCURACY
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+DEFAULT_RELATIVE_ACCURACY = 0.05
+
+
+def selected_locations(location: tuple[str, ...]):
+    """Single location as a string, several as a list, see run_basecnt_coverage."""
+    return location[0] if len(location) == 1 else list(location)
+
+
+def analysis_options(function):
+    """Add the options shared by the coverage analyses."""
+    options = [
+        click.option(
+            "-t",
+            "--timeline",
+            required=True,
+            type=click.Path(exists=True, dir_okay=False),
+            help="Path to the timeline file.",
+        ),
+        click.option(
+            "-m",
+            "--mutations",
+            required=True,
+            type=click.Path(exists=True, dir_okay=False),
+            help="Path to the mutations of interest file.",
+        ),
+        click.option("--startdate", default="2024-01-01", show_default=True),
+        click.option("--enddate", default="2024-07-03", show_default=True),
+        click.option(
+            "-l",
+            "--location",
+            multiple=True,
+            default=["Zürich (ZH)"],
+            show_default=True,
+            help="Location of the samples, repeat for several or 'all'; the "
+            "outputs then need a {location} placeholder.",
+        ),
+        click.option("--cache-dir", default=None, help="Decoded coverage cache."),
+        click.option(
+            "--cache-max-memory",
+            default=DEFAULT_CACHE_MEMORY,
+            show_default=True,
+            type=click.IntRange(min=1),
+            help="Size bound of the coverage cache, in MiB.",
+        ),
+        click.option(
+            "-j",
+            "--jobs",
+            default=1,
+            show_default=True,
+            type=click.IntRange(min=1),
+            help="Number of processes loading the samples.",
+        ),
+        click.option(
+            "--streaming",
+            is_flag=True,
+            help="Only decompress up to the last position of interest.",
+        ),
+        click.option(
+            "--metrics",
+            "metrics_output",
+            default=None,
+            help="Write per-stage durations, I/O totals and slowest samples as JSON.",
+        ),
+        click.option(
+            "--parser",
+            default=DEFAULT_PARSER,
+            show_default=True,
+            type=click.Choice(PARSERS),
+            help="Parser backend of the coverage files.",
+        ),
+        click.option(
+            "--prefetch-threads",
+            default=0,
+            show_default=True,
+            type=click.IntRange(min=0),
+            help="Threads reading the next files ahead, when loading serially.",
+        ),
+    ]
+    for option in reversed(options):
+        function = option(function)
+    return function
+
+
+@click.group(context_settings={"help_option_names": ["-h", "--help"]})
+@click.version_option(package_name="usefulgnom")
+def main():
+    """Viral genomic utilities over V-pipe results."""
+
+
+@main.command("basecnt-coverage")
+@click.option(
+    "-b",
+    "--basecnt-fps",
+    required=True,
+    help="Path pattern to the basecnt.tsv.gz files.",
+)
+@analysis_options
+@click.option(
+    "-o", "--output", required=True, help="Coverage matrix, .csv/.parquet/.arrow."
+)
+@click.option(
+    "--previous-output",
+    default=None,
+    help="Earlier output to only load the new and changed samples for.",
+)
+def basecnt_coverage(
+    basecnt_fps,
+    timeline,
+    mutations,
+    startdate,
+    enddate,
+    location,
+    cache_dir,
+    cache_max_memory,
+    jobs,
+    streaming,
+    metrics_output,
+    parser,
+    prefetch_threads,
+    output,
+    previous_output,
+):
+    """Extract the read counts of the mutations of interest."""
+    from usefulgnom.analyze.basecnt_coverage import run_basecnt_coverage
+
+    run_basecnt_coverage(
+        basecnt_fps=basecnt_fps,
+        timeline_file_dir=timeline,
+        mutations_of_interest_dir=mutations,
+        output_file=output,
+        startdate=startdate,
+        enddate=enddate,
+        location=selected_locations(location),
+        cache_dir=cache_dir,
+        cache_max_bytes=cache_max_memory * 1024**2,
+        n_workers=jobs,
+        streaming=streaming,
+        previous_output=previous_output,
+        metrics_output=metrics_output,
+        parser=parser,
+        prefetch_threads=prefetch_threads,
+    )
+
+
+@main.command("total-coverage")
+@click.option(
+    "-c",
+    "--coverage-fps",
+    required=True,
+    help="Path pattern to the coverage.tsv.gz files.",
+)
+@analysis_options
+@click.option(
+    "-o", "--output", required=True, help="Depth matrix, .csv/.parquet/.arrow."
+)
+@click.option(
+    "--previous-output",
+    default=None,
+    help="Earlier output to only load the new and changed samples for.",
+)
+def total_coverage(
+    coverage_fps,
+    timeline,
+    mutations,
+    startdate,
+    enddate,
+    location,
+    cache_dir,
+    cache_max_memory,
+    jobs,
+    streaming,
+    metrics_output,
+    parser,
+    prefetch_threads,
+    output,
+    previous_output,
+):
+    """Extract the total depth at the positions of the mutations of interest."""
+    from usefulgnom.analyze.total_coverage import run_total_coverage_depth
+
+    run_total_coverage_depth(
+        coverage_tsv_fps=coverage_fps,
+        mutations_of_interest_fp=mutations,
+        timeline_file_dir=timeline,
+        output_file=output,
+        startdate=startdate,
+        enddate=enddate,
+        location=selected_locations(location),
+        cache_dir=cache_dir,
+        cache_max_bytes=cache_max_memory * 1024**2,
+        n_workers=jobs,
+        streaming=streaming,
+        previous_output=previous_output,
+        metrics_output=metrics_output,
+        parser=parser,
+        prefetch_threads=prefetch_threads,
+    )
+
+
+@main.command("mutation-frequency")
+@click.option(
+    "-b",
+    "--basecnt-fps",
+    required=True,
+    help="Path pattern to the basecnt.tsv.gz files.",
+)
+@analysis_options
+@click.option(
+    "-o",
+    "--outdir",
+    required=True,
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Directory of the coverage, depth and frequency matrices.",
+)
+@click.option(
+    "--output-format",
+    default="csv",
+    show_default=True,
+    type=click.Choice(MATRIX_FORMATS),
+    help="Format of the matrices.",
+)
+@click.option(
+    "--min-depth",
+    default=20,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Minimum depth of a frequency.",
+)
+@click.option(
+    "--depth-from-basecnt",
+    is_flag=True,
+    help="Sum the depth from the basecnt files instead of coverage.tsv.gz.",
+)
+@click.option(
+    "--chunk-rows",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Mutations per chunk of the frequency matrix, for large sets.",
+)
+@click.option(
+    "--previous-outdir",
+    default=None,
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Earlier output directory to only load the new and changed samples for.",
+)
+def mutation_frequency(
+    basecnt_fps,
+    timeline,
+    mutations,
+    startdate,
+    enddate,
+    location,
+    cache_dir,
+    cache_max_memory,
+    jobs,
+    streaming,
+    metrics_output,
+    parser,
+    prefetch_threads,
+    outdir: Path,
+    output_format,
+    min_depth,
+    depth_from_basecnt,
+    chunk_rows,
+    previous_outdir: Optional[Path],
+):
+    """Compute the coverage, depth and frequency matrices in one pass."""
+    from usefulgnom.analyze.frequency import run_mutation_frequency
+    from usefulgnom.serialize.matrix import matrix_suffix
+
+    outdir.mkdir(parents=True, exist_ok=True)
+    name = "_{location}" if len(location) > 1 or location[0] == "all" else ""
+    suffix = name + matrix_suffix(output_format)
+    run_mutation_frequency(
+        basecnt_fps=basecnt_fps,
+        timeline_file_dir=timeline,
+        mutations_of_interest_dir=mutations,
+        basecnt_output_file=str(outdir / f"mut_base_coverage{suffix}"),
+        total_output_file=str(outdir / f"mut_total_coverage{suffix}"),
+        frequency_output_file=str(outdir / f"frequency_data_matrix{suffix}"),
+        startdate=startdate,
+        enddate=enddate,
+        location=selected_locations(location),
+        min_depth=min_depth,
+        depth_from_basecnt=depth_from_basecnt,
+        cache_dir=cache_dir,
+        cache_max_bytes=cache_max_memory * 1024**2,
+        n_workers=jobs,
+        streaming=streaming,
+        metrics_output=metrics_output,
+        parser=parser,
+        chunk_rows=chunk_rows,
+        prefetch_threads=prefetch_threads,
+        previous_basecnt_output=(
+            str(previous_outdir / f"mut_base_coverage{suffix}")
+            if previous_outdir is not None
+            else None
+        ),
+        previous_total_output=(
+            str(previous_outdir / f"mut_total_coverage{suffix}")
+            if previous_outdir is not None
+            else None
+        ),
+    )
+
+
+@main.command("mutation-statistics")
+@click.argument("frequency_matrix", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-o",
+    "--output",
+    required=True,
+    type=click.Path(dir_okay=False),
+    help="CSV of the statistics.",
+)
+@click.option(
+    "-w",
+    "--window",
+    "windows",
+    multiple=True,
+    default=DEFAULT_WINDOWS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Window length in weeks, repeat for several.",
+)
+def mutation_statistics(frequency_matrix, output, windows):
+    """Report the median, IQR, Q1 and Q3 of the frequencies of FREQUENCY_MATRIX."""
+    from usefulgnom.analyze.statistics import mutation_statistics
+    from usefulgnom.serialize.matrix import read_matrix
+
+    statistics = mutation_statistics(read_matrix(frequency_matrix), tuple(windows))
+    statistics.to_csv(output, header=True, index=False)
+
+
+def summary_options(function):
+    """Add the options of the depth summary table."""
+    options = [
+        click.option(
+            "-q",
+            "--quantile",
+            "quantiles",
+            multiple=True,
+            default=DEFAULT_QUANTILES,
+            show_default=True,
+            type=click.FloatRange(0, 1),
+            help="Quantile of the depth to report, repeat for several.",
+        ),
+        click.option(
+            "--state",
+            "summary_output",
+            default=None,
+            help="Also store the mergeable summary as .npz.",
+        ),
+    ]
+    for option in reversed(options):
+        function = option(function)
+    return function
+
+
+@main.command("depth-summary")
+@click.option(
+    "-c",
+    "--coverage-fps",
+    required=True,
+    help="Path pattern to the coverage.tsv.gz files.",
+)
+@click.option(
+    "-t",
+    "--timeline",
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Path to the timeline file.",
+)
+@click.option("--startdate", default="2024-01-01", show_default=True)
+@click.option("--enddate", default="2024-07-03", show_default=True)
+@click.option(
+    "-l",
+    "--location",
+    multiple=True,
+    default=["Zürich (ZH)"],
+    show_default=True,
+    help="Location of the samples, repeat for several or 'all'; the "
+    "outputs then need a {location} placeholder.",
+)
+@click.option(
+    "-o", "--output", required=True, help="Summary table, .csv/.parquet/.arrow."
+)
+@summary_options
+@click.option(
+    "--genome-length",
+    default=29903,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of positions of the genome.",
+)
+@click.option(
+    "--low-depth",
+    default=20,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Depth below which a sample counts as a dropout.",
+)
+@click.option(
+    "--relative-accuracy",
+    default=DEFAULT_RELATIVE_ACCURACY,
+    show_default=True,
+    type=click.FloatRange(0, 1, min_open=True, max_open=True),
+    help="Relative accuracy of the quantiles.",
+)
+@click.option("--cache-dir", default=None, help="Decoded coverage cache.")
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of processes loading the samples.",
+)
+@click.option(
+    "--metrics",
+    "metrics_output",
+    default=None,
+    help="Write per-stage durations, I/O totals and slowest samples as JSON.",
+)
+@click.option(
+    "--parser",
+    default=DEFAULT_PARSER,
+    show_default=True,
+    type=click.Choice(PARSERS),
+    help="Parser backend of the coverage files.",
+)
+@click.option(
+    "--prefetch-threads",
+    default=0,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Threads reading the next files ahead, when loading serially.",
+)
+def depth_summary(
+    coverage_fps,
+    timeline,
+    startdate,
+    enddate,
+    location,
+    output,
+    quantiles,
+    summary_output,
+    genome_length,
+    low_depth,
+    relative_accuracy,
+    cache_dir,
+    jobs,
+    metrics_output,
+    parser,
+    prefetch_threads,
+):
+    """Summarize the depth of every position over the selected samples."""
+    from usefulgnom.analyze.depth_summary import run_depth_summary
+
+    run_depth_summary(
+        coverage_tsv_fps=coverage_fps,
+        timeline_file_dir=timeline,
+        output_file=output,
+        startdate=startdate,
+        enddate=enddate,
+        location=selected_locations(location),
+        genome_length=genome_length,
+        quantiles=quantiles,
+        low_depth=low_depth,
+        relative_accuracy=relative_accuracy,
+        summary_output=summary_output,
+        cache_dir=cache_dir,
+        n_workers=jobs,
+        metrics_output=metrics_output,
+        parser=parser,
+        prefetch_threads=prefetch_threads,
+    )
+
+
+@main.command("merge-depth-summaries")
+@click.argument(
+    "states", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    "-o", "--output", required=True, help="Summary table, .csv/.parquet/.arrow."
+)
+@summary_options
+def merge_depth_summaries(states, output, quantiles, summary_output):
+    """Merge the depth summaries STATES of disjoint sets of samples."""
+    from usefulgnom.analyze.depth_summary import merge_depth_summaries
+    from usefulgnom.serialize.matrix import write_matrix
+
+    summary = merge_depth_summaries(list(states))
+    write_matrix(summary.to_frame(quantiles), output)
+    if summary_output is not None:
+        summary.save(summary_output)
+    click.echo(f"Merged the depth summaries of {summary.n_samples} samples")
+
+
+@main.command("amplicon-coverage")
+@click.option(
+    "-r",
+    "--bedfile-addr",
+    required=True,
+    type=click.Path(exists=True, path_type=Path),
+    help="Bedfile of the articV3 primers.",
+)
+@click.option(
+    "-s",
+    "--samp-file",
+    default="/cluster/project/pangolin/working/samples.tsv",
+    type=click.Path(exists=True, path_type=Path),
+    help="TSV file like samples.tsv.",
+)
+@click.option(
+    "-f",
+    "--samp-path",
+    default="/cluster/project/pangolin/working/samples",
+    type=click.Path(exists=True, path_type=Path),
+    help="Main path to samples.",
+)
+@click.option(
+    "-o",
+    "--outdir",
+    default=os.getcwd(),
+    type=click.Path(exists=True, path_type=Path),
+    help="Output directory.",
+)
+@click.option("-p", "--makeplots", is_flag=True, help="Output plots.")
+@click.option("-v", "--verbose", is_flag=True, help="Verbose output.")
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of processes to load coverage files with.",
+)
+@click.option(
+    "--max-memory",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Memory bound in MB of the samples in flight with --jobs.",
+)
+@click.option(
+    "--scheme-cache",
+    default=os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+        "usefulgnom",
+        "primer_schemes",
+    ),
+    type=click.Path(path_type=Path),
+    help="Directory of compiled primer schemes.",
+)
+@click.option(
+    "--no-scheme-cache",
+    is_flag=True,
+    help="Always compile the primer scheme from the bedfile.",
+)
+@click.option(
+    "--metrics",
+    "metrics_output",
+    default=None,
+    type=click.Path(path_type=Path),
+    help="Write per-stage durations, I/O totals and slowest samples as JSON.",
+)
+@click.option(
+    "--parser",
+    default=DEFAULT_PARSER,
+    type=click.Choice(PARSERS),
+    help="Parser backend of the coverage files.",
+)
+@click.option(
+    "--output-format",
+    default="csv",
+    show_default=True,
+    type=click.Choice(MATRIX_FORMATS),
+    help="Format of the coverage matrices, parquet and arrow keep the dtypes.",
+)
+def amplicon_coverage(
+    bedfile_addr: Path,
+    samp_file: Path,
+    samp_path: Path,
+    outdir: Path,
+    makeplots,
+    verbose,
+    jobs: int,
+    max_memory: Optional[int],
+    scheme_cache: Path,
+    no_scheme_cache: bool,
+    metrics_output: Optional[Path],
+    parser: str,
+    output_format: str,
+):
+    """
+    Compute per amplicon relative coverage for a batch of samples.
+    """
+    from usefulgnom.analyze.amplicon_coverage import (
+        SAMPLE_MEMORY_BYTES,
+        amplicon_coverage_tables,
+        get_samples_paths,
+    )
+    from usefulgnom.serialize.matrix import matrix_suffix, write_matrix
+    from usefulgnom.serialize.metrics import Metrics
+    from usefulgnom.serialize.primer_scheme import load_primer_scheme
+
+    outdir = Path(outdir)  # Ensure outdir is a Path object
+    if not outdir.exists():
+        outdir.mkdir(parents=True, exist_ok=True)
+
+    metrics = Metrics()
+    if verbose:
+        click.echo("Loading primers bedfile.")
+    with metrics.stage("bedfile"):
+        scheme = load_primer_scheme(
+            bedfile_addr, cache_dir=None if no_scheme_cache else scheme_cache
+        )
+
+    if verbose:
+        click.echo("Reading list of coverage files.")
+    with metrics.stage("samples_list"):
+        sam_list = get_samples_paths(samp_path, samp_file)
+
+    if verbose:
+        click.echo("Loading and parsing coverage files.")
+    max_in_flight = None
+    if max_memory is not None:
+        max_in_flight = max(1, max_memory * 1024**2 // SAMPLE_MEMORY_BYTES)
+    with click.progressbar(length=len(sam_list), label="Parsing coverage files") as bar:
+        all_covs, all_covs_frac, missing = amplicon_coverage_tables(
+            sam_list, scheme, jobs, max_in_flight, parser, metrics, bar.update
+        )
+    if verbose:
+        for sam in missing:
+            click.echo(f"WARNING: file {sam} not found.")
+
+    suffix = matrix_suffix(output_format)
+    if verbose:
+        click.echo(f"Outputting {suffix}'s")
+    with metrics.stage("write"):
+        write_matrix(
+            all_covs, os.path.join(outdir, "amplicons_coverages" + suffix), index=False
+        )
+        write_matrix(
+            all_covs_frac,
+            os.path.join(outdir, "amplicons_coverages_norm" + suffix),
+            index=False,
+        )
+
+    if makeplots:
+        from usefulgnom.visualise.heatmap import make_cov_heatmap
+
+        if verbose:
+            click.echo("Outputting plots.")
+
+        with metrics.stage("plots"):
+            output = os.path.join(outdir, "cov_heatmap.pdf")
+            make_cov_heatmap(all_covs, output)
+            click.echo(f"Saved heatmap to {output}")
+
+    if metrics_output is not None:
+        metrics.write(str(metrics_output))
+
+
+def convert_file(
+    coverage_path: str, block_size: int, level: int
+) -> tuple[str, int, int]:
+    """Convert one file, return its path and its size before and after."""
+    from usefulgnom.serialize.bgzf import convert_to_bgzf
+
+    size_before = os.path.getsize(coverage_path)
+    convert_to_bgzf(coverage_path, block_size=block_size, level=level)
+    return coverage_path, size_before, os.path.getsize(coverage_path)
+
+
+@main.command("convert-bgzf")
+@click.argument("files", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--block-size",
+    default=DEFAULT_BLOCK_SIZE,
+    show_default=True,
+    type=click.IntRange(min=1, max=0xFF00),
+    help="Maximum uncompressed bytes per block.",
+)
+@click.option(
+    "--level",
+    default=6,
+    show_default=True,
+    type=click.IntRange(min=1, max=9),
+    help="zlib compression level.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of processes converting files.",
+)
+@click.option("--force", is_flag=True, help="Also convert files already indexed.")
+@click.option("-v", "--verbose", is_flag=True, help="Verbose output.")
+def convert_bgzf(files, block_size, level, jobs, force, verbose):
+    """Convert coverage FILES to BGZF in place and index their positions."""
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    from usefulgnom.serialize.bgzf import load_position_index
+
+    pending = [path for path in files if force or load_position_index(path) is None]
+    if len(pending) < len(files):
+        click.echo(f"Skipping {len(files) - len(pending)} files already indexed")
+
+    convert = partial(convert_file, block_size=block_size, level=level)
+    total_before = total_after = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for path, size_before, size_after in executor.map(convert, pending):
+            total_before += size_before
+            total_after += size_after
+            if verbose:
+                click.echo(f"Converted {path}: {size_before} -> {size_after} bytes")
+    click.echo(
+        f"Converted {len(pending)} files: {total_before / 1024**2:.1f} MiB -> "
+        f"{total_after / 1024**2:.1f} MiB"
+    )
+
+
+@main.command("serve")
+@click.option(
+    "-b",
+    "--basecnt-fps",
+    required=True,
+    help="Path pattern to the basecnt.tsv.gz files.",
+)
+@click.option(
+    "-t",
+    "--timeline",
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Path to the timeline file.",
+)
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address.")
+@click.option("--port", default=8765, show_default=True, type=click.IntRange(0))
+@click.option(
+    "--max-memory",
+    default=1024,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Coverage kept in memory, in MiB.",
+)
+@click.option(
+    "--genome-length",
+    default=29903,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of positions of the genome.",
+)
+@click.option(
+    "--refresh-interval",
+    default=60.0,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Seconds between checks of the loaded files for changes.",
+)
+@click.option(
+    "--preload",
+    "preload_locations",
+    multiple=True,
+    help="Location whose samples to load at start-up, 'all' for every one.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of processes preloading the samples.",
+)
+@click.option("--cache-dir", default=None, help="Directory of the parsed timeline.")
+@click.option("-v", "--verbose", is_flag=True, help="Log every request.")
+def serve(
+    basecnt_fps,
+    timeline,
+    host,
+    port,
+    max_memory,
+    genome_length,
+    refresh_interval,
+    preload_locations,
+    jobs,
+    cache_dir,
+    verbose,
+):
+    """Serve coverage queries over the samples of a results tree."""
+    import logging
+
+    from usefulgnom.interface.server import CoverageServer, CoverageService
+
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
+    service = CoverageService(
+        basecnt_fps,
+        timeline,
+        max_bytes=max_memory * 1024**2,
+        genome_length=genome_length,
+        refresh_interval=refresh_interval,
+        cache_dir=cache_dir,
+    )
+    for location in preload_locations:
+        loaded = service.preload(None if location == "all" else location, jobs)
+        click.echo(f"Preloaded {loaded} samples of {location}")
+
+    server = CoverageServer(service, host, port)
+    click.echo(f"Serving coverage queries on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
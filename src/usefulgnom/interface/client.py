@@ -0,0 +1,118 @@
+"""Implements a client of the local coverage query server.
+
+e.g. the frequencies of two mutations in Zürich over six weeks:
+
+    client = CoverageClient("http://127.0.0.1:8765")
+    frequency = client.query(
+        ["C23039G", "G22599C"], "Zürich (ZH)", "2024-05-22", "2024-07-03"
+    )
+
+One client keeps one connection open; use one client per thread.
+"""
+
+import http.client
+import json
+from typing import Optional
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+import pandas as pd
+
+
+class CoverageClient:
+    """
+    Client of a CoverageServer, see usefulgnom.interface.server.
+
+    Args:
+        url (str): Base URL of the server, e.g. "http://127.0.0.1:8765".
+        timeout (float): Seconds to wait for a response.
+    """
+
+    def __init__(self, url: str, timeout: float = 60.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._connection: Optional[http.client.HTTPConnection] = None
+
+    def query(
+        self,
+        mutations: list[str],
+        location: str,
+        startdate: Optional[str] = None,
+        enddate: Optional[str] = None,
+        kind: str = "frequency",
+        min_depth: int = 20,
+    ) -> pd.DataFrame:
+        """
+        Query the mutation x date matrix of a location and time period.
+
+        Args:
+            mutations (list[str]): Mutations like "C23039G".
+            location (str): Location of the samples.
+            startdate (str): Exclusive start date, YYYY-MM-DD, default open.
+            enddate (str): Exclusive end date, YYYY-MM-DD, default open.
+            kind (str): "basecnt", "depth" or "frequency".
+            min_depth (int): Minimum depth of a frequency, default is 20.
+
+        Returns:
+            pd.DataFrame: Matrix with one row per mutation and one column per
+                sample date.
+
+        Raises:
+            ValueError: If the server rejects the query.
+        """
+        params = [("mutation", mutation) for mutation in mutations]
+        params += [("location", location), ("kind", kind), ("min_depth", min_depth)]
+        if startdate is not None:
+            params.append(("start", startdate))
+        if enddate is not None:
+            params.append(("end", enddate))
+        body = self._request("GET", "/query?" + urlencode(params))
+        dtype = np.float64 if kind == "frequency" else np.uint32
+        values = np.array(body["values"], dtype=np.float64).reshape(
+            len(body["mutations"]), len(body["dates"])
+        )
+        return pd.DataFrame(
+            values.astype(dtype),
+            index=pd.Index(body["mutations"], name="mut"),
+            columns=pd.DatetimeIndex(pd.to_datetime(body["dates"])),
+        )
+
+    def locations(self) -> list[str]:
+        """Locations of the timeline of the server."""
+        return self._request("GET", "/locations")["locations"]
+
+    def stats(self) -> dict:
+        """Counters of the queries and of the coverage kept in memory."""
+        return self._request("GET", "/stats")
+
+    def refresh(self) -> int:
+        """Make the server forget rewritten files, return how many."""
+        return self._request("POST", "/refresh")["forgotten"]
+
+    def close(self) -> None:
+        """Close the connection to the server."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _request(self, method: str, path: str) -> dict:
+        """Send a request, reconnecting once if the connection was closed."""
+        for attempt in range(2):
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout
+                )
+            try:
+                self._connection.request(method, path)
+                response = self._connection.getresponse()
+                body = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException):
+                self.close()
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise ValueError(body.get("error", f"HTTP {response.status}"))
+        return body
@@ -0,0 +1,531 @@
+"""Implements a local query server over the coverage data of a results tree.
+
+The server keeps the timeline index and the per-sample coverage of the
+recently queried samples in memory, so mutation x date-range x location
+questions are answered without rescanning the results tree:
+
+    GET  /query?mutation=C23039G&mutation=G22599C&location=Zürich (ZH)
+             &start=2024-05-01&end=2024-07-03&kind=frequency&min_depth=20
+    GET  /locations
+    GET  /stats
+    GET  /health
+    POST /refresh
+
+`kind` is one of "basecnt" (reads with the mutated nucleotide), "depth"
+(reads covering the position) or "frequency" (their ratio, NaN below
+`min_depth`); both dates are exclusive, as in the analyses. Queries answer
+with the matrix as JSON:
+
+    {"kind": "frequency", "location": "Zürich (ZH)",
+     "mutations": ["C23039G", ...], "dates": ["2024-05-02", ...],
+     "values": [[0.12, null, ...], ...]}
+
+The per-sample coverage (genome length x A, C, G, T, -, depth, uint32) is
+loaded on the first query touching a sample and evicted least recently used
+beyond `max_bytes`. Samples added to the timeline are picked up by the next
+query; coverage files rewritten since they were loaded are reloaded after
+the next refresh, every `refresh_interval` seconds or on POST /refresh.
+The server listens on the loopback interface only, see
+scripts/coverage_server.py.
+"""
+
+import glob
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from usefulgnom.analyze.coverage import (
+    load_samples,
+    resolve_sample_files,
+    sample_name,
+    select_sample_files,
+    split_results_pattern,
+)
+from usefulgnom.analyze.frequency import mutation_frequency, total_coverage_file
+from usefulgnom.serialize.timeline import load_timeline_index
+from usefulgnom.store.coverage_store import CHANNELS, load_sample_tensor
+
+QUERY_KINDS = ["basecnt", "depth", "frequency"]
+
+# bound of the coverage kept in memory, about 1700 SARS-CoV-2 samples
+DEFAULT_MAX_BYTES = 1024**3
+
+# dates bounding queries without start or end date
+FIRST_DATE = datetime(1900, 1, 1)
+LAST_DATE = datetime(2200, 1, 1)
+
+MUTATION_PATTERN = re.compile(r"(\d+)([ACGT-])?")
+
+
+def parse_mutation(mutation: str) -> tuple[int, Optional[str]]:
+    """
+    Split a mutation like "C23039G" into its position and new nucleotide.
+
+    Args:
+        mutation (str): A mutation, or a bare position like "23039".
+
+    Returns:
+        tuple[int, Optional[str]]: The 1-based position and the new
+            nucleotide, None for a bare position.
+
+    Raises:
+        ValueError: If no position is found in the mutation.
+    """
+    match = MUTATION_PATTERN.search(mutation)
+    if match is None:
+        raise ValueError(f"No match found for mutation: {mutation}")
+    return int(match.group(1)), match.group(2)
+
+
+def file_identity(path: str) -> Optional[tuple[int, int]]:
+    """Modification time and size of a file, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def sample_identity(basecnt_file: str) -> tuple:
+    """Identity of the basecnt.tsv.gz and coverage.tsv.gz files of a sample."""
+    return file_identity(basecnt_file), file_identity(total_coverage_file(basecnt_file))
+
+
+def date_columns(
+    coverage_files: list[str], sample_IDs: pd.DataFrame
+) -> tuple[pd.DatetimeIndex, list[int]]:
+    """
+    Sorted sample dates and the file of each, as coverage_matrix arranges them.
+
+    A file whose sample has several dates fills several columns, the last
+    file of a date wins.
+
+    Args:
+        coverage_files (list[str]): Coverage files of the selected samples.
+        sample_IDs (pd.DataFrame): Selected samples, see select_locations.
+
+    Returns:
+        tuple[pd.DatetimeIndex, list[int]]: The dates, and for each date the
+            index of its file in `coverage_files`.
+    """
+    sample_dates: dict[str, list] = {}
+    for sample, date in zip(sample_IDs["sample"], sample_IDs["date"]):
+        sample_dates.setdefault(sample, []).append(date)
+    files = {}
+    for i, coverage_file in enumerate(coverage_files):
+        for date in sample_dates.get(sample_name(coverage_file), []):
+            files[date] = i
+    dates = sorted(files)
+    return pd.DatetimeIndex(dates), [files[date] for date in dates]
+
+
+class CoverageService:
+    """
+    In-memory view of the coverage of a results tree, answering queries.
+
+    Thread-safe: queries may run concurrently, samples missing from memory
+    are loaded outside of the lock.
+
+    Args:
+        basecnt_fps (str): Path pattern to the basecnt.tsv.gz files, e.g.
+            '.../results/*/*/alignments/basecnt.tsv.gz'; the depth is read
+            from the coverage.tsv.gz next to them.
+        timeline_file (str): Path to the timeline file.
+        max_bytes (int): Bound of the coverage kept in memory.
+        genome_length (int): Number of positions, default is SARS-CoV-2.
+        refresh_interval (float): Seconds between checks of the loaded
+            coverage files for changes, None to only refresh on request.
+        cache_dir (str): Optional directory of the parsed timeline.
+    """
+
+    def __init__(
+        self,
+        basecnt_fps: str,
+        timeline_file: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        genome_length: int = 29903,
+        refresh_interval: Optional[float] = 60.0,
+        cache_dir: Optional[str] = None,
+    ):
+        self.basecnt_fps = basecnt_fps
+        self.timeline_file = timeline_file
+        self.max_bytes = max_bytes
+        self.genome_length = genome_length
+        self.refresh_interval = refresh_interval
+        self.cache_dir = cache_dir
+        # path -> (file identity, genome length x channels array)
+        self._samples: OrderedDict[str, tuple[Any, np.ndarray]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading: dict[str, Future] = {}
+        self._globbed: Optional[list[str]] = None
+        self._last_refresh = time.monotonic()
+        self.counters = {"queries": 0, "hits": 0, "loads": 0, "evictions": 0}
+
+    def locations(self) -> list[str]:
+        """Locations of the timeline."""
+        return [str(location) for location in self._timeline().locations]
+
+    def select(
+        self,
+        location: str,
+        startdate: Optional[datetime] = None,
+        enddate: Optional[datetime] = None,
+    ) -> tuple[pd.DataFrame, list[str]]:
+        """
+        Select the samples of a location between two exclusive dates.
+
+        Args:
+            location (str): Location of the samples.
+            startdate (datetime): Start date of the time period, default open.
+            enddate (datetime): End date of the time period, default open.
+
+        Returns:
+            tuple[pd.DataFrame, list[str]]: The selected samples, see
+                select_locations, and their existing basecnt files.
+        """
+        sample_IDs = self._timeline().query(
+            startdate or FIRST_DATE, enddate or LAST_DATE, location, batch=True
+        )
+        if split_results_pattern(self.basecnt_fps) is not None and (
+            "batch" in sample_IDs
+        ):
+            return sample_IDs, resolve_sample_files(self.basecnt_fps, sample_IDs)
+        with self._lock:
+            if self._globbed is None:
+                self._globbed = glob.glob(self.basecnt_fps, recursive=True)
+            globbed = self._globbed
+        return sample_IDs, select_sample_files(globbed, sample_IDs)
+
+    def preload(self, location: Optional[str] = None, n_workers: int = 1) -> int:
+        """
+        Load the coverage of all samples of a location, or of the timeline.
+
+        If they do not all fit in `max_bytes`, only the last ones of the
+        timeline are loaded.
+
+        Args:
+            location (str): Location of the samples, default all locations.
+            n_workers (int): Number of processes to load the samples with.
+
+        Returns:
+            int: Number of samples loaded.
+        """
+        locations = self.locations() if location is None else [location]
+        paths = list(
+            dict.fromkeys(path for name in locations for path in self.select(name)[1])
+        )
+        # the last samples of the timeline that fit in memory
+        sample_bytes = self.genome_length * len(CHANNELS) * np.dtype(np.uint32).itemsize
+        paths = paths[-max(1, self.max_bytes // sample_bytes) :]
+        with self._lock:
+            paths = [path for path in paths if path not in self._samples]
+        identities = [sample_identity(path) for path in paths]
+        tensors = load_samples(
+            partial(load_sample_tensor, genome_length=self.genome_length),
+            paths,
+            n_workers,
+        )
+        for path, identity, tensor in zip(paths, identities, tensors):
+            self._store(path, identity, tensor)
+        return len(paths)
+
+    def query(
+        self,
+        mutations: list[str],
+        location: str,
+        startdate: Optional[datetime] = None,
+        enddate: Optional[datetime] = None,
+        kind: str = "frequency",
+        min_depth: int = 20,
+    ) -> pd.DataFrame:
+        """
+        Build the mutation x date matrix of a location and time period.
+
+        The matrix is the one of the analyses, e.g. run_mutation_frequency,
+        for the same mutations, location and dates.
+
+        Args:
+            mutations (list[str]): Mutations like "C23039G"; for the depth,
+                bare positions like "23039" are accepted too.
+            location (str): Location of the samples.
+            startdate (datetime): Start date of the time period, default open.
+            enddate (datetime): End date of the time period, default open.
+            kind (str): One of QUERY_KINDS.
+            min_depth (int): Minimum depth of a frequency, default is 20.
+
+        Returns:
+            pd.DataFrame: Matrix with one row per mutation and one column per
+                sample date, sorted by date.
+
+        Raises:
+            ValueError: If the kind is unknown, a mutation lacks its new
+                nucleotide or a position is outside of the genome.
+        """
+        if kind not in QUERY_KINDS:
+            raise ValueError(
+                f"Unknown query kind {kind}, expected one of {QUERY_KINDS}."
+            )
+        parsed = [parse_mutation(mutation) for mutation in mutations]
+        positions = np.asarray([position for position, _ in parsed], dtype=np.int64)
+        out_of_range = (positions < 1) | (positions > self.genome_length)
+        if out_of_range.any():
+            raise ValueError(
+                f"Position {positions[out_of_range][0]} not found in coverage data."
+            )
+        if kind != "depth":
+            missing = [m for m, (_, nt) in zip(mutations, parsed) if nt is None]
+            if missing:
+                raise ValueError(f"No new nucleotide in mutation: {missing[0]}")
+        self._maybe_refresh()
+        with self._lock:
+            self.counters["queries"] += 1
+
+        sample_IDs, paths = self.select(location, startdate, enddate)
+        dates, order = date_columns(paths, sample_IDs)
+        tensors = [self.sample_tensor(paths[i]) for i in order]
+        rows = positions - 1
+        index = pd.Index(list(mutations), name="mut")
+
+        def matrix(channels: Any) -> pd.DataFrame:
+            """Matrix of the given channel of each mutation."""
+            values = np.empty((len(rows), len(tensors)), dtype=np.uint32)
+            for column, tensor in enumerate(tensors):
+                values[:, column] = tensor[rows, channels]
+            return pd.DataFrame(values, index=index, columns=dates)
+
+        depth = CHANNELS.index("depth")
+        if kind == "depth":
+            return matrix(depth)
+        basecnt = matrix([CHANNELS.index(nt or "depth") for _, nt in parsed])
+        if kind == "basecnt":
+            return basecnt
+        return mutation_frequency(basecnt, matrix(depth), min_depth)
+
+    def sample_tensor(self, path: str) -> np.ndarray:
+        """
+        Coverage of one sample, from memory or loaded from its files.
+
+        Args:
+            path (str): Path to the basecnt.tsv.gz file of the sample.
+
+        Returns:
+            np.ndarray: uint32 array of shape (genome_length, len(CHANNELS)).
+        """
+        with self._lock:
+            cached = self._samples.get(path)
+            if cached is not None:
+                self._samples.move_to_end(path)
+                self.counters["hits"] += 1
+                return cached[1]
+            # concurrent queries of a sample being loaded wait for that load
+            loading = self._loading.get(path)
+            if loading is None:
+                self._loading[path] = Future()
+        if loading is not None:
+            return loading.result()
+
+        try:
+            identity = sample_identity(path)
+            tensor = load_sample_tensor(path, self.genome_length)
+            self._store(path, identity, tensor)
+        except BaseException as error:
+            self._loading.pop(path).set_exception(error)
+            raise
+        self._loading.pop(path).set_result(tensor)
+        return tensor
+
+    def refresh(self) -> int:
+        """
+        Forget the coverage of files rewritten or removed since they were loaded.
+
+        Returns:
+            int: Number of samples forgotten.
+        """
+        with self._lock:
+            loaded = [(path, entry[0]) for path, entry in self._samples.items()]
+        stale = [path for path, identity in loaded if sample_identity(path) != identity]
+        with self._lock:
+            for path in stale:
+                entry = self._samples.pop(path, None)
+                if entry is not None:
+                    self._bytes -= entry[1].nbytes
+            self._globbed = None
+            self._last_refresh = time.monotonic()
+        return len(stale)
+
+    def stats(self) -> dict:
+        """Counters of the queries and of the coverage kept in memory."""
+        with self._lock:
+            return {
+                **self.counters,
+                "samples_in_memory": len(self._samples),
+                "bytes_in_memory": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _timeline(self) -> Any:
+        """Timeline index, parsed again only if the timeline file changed."""
+        return load_timeline_index(self.timeline_file, self.cache_dir)
+
+    def _maybe_refresh(self) -> None:
+        """Refresh if the refresh interval has passed."""
+        if self.refresh_interval is None:
+            return
+        if time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+
+    def _store(self, path: str, identity: Any, tensor: np.ndarray) -> None:
+        """Keep the coverage of a sample, evicting the least recently used."""
+        with self._lock:
+            self.counters["loads"] += 1
+            previous = self._samples.pop(path, None)
+            if previous is not None:
+                self._bytes -= previous[1].nbytes
+            self._samples[path] = (identity, tensor)
+            self._bytes += tensor.nbytes
+            while self._bytes > self.max_bytes and len(self._samples) > 1:
+                _, (_, evicted) = self._samples.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.counters["evictions"] += 1
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse an optional YYYY-MM-DD date of a request."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError as error:
+        raise ValueError(f"Invalid date {value}, expected YYYY-MM-DD.") from error
+
+
+def matrix_json(matrix: pd.DataFrame, **fields) -> dict:
+    """Serialize a mutation x date matrix, NaN as null."""
+    values = [
+        [None if isinstance(v, float) and math.isnan(v) else v for v in row]
+        for row in matrix.to_numpy().tolist()
+    ]
+    return {
+        **fields,
+        "mutations": [str(mutation) for mutation in matrix.index],
+        "dates": [date.strftime("%Y-%m-%d") for date in matrix.columns],
+        "values": values,
+    }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answers the HTTP requests of a CoverageServer."""
+
+    # keep connections open between the requests of a client, and send the
+    # headers and body of responses without waiting for delayed ACKs
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "CoverageServer"
+
+    def do_GET(self) -> None:
+        """
+        Answer GET /query, /locations, /stats and /health.
+
+        Errors are answered as JSON too, so the connection stays usable: 400
+        for a bad query, 404 for a sample file missing, e.g. deleted since
+        the last refresh, and 500 for any other error.
+        """
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        service = self.server.service
+        try:
+            if url.path == "/query":
+                kind = params.get("kind", ["frequency"])[0]
+                location = params.get("location", [None])[0]
+                if location is None:
+                    raise ValueError("Missing location.")
+                matrix = service.query(
+                    [
+                        m
+                        for value in params.get("mutation", [])
+                        for m in value.split(",")
+                    ],
+                    location,
+                    parse_date(params.get("start", [None])[0]),
+                    parse_date(params.get("end", [None])[0]),
+                    kind,
+                    int(params.get("min_depth", ["20"])[0]),
+                )
+                self._send(200, matrix_json(matrix, kind=kind, location=location))
+            elif url.path == "/locations":
+                self._send(200, {"locations": service.locations()})
+            elif url.path == "/stats":
+                self._send(200, service.stats())
+            elif url.path == "/health":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": f"Unknown path {url.path}."})
+        except ValueError as error:
+            self._send(400, {"error": str(error)})
+        except FileNotFoundError as error:
+            self._send(404, {"error": f"File not found: {error.filename}"})
+        except Exception as error:
+            logging.exception("Failed to answer %s", self.path)
+            self._send(500, {"error": f"{type(error).__name__}: {error}"})
+
+    def do_POST(self) -> None:
+        """Answer POST /refresh."""
+        # drain the body, if any, to keep the connection usable
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlsplit(self.path).path == "/refresh":
+            self._send(200, {"forgotten": self.server.service.refresh()})
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}."})
+
+    def log_message(self, format: str, *args) -> None:
+        """Log requests at debug level instead of to stderr."""
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status: int, body: dict) -> None:
+        """Send a JSON response."""
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CoverageServer(ThreadingHTTPServer):
+    """
+    HTTP server of a CoverageService, one thread per connection.
+
+    Args:
+        service (CoverageService): The service answering the queries.
+        host (str): Address to listen on, default is the loopback interface.
+        port (int): Port to listen on, 0 for any free port.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, service: CoverageService, host: str = "127.0.0.1", port: int = 0
+    ):
+        super().__init__((host, port), QueryHandler)
+        self.service = service
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
@@ -3,9 +3,23 @@
 from usefulgnom.serialize.coverage import extract_sample_ID
 from usefulgnom.serialize.basecnt_coverage import load_convert_bnc
 from usefulgnom.serialize.total_coverage import load_convert_total
+from usefulgnom.serialize.cache import CoverageCache
+from usefulgnom.serialize.primer_scheme import PrimerScheme, load_primer_scheme
+from usefulgnom.serialize.timeline import TimelineIndex, load_timeline_index
+from usefulgnom.serialize.bgzf import convert_to_bgzf, load_position_index
+from usefulgnom.serialize.matrix import read_matrix, write_matrix
 
 __all__ = [
     "load_convert_bnc",
     "load_convert_total",
     "extract_sample_ID",
+    "CoverageCache",
+    "PrimerScheme",
+    "load_primer_scheme",
+    "TimelineIndex",
+    "load_timeline_index",
+    "convert_to_bgzf",
+    "load_position_index",
+    "read_matrix",
+    "write_matrix",
 ]
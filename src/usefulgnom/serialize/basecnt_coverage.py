@@ -15,38 +15,125 @@
 
 """
 
-import pandas as pd
-import gzip
+import numpy as np
+from functools import partial
+from typing import Optional
 
+from usefulgnom.serialize.bgzf import load_position_index, read_indexed_positions
+from usefulgnom.serialize.cache import CoverageCache
+from usefulgnom.serialize.parsers import DEFAULT_PARSER, read_columns
+from usefulgnom.serialize.coverage import (
+    gather_positions,
+    stream_positions,
+    to_position_array,
+)
 
-def load_convert_bnc(coverage_path: str, pos_mut: list[tuple]) -> pd.DataFrame:
+# order of the per-base count columns in basecnt.tsv.gz
+NUCLEOTIDES = ["A", "C", "G", "T", "-"]
+
+
+def read_basecnt_array(coverage_path: str, parser: str = DEFAULT_PARSER) -> np.ndarray:
+    """
+    Read the per-base counts of a basecnt.tsv.gz file into a dense array.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+        parser (str): Parser backend, see usefulgnom.serialize.parsers.
+
+    Returns:
+        np.ndarray: uint32 array of shape (genome length, 5), row i holds
+                    the counts of position i + 1 in the order of NUCLEOTIDES.
+    """
+    values = read_columns(coverage_path, [1, 2, 3, 4, 5, 6], 3, parser)
+    return to_position_array(values[:, 0], values[:, 1:])
+
+
+def load_basecnt_rows(
+    coverage_path: str,
+    positions: list,
+    cache: Optional[CoverageCache] = None,
+    streaming: bool = False,
+    parser: str = DEFAULT_PARSER,
+) -> np.ndarray:
+    """
+    Load the per-base counts of the given positions.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+        positions (list): 1-based genome positions, as int or str.
+        cache (CoverageCache): Optional cache of decoded coverage files.
+        streaming (bool): Parse the file in chunks, keep only the requested
+            positions and stop decompressing past the largest one.
+            Ignored if a cache is given, as the cache stores whole files.
+        parser (str): Parser backend of whole files, see
+            usefulgnom.serialize.parsers; streaming always uses pandas.
+
+    BGZF files with a position index (see usefulgnom.serialize.bgzf) are
+    read by inflating only the blocks of the positions, unless a cache is
+    given.
+
+    Returns:
+        np.ndarray: uint32 array of shape (len(positions), 5), one row per
+                    position with the counts in the order of NUCLEOTIDES.
+
+    Raises:
+        ValueError: If a position is not found in the coverage file.
+    """
+    if cache is None:
+        index = load_position_index(coverage_path)
+        if index is not None:
+            return read_indexed_positions(
+                coverage_path, index, positions, usecols=[1, 2, 3, 4, 5, 6]
+            )
+    if streaming and cache is None:
+        return stream_positions(
+            coverage_path, positions, usecols=[1, 2, 3, 4, 5, 6], skiprows=3
+        )
+
+    if cache is not None:
+        counts = cache.load(
+            coverage_path, "basecnt", partial(read_basecnt_array, parser=parser)
+        )
+    else:
+        counts = read_basecnt_array(coverage_path, parser)
+    return gather_positions(counts, positions)
+
+
+def load_convert_bnc(
+    coverage_path: str,
+    pos_mut: list[tuple],
+    cache: Optional[CoverageCache] = None,
+    streaming: bool = False,
+    parser: str = DEFAULT_PARSER,
+) -> np.ndarray:
     """
     Load and convert the base nucleotide coverage data.
 
     Args:
         coverage_path (str): Path to the coverage file.
         pos_mut (list[tuple]): List of tuples containing position and new nucleotide.
+        cache (CoverageCache): Optional cache of decoded coverage files.
+        streaming (bool): Parse the file in chunks, keep only the requested
+            positions and stop decompressing past the largest one.
+            Ignored if a cache is given, as the cache stores whole files.
+        parser (str): Parser backend of whole files, see
+            usefulgnom.serialize.parsers; streaming always uses pandas.
+
+    BGZF files with a position index (see usefulgnom.serialize.bgzf) are
+    read by inflating only the blocks of the positions, unless a cache is
+    given.
 
     Returns:
-        pd.DataFrame: DataFrame containing the coverage data.
+        np.ndarray: uint32 vector of the read counts of each (position, nucleotide),
+                    in the order of `pos_mut`.
 
+    Raises:
+        ValueError: If a position is not found in the coverage file.
     """
-    with gzip.open(coverage_path, "rt") as file:
-        # Use pd.read_csv to read the file
-        df = pd.read_csv(
-            file, delimiter="\t", usecols=[1, 2, 3, 4, 5], header=None, index_col=None
-        )[3:]
-        df.columns = ["pos", "A", "C", "G", "T"]
-
-    # extract coverage for specified positions and nt
     # position_mutation is a tuple (position, mutation)
-    # record columns for df
-    column = []
-    for position_mutation in pos_mut:
-        coverage = df.loc[df["pos"] == position_mutation[0], position_mutation[1]]
-
-        column.append(coverage.iloc[0])
-
-    df_out = pd.DataFrame(column)
+    positions = [position for position, _ in pos_mut]
+    nt_index = [NUCLEOTIDES.index(nt) for _, nt in pos_mut]
 
-    return df_out
+    counts = load_basecnt_rows(coverage_path, positions, cache, streaming, parser)
+    # extract coverage for specified nt of each position
+    return counts[np.arange(len(pos_mut)), nt_index]
@@ -0,0 +1,313 @@
+"""Implements block-gzipped (BGZF) coverage files with a position index.
+
+A plain basecnt.tsv.gz / coverage.tsv.gz is a single gzip member, so reading
+a few positions inflates the whole file. The BGZF variant is a series of
+small gzip members of whole lines, still readable by gzip, zcat and all the
+parsers, with a companion index of the compressed offset and first genome
+position of each block. The rows of a set of positions are then read by
+seeking to the blocks holding them and inflating only those:
+
+    basecnt.tsv.gz           BGZF: header block, data blocks, EOF block
+    basecnt.tsv.gz.idx.npz   offsets, first_positions, header_bytes,
+                             file_size, mtime_ns
+
+Existing files are converted in place with convert_to_bgzf, see
+scripts/convert_bgzf.py.
+"""
+
+import gzip
+import os
+import struct
+import tempfile
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from usefulgnom.serialize.metrics import record_read
+from usefulgnom.serialize.parsers import parse_numpy_bytes
+
+# uncompressed bytes per block: small blocks inflate less for sparse panels,
+# at a compression ratio within a few percent; BGZF allows up to 64 KiB
+DEFAULT_BLOCK_SIZE = 4 * 1024
+
+INDEX_SUFFIX = ".idx.npz"
+
+# empty block marking the end of a BGZF file, as written by htslib
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def bgzf_block(data: bytes, level: int = 6) -> bytes:
+    """
+    Compress data into one BGZF block, a gzip member with the block size.
+
+    Args:
+        data (bytes): At most 64 KiB of uncompressed data.
+        level (int): zlib compression level.
+
+    Returns:
+        bytes: The block.
+
+    Raises:
+        ValueError: If the compressed block exceeds 64 KiB.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    block_size = 18 + len(deflated) + 8
+    if block_size > 65536 or len(data) > 65536:
+        raise ValueError(f"BGZF block of {len(data)} bytes exceeds 64 KiB.")
+    # gzip header with the "BC" extra field holding the block size - 1
+    header = struct.pack(
+        "<BBBBIBBHBBHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, block_size - 1
+    )
+    trailer = struct.pack("<II", zlib.crc32(data), len(data))
+    return header + deflated + trailer
+
+
+def index_path(coverage_path: str) -> str:
+    """Path of the position index of a BGZF coverage file."""
+    return coverage_path + INDEX_SUFFIX
+
+
+@dataclass(frozen=True)
+class PositionIndex:
+    """
+    Compressed offsets of the blocks of a BGZF coverage file.
+
+    Attributes:
+        offsets: Offset of each data block in the file, followed by the offset
+            of the EOF block.
+        first_positions: Genome position of the first line of each data block.
+        header_bytes: Uncompressed size of the header lines, in the first block.
+        file_size: Size of the indexed file, to detect rewritten files.
+        mtime_ns: Modification time of the indexed file, to detect files
+            rewritten with the same size.
+    """
+
+    offsets: np.ndarray
+    first_positions: np.ndarray
+    header_bytes: int
+    file_size: int
+    mtime_ns: int
+
+    def save(self, path: str) -> None:
+        """
+        Write the index as .npz, atomically.
+
+        Args:
+            path (str): Path to the index file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez(
+                    file,
+                    offsets=self.offsets,
+                    first_positions=self.first_positions,
+                    header_bytes=self.header_bytes,
+                    file_size=self.file_size,
+                    mtime_ns=self.mtime_ns,
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "PositionIndex":
+        """
+        Read an index written by `save`.
+
+        Args:
+            path (str): Path to the index file.
+
+        Returns:
+            PositionIndex: The index.
+        """
+        with np.load(path) as stored:
+            return cls(
+                offsets=stored["offsets"],
+                first_positions=stored["first_positions"],
+                header_bytes=int(stored["header_bytes"]),
+                file_size=int(stored["file_size"]),
+                mtime_ns=int(stored["mtime_ns"]),
+            )
+
+
+def load_position_index(coverage_path: str) -> Optional[PositionIndex]:
+    """
+    Load the position index of a coverage file, if it has a current one.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+
+    Returns:
+        PositionIndex: The index, None if the file has no index, an index
+            without modification time, or was rewritten since it was indexed.
+    """
+    try:
+        index = PositionIndex.load(index_path(coverage_path))
+        stat = os.stat(coverage_path)
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        return None
+    if index.file_size != stat.st_size or index.mtime_ns != stat.st_mtime_ns:
+        return None
+    return index
+
+
+def header_length(data: bytes) -> int:
+    """
+    Length of the header lines of a coverage file.
+
+    Header lines are the lines before the first one whose second field,
+    the genome position, is a number.
+
+    Args:
+        data (bytes): Decompressed content of the file.
+
+    Returns:
+        int: Number of bytes of the header lines.
+    """
+    start = 0
+    while start < len(data):
+        end = data.find(b"\n", start)
+        end = len(data) if end < 0 else end + 1
+        fields = data[start:end].split(b"\t", 2)
+        if len(fields) > 1 and fields[1].strip().isdigit():
+            return start
+        start = end
+    return start
+
+
+def convert_to_bgzf(
+    coverage_path: str,
+    output_path: Optional[str] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    level: int = 6,
+) -> str:
+    """
+    Rewrite a gzipped coverage file as BGZF and write its position index.
+
+    The content is unchanged: the header lines go to the first block and the
+    data lines, sorted by position as V-pipe writes them, are cut into blocks
+    of whole lines of at most `block_size` bytes.
+
+    Args:
+        coverage_path (str): Path to the basecnt.tsv.gz or coverage.tsv.gz.
+        output_path (str): Path of the BGZF file, default is to replace
+            `coverage_path`; the index is written next to it.
+        block_size (int): Maximum uncompressed bytes per block.
+        level (int): zlib compression level.
+
+    Returns:
+        str: Path of the BGZF file.
+
+    Raises:
+        ValueError: If block_size is not in [1, 65280] or a line does not
+            fit a block.
+    """
+    if not 0 < block_size <= 0xFF00:
+        raise ValueError(f"BGZF block size {block_size} not in [1, 65280].")
+    if output_path is None:
+        output_path = coverage_path
+    with gzip.open(coverage_path, "rb") as file:
+        data = file.read()
+    if data and not data.endswith(b"\n"):
+        data += b"\n"
+    header_bytes = header_length(data)
+
+    blocks = [data[:header_bytes]] if header_bytes else []
+    first_positions = []
+    start = header_bytes
+    while start < len(data):
+        # cut after the last line end that fits the block
+        end = data.rfind(b"\n", start, start + block_size) + 1
+        if end <= start:
+            raise ValueError(f"Line of {coverage_path} exceeds the BGZF block size.")
+        first_positions.append(int(data[start:end].split(b"\t", 2)[1]))
+        blocks.append(data[start:end])
+        start = end
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    offsets = []
+    try:
+        with os.fdopen(fd, "wb") as file:
+            for i, block in enumerate(blocks):
+                if i >= len(blocks) - len(first_positions):
+                    offsets.append(file.tell())
+                file.write(bgzf_block(block, level))
+            offsets.append(file.tell())
+            file.write(EOF_BLOCK)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    stat = os.stat(output_path)
+    PositionIndex(
+        offsets=np.asarray(offsets, dtype=np.int64),
+        first_positions=np.asarray(first_positions, dtype=np.int64),
+        header_bytes=header_bytes,
+        file_size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+    ).save(index_path(output_path))
+    return output_path
+
+
+def read_indexed_positions(
+    coverage_path: str,
+    index: PositionIndex,
+    positions: list,
+    usecols: list[int],
+) -> np.ndarray:
+    """
+    Read only the blocks holding the given positions of a BGZF coverage file.
+
+    Consecutive blocks are read with one seek and all of them inflated at once.
+
+    Args:
+        coverage_path (str): Path to the BGZF coverage file.
+        index (PositionIndex): Its position index, see load_position_index.
+        positions (list): 1-based genome positions, as int or str.
+        usecols (list[int]): Columns to read, the first one being the position.
+
+    Returns:
+        np.ndarray: uint32 array with one row per requested position and one
+                    column per value column of `usecols`.
+
+    Raises:
+        ValueError: If a position is not found in the coverage file.
+    """
+    wanted = np.asarray(positions, dtype=np.int64)
+    values = np.zeros((wanted.size, len(usecols) - 1), dtype=np.uint32)
+    if wanted.size == 0:
+        return values
+
+    blocks = np.unique(np.searchsorted(index.first_positions, wanted, side="right") - 1)
+    blocks = blocks[blocks >= 0]
+    compressed = []
+    with open(coverage_path, "rb") as file:
+        # runs of consecutive blocks
+        for run in np.split(blocks, np.flatnonzero(np.diff(blocks) > 1) + 1):
+            if run.size == 0:
+                continue
+            start, end = index.offsets[run[0]], index.offsets[run[-1] + 1]
+            file.seek(start)
+            compressed.append(file.read(end - start))
+    compressed_bytes = b"".join(compressed)
+    data = gzip.decompress(compressed_bytes)
+    rows = parse_numpy_bytes(data, usecols, 0)
+    record_read(coverage_path, len(compressed_bytes), len(data), len(rows))
+
+    # positions are sorted within the file
+    row_positions = rows[:, 0].astype(np.int64)
+    found = np.searchsorted(row_positions, wanted)
+    found[found == row_positions.size] = 0
+    hit = row_positions[found] == wanted if row_positions.size else found < 0
+    if not hit.all():
+        raise ValueError(f"Position {wanted[~hit][0]} not found in coverage data.")
+    values[:] = rows[found, 1:]
+    return values
@@ -0,0 +1,158 @@
+"""Implements a binary on-disk cache of decoded coverage files.
+
+V-pipe never rewrites the basecnt.tsv.gz / coverage.tsv.gz of a finished
+sample, so each file is decoded once into a position-indexed uint32 array,
+stored as .npy and memory-mapped on later runs.
+
+e.g. of a cache directory:
+
+    cache_dir/
+        basecnt-3f1c...e2.npy   (genome length x 5, A C G T -)
+        total-91ab...07.npy     (genome length)
+"""
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+# 2 GiB holds roughly 3'000 decoded basecnt files of SARS-CoV-2
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+class CoverageCache:
+    """
+    Size-bounded cache of decoded coverage arrays.
+
+    Entries are keyed by kind, absolute path, modification time and size of
+    the source file, so a rewritten file is decoded again. Once the cache
+    grows beyond `max_bytes` the least recently used entries are evicted.
+
+    Args:
+        cache_dir (str): Directory to store the cached arrays in.
+        max_bytes (int): Upper bound on the total size of the cache.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, coverage_path: str, kind: str) -> str:
+        """
+        Compute the cache key of a coverage file.
+
+        Args:
+            coverage_path (str): Path to the coverage file.
+            kind (str): Kind of decoded data, e.g. "basecnt" or "total".
+
+        Returns:
+            str: File name of the cache entry.
+        """
+        return f"{kind}-{self.digest(coverage_path)}.npy"
+
+    def digest(self, coverage_path: str) -> str:
+        """Digest of the absolute path, modification time and size of a file."""
+        stat = os.stat(coverage_path)
+        identity = f"{os.path.abspath(coverage_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def contains(self, coverage_path: str) -> bool:
+        """
+        Whether a decoded array of the file, of any kind, is in the cache.
+
+        Args:
+            coverage_path (str): Path to the coverage file.
+
+        Returns:
+            bool: False also if the file does not exist.
+        """
+        try:
+            digest = self.digest(coverage_path)
+        except FileNotFoundError:
+            return False
+        return any(self.cache_dir.glob(f"*-{digest}.npy"))
+
+    def load(
+        self,
+        coverage_path: str,
+        kind: str,
+        decoder: Callable[[str], np.ndarray],
+    ) -> np.ndarray:
+        """
+        Load the decoded array of a coverage file, decoding it on first touch.
+
+        Args:
+            coverage_path (str): Path to the coverage file.
+            kind (str): Kind of decoded data, e.g. "basecnt" or "total".
+            decoder (Callable): Function decoding the file into an array.
+
+        Returns:
+            np.ndarray: Read-only memory-mapped array.
+        """
+        entry = self.cache_dir / self.key(coverage_path, kind)
+        try:
+            array = np.load(entry, mmap_mode="r")
+            # mark as recently used for the eviction
+            os.utime(entry)
+            return array
+        except (FileNotFoundError, ValueError):
+            # missing or truncated entry: decode again
+            pass
+
+        array = decoder(coverage_path)
+        # write atomically, other jobs may share the cache directory
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.save(file, np.ascontiguousarray(array))
+            os.replace(tmp_path, entry)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict(keep=entry)
+        return np.load(entry, mmap_mode="r")
+
+    def size(self) -> int:
+        """Total size of the cache entries in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        """
+        Remove least recently used entries until the cache fits `max_bytes`.
+
+        Args:
+            keep (Path): Entry never to evict, e.g. the one just written.
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                # already evicted by a concurrent job
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        for path, _, _ in self._entries():
+            path.unlink(missing_ok=True)
+
+    def _entries(self) -> list[tuple[Path, int, float]]:
+        """List the cache entries as (path, size, last use) tuples."""
+        entries = []
+        for path in self.cache_dir.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
@@ -1,8 +1,18 @@
 """Shared serialization functions for coverage data."""
 
+import gzip
+import io
+import numpy as np
 import pandas as pd
 from datetime import datetime
-from typing import Optional
+from typing import Optional, TextIO
+
+from usefulgnom.serialize.metrics import gzip_offsets, record_read
+from usefulgnom.serialize.prefetch import take_prefetched
+from usefulgnom.serialize.timeline import load_timeline_index
+
+# rows parsed at a time when streaming a coverage file
+DEFAULT_CHUNKSIZE = 4096
 
 
 def extract_sample_ID(
@@ -11,12 +21,15 @@ def extract_sample_ID(
     enddate: datetime = datetime.strptime("2024-07-03", "%Y-%m-%d"),
     location: str = "Zürich (ZH)",
     protocol: Optional[str] = None,
+    cache_dir: Optional[str] = None,
 ) -> pd.DataFrame:
     """
     Extract the sample ID of the samples from selected time period,
     location, and protocol. extract the date of the samples.
 
     Seelects sampled from 2022-07 to 2023-03 and location Zürich by default.
+    The timeline is parsed once per process, or once per change if a
+    cache directory is given, and queried by binary search.
 
     Args:
         timeline_file_dir (str): Path to the timeline file.
@@ -26,28 +39,143 @@ def extract_sample_ID(
         protocol (str): Sequencing protocol used.
                          eg. for filtering condition to take
                              only Artic v4.1 protocol: "v41"
+        cache_dir (str): Optional directory to share the parsed timeline
+                         between processes in, see load_timeline_index.
 
     Returns:
         pd.DataFrame: DataFrame containing the sample ID and date.
     """
-    timeline_file = pd.read_csv(
-        timeline_file_dir,
-        sep="\t",
-        usecols=["sample", "proto", "date", "location"],
-        encoding="utf-8",
-    )
-    # convert the "date" column to datetime type:
-    timeline_file["date"] = pd.to_datetime(timeline_file["date"])
-
-    selected_rows = timeline_file[
-        # TODO: remove subsample selection line below
-        # (according to samples.wastewateronly.ready.tsv)
-        (timeline_file["date"] > startdate.strftime("%Y-%m-%d"))
-        & (timeline_file["date"] < enddate.strftime("%Y-%m-%d"))
-        & (timeline_file["location"].isin([location]))
-    ]
-    if protocol is not None:
-        selected_rows = selected_rows[(timeline_file["proto"] == protocol)]
-
-    samples_ID = selected_rows[["sample", "date"]]
-    return samples_ID
+    index = load_timeline_index(timeline_file_dir, cache_dir)
+    return index.query(startdate, enddate, location, protocol)
+
+
+def to_position_array(positions: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Convert per-row coverage values into an array indexed by genome position.
+
+    Row ``i`` of the result holds the values of position ``i + 1``. Positions
+    missing from the input (not expected in V-pipe output) are filled with 0.
+
+    Args:
+        positions (np.ndarray): 1-based genome positions of the rows.
+        values (np.ndarray): Coverage values, one row per position.
+
+    Returns:
+        np.ndarray: uint32 array of the values indexed by position - 1.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    values = np.asarray(values, dtype=np.uint32)
+    length = int(positions.max()) if positions.size else 0
+    # V-pipe writes every position from 1 to the genome length in order
+    if positions.size == length and np.array_equal(positions, np.arange(1, length + 1)):
+        return values
+    dense = np.zeros((length,) + values.shape[1:], dtype=np.uint32)
+    dense[positions - 1] = values
+    return dense
+
+
+def gather_positions(
+    array: np.ndarray, positions: list, columns: Optional[list[int]] = None
+) -> np.ndarray:
+    """
+    Select the entries of a position-indexed array for the given positions.
+
+    Args:
+        array (np.ndarray): Array indexed by genome position - 1,
+                            see `to_position_array`.
+        positions (list): 1-based genome positions, as int or str.
+        columns (list[int]): Optional column to select for each position.
+
+    Returns:
+        np.ndarray: The selected rows, or entries if `columns` is given,
+                    in the order of `positions`.
+
+    Raises:
+        ValueError: If a position is not covered by the array.
+    """
+    index = np.asarray(positions, dtype=np.int64) - 1
+    out_of_range = (index < 0) | (index >= array.shape[0])
+    if out_of_range.any():
+        raise ValueError(
+            f"Position {index[out_of_range][0] + 1} not found in coverage data."
+        )
+    if columns is not None:
+        return np.asarray(array[index, np.asarray(columns, dtype=np.int64)])
+    return np.asarray(array[index])
+
+
+def stream_positions(
+    coverage_path: str,
+    positions: list,
+    usecols: list[int],
+    skiprows: int,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> np.ndarray:
+    """
+    Read only the rows of the given positions from a gzipped coverage file.
+
+    The gzip stream is parsed in chunks of `chunksize` rows and decompression
+    stops as soon as the largest requested position has been passed, so only
+    a single chunk is held in memory.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+        positions (list): 1-based genome positions, as int or str.
+        usecols (list[int]): Columns to read, the first one being the position.
+        skiprows (int): Number of header lines to skip.
+        chunksize (int): Number of rows to parse at a time.
+
+    Returns:
+        np.ndarray: uint32 array with one row per requested position and one
+                    column per value column of `usecols`.
+
+    Raises:
+        ValueError: If a position is not found in the coverage file.
+    """
+    wanted = np.asarray(positions, dtype=np.int64)
+    values = np.zeros((wanted.size, len(usecols) - 1), dtype=np.uint32)
+    found = np.zeros(wanted.size, dtype=bool)
+    if wanted.size == 0:
+        return values
+    max_position = wanted.max()
+    rows_parsed = 0
+
+    file: TextIO
+    prefetched = take_prefetched(coverage_path)
+    if prefetched is not None:
+        # already decompressed, only the parsing stops early
+        file = io.TextIOWrapper(io.BytesIO(prefetched[0]), encoding="utf-8")
+    else:
+        file = gzip.open(coverage_path, "rt")
+    with file:
+        with pd.read_csv(
+            file,
+            delimiter="\t",
+            usecols=usecols,
+            header=None,
+            skiprows=skiprows,
+            dtype=np.uint32,
+            chunksize=chunksize,
+        ) as reader:
+            for chunk in reader:
+                chunk_values = chunk.to_numpy()
+                rows_parsed += len(chunk_values)
+                chunk_positions = chunk_values[:, 0].astype(np.int64)
+                # positions are sorted within the file
+                rows = np.searchsorted(chunk_positions, wanted)
+                rows[rows == chunk_positions.size] = 0
+                hit = chunk_positions[rows] == wanted
+                values[hit] = chunk_values[rows[hit], 1:]
+                found |= hit
+                if chunk_positions[-1] >= max_position:
+                    # stop decompressing, the remaining rows are not needed
+                    break
+        if prefetched is not None:
+            offsets = prefetched[1], len(prefetched[0])
+        else:
+            offsets = gzip_offsets(file)
+        record_read(coverage_path, *offsets, rows_parsed)
+
+    if not found.all():
+        raise ValueError(f"Position {wanted[~found][0]} not found in coverage data.")
+    return values
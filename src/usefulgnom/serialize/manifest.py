@@ -0,0 +1,96 @@
+"""Implements the per-sample manifest stored next to a coverage matrix.
+
+The manifest records which file each sample column was computed from, so a
+rerun only needs to load new or changed samples. Rows of mutations already
+in the previous matrix are reused by name, as the coverage of a mutation
+does not depend on the rest of the mutation list.
+
+e.g. of a manifest (mut_base_coverage.csv.manifest.tsv):
+
+sample	batch	date	path	mtime_ns	size
+A1_05_2024_02_01	20240205_AAA	2024-02-01	.../basecnt.tsv.gz	1707...	5120
+
+"""
+
+import os
+from typing import Optional
+
+import pandas as pd
+
+MANIFEST_COLUMNS = ["sample", "batch", "date", "path", "mtime_ns", "size"]
+
+
+def manifest_path(output_file: str) -> str:
+    """
+    Path of the manifest belonging to an output matrix.
+
+    Args:
+        output_file (str): Path to the output matrix.
+
+    Returns:
+        str: Path to the manifest.
+    """
+    return f"{output_file}.manifest.tsv"
+
+
+def build_manifest(coverage_files: list[str], sample_IDs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Record the identity of the coverage files of the selected samples.
+
+    Args:
+        coverage_files (list[str]): Paths like
+            results/<sample>/<batch>/alignments/<file>.
+        sample_IDs (pd.DataFrame): Selected samples, see extract_sample_ID.
+
+    Returns:
+        pd.DataFrame: One row per (file, sample date).
+    """
+    dates = sample_IDs.groupby("sample")["date"].apply(list)
+    rows = []
+    for coverage_file in coverage_files:
+        parts = coverage_file.split("/")
+        stat = os.stat(coverage_file)
+        for date in dates.get(parts[-4], []):
+            rows.append(
+                (
+                    parts[-4],
+                    parts[-3],
+                    pd.Timestamp(date),
+                    coverage_file,
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                )
+            )
+    return pd.DataFrame(rows, columns=MANIFEST_COLUMNS)
+
+
+def read_manifest(output_file: str) -> Optional[pd.DataFrame]:
+    """
+    Read the manifest of an output matrix.
+
+    Args:
+        output_file (str): Path to the output matrix.
+
+    Returns:
+        pd.DataFrame: The manifest, or None if the matrix has none.
+    """
+    path = manifest_path(output_file)
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(
+        path,
+        sep="\t",
+        dtype={"sample": str, "batch": str, "path": str},
+        parse_dates=["date"],
+    )
+
+
+def write_manifest(manifest: pd.DataFrame, output_file: str) -> None:
+    """
+    Write the manifest of an output matrix next to it.
+
+    Args:
+        manifest (pd.DataFrame): The manifest, see build_manifest.
+        output_file (str): Path to the output matrix.
+    """
+    manifest.to_csv(manifest_path(output_file), sep="\t", index=False)
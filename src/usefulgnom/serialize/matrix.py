@@ -0,0 +1,360 @@
+"""Implements typed reading and writing of coverage and frequency matrices.
+
+The matrices (mutations x sample dates, samples x amplicons) are written as
+CSV for humans, or as Parquet or Arrow IPC for the pipeline-internal
+handoff, which keep the dtypes (uint32 counts, float32 frequencies, date
+columns) and let readers load only the columns and rows they need. The
+format follows the suffix of the path:
+
+    mut_base_coverage_<location>_<date>.csv       CSV
+    mut_base_coverage_<location>_<date>.parquet   Parquet, zstd compressed
+    mut_base_coverage_<location>_<date>.arrow     Arrow IPC (Feather v2)
+
+Parquet and Arrow need the optional pyarrow dependency
+(pip install usefulgnom[arrow]). Date columns are stored under their ISO date,
+e.g. "2024-07-03", and read back as a DatetimeIndex.
+"""
+
+import json
+import os
+from typing import Any, Optional
+
+import pandas as pd
+
+MATRIX_FORMATS = ["csv", "parquet", "arrow"]
+
+SUFFIXES = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+
+DEFAULT_COMPRESSION = "zstd"
+
+# schema metadata marking matrices whose columns are sample dates
+DATE_COLUMNS_KEY = b"usefulgnom.date_columns"
+
+
+def import_pyarrow() -> Any:
+    """Import pyarrow, with a hint on how to install it."""
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as error:
+        raise ImportError(
+            "Parquet and Arrow matrices require pyarrow, "
+            "install it with: pip install usefulgnom[arrow]"
+        ) from error
+    return pyarrow
+
+
+def matrix_format(path: str, file_format: Optional[str] = None) -> str:
+    """
+    Format of a matrix file, from its suffix unless given.
+
+    Args:
+        path (str): Path to the matrix file.
+        file_format (str): One of MATRIX_FORMATS, None to use the suffix.
+
+    Returns:
+        str: One of MATRIX_FORMATS, "csv" for unknown suffixes.
+
+    Raises:
+        ValueError: If `file_format` is not one of MATRIX_FORMATS.
+    """
+    if file_format is None:
+        return SUFFIXES.get(os.path.splitext(path)[1].lower(), "csv")
+    if file_format not in MATRIX_FORMATS:
+        raise ValueError(
+            f"Unknown matrix format {file_format}, expected one of {MATRIX_FORMATS}."
+        )
+    return file_format
+
+
+def matrix_suffix(file_format: str) -> str:
+    """
+    File suffix of a matrix format, e.g. ".parquet".
+
+    Args:
+        file_format (str): One of MATRIX_FORMATS.
+
+    Returns:
+        str: The suffix, with its dot.
+    """
+    return "." + matrix_format("", file_format)
+
+
+def date_labels(columns: pd.Index) -> Optional[list[str]]:
+    """ISO dates of date columns, None if the columns are not dates."""
+    if isinstance(columns, pd.DatetimeIndex):
+        return list(columns.strftime("%Y-%m-%d"))
+    return None
+
+
+def parse_date_columns(columns: pd.Index) -> pd.Index:
+    """Columns as a DatetimeIndex if they are all ISO dates, else unchanged."""
+    if len(columns) == 0 or isinstance(columns, pd.DatetimeIndex):
+        return columns
+    try:
+        return pd.DatetimeIndex(pd.to_datetime(columns, format="%Y-%m-%d"))
+    except (ValueError, TypeError):
+        return columns
+
+
+class MatrixWriter:
+    """
+    Writes a matrix in blocks of rows, e.g. a genome-scale frequency matrix.
+
+    All blocks need the same columns and dtypes. Parquet files get one row
+    group and Arrow files one record batch per block, CSV files the header
+    once, so the output is the same as writing the whole matrix at once.
+
+    Args:
+        path (str): Path to the matrix file.
+        file_format (str): One of MATRIX_FORMATS, default from the suffix.
+        index (bool): Whether to write the index, e.g. the mutations.
+        compression (str): Compression of Parquet and Arrow files, e.g.
+            "zstd" or "lz4", None for none (memory-mappable Arrow files).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_format: Optional[str] = None,
+        index: bool = True,
+        compression: Optional[str] = DEFAULT_COMPRESSION,
+    ):
+        self.path = path
+        self.file_format = matrix_format(path, file_format)
+        self.index = index
+        self.compression = compression
+        self._writer: Any = None
+        self._writer_schema: Any = None
+        self._sink: Any = None
+        self._file: Any = None
+        self._empty: Optional[pd.DataFrame] = None
+
+    def __enter__(self) -> "MatrixWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, block: pd.DataFrame) -> None:
+        """
+        Append a block of rows.
+
+        Args:
+            block (pd.DataFrame): Rows of the matrix.
+        """
+        if self.file_format == "csv":
+            if self._file is None:
+                self._file = open(self.path, "w", newline="")
+                block.to_csv(self._file, index=self.index)
+            else:
+                block.to_csv(self._file, index=self.index, header=False)
+            return
+
+        if len(block) == 0 and self._writer is None:
+            # an empty block only fixes the columns, its dtypes may be loose
+            self._empty = block
+            return
+        table = self._table(block)
+        if self._writer is None:
+            self._open(table.schema)
+        self._writer.write_table(table.cast(self._writer_schema))
+
+    def close(self) -> None:
+        """Finish the file, writing an empty matrix if no rows were written."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            return
+        if self.file_format != "csv" and self._writer is None:
+            if self._empty is None:
+                return
+            empty = self._table(self._empty)
+            self._open(empty.schema)
+            self._writer.write_table(empty)
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+
+    def _table(self, block: pd.DataFrame) -> Any:
+        """Convert a block to an Arrow table, with ISO date column names."""
+        pa = import_pyarrow()
+        labels = date_labels(block.columns)
+        if labels is not None:
+            block = block.set_axis(labels, axis=1)
+        table = pa.Table.from_pandas(block, preserve_index=self.index)
+        if labels is not None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[DATE_COLUMNS_KEY] = b"true"
+            table = table.replace_schema_metadata(metadata)
+        return table
+
+    def _open(self, schema: Any) -> None:
+        """Open the Parquet or Arrow writer of a schema."""
+        pa = import_pyarrow()
+        self._writer_schema = schema
+        if self.file_format == "parquet":
+            self._writer = pa.parquet.ParquetWriter(
+                self.path, schema, compression=self.compression or "none"
+            )
+        else:
+            self._sink = pa.OSFile(self.path, "wb")
+            self._writer = pa.ipc.new_file(
+                self._sink,
+                schema,
+                options=pa.ipc.IpcWriteOptions(compression=self.compression),
+            )
+
+
+def write_matrix(
+    matrix: pd.DataFrame,
+    path: str,
+    file_format: Optional[str] = None,
+    index: bool = True,
+    compression: Optional[str] = DEFAULT_COMPRESSION,
+) -> None:
+    """
+    Write a matrix as CSV, Parquet or Arrow IPC.
+
+    Args:
+        matrix (pd.DataFrame): The matrix, e.g. mutations x sample dates.
+        path (str): Path to the matrix file.
+        file_format (str): One of MATRIX_FORMATS, default from the suffix.
+        index (bool): Whether to write the index, e.g. the mutations.
+        compression (str): Compression of Parquet and Arrow files.
+    """
+    if matrix_format(path, file_format) == "csv":
+        matrix.to_csv(path, index=index)
+        return
+    with MatrixWriter(path, file_format, index, compression) as writer:
+        writer.write(matrix)
+
+
+def _schema(path: str, file_format: str) -> Any:
+    """Arrow schema of a Parquet or Arrow matrix file."""
+    pa = import_pyarrow()
+    if file_format == "parquet":
+        return pa.parquet.read_schema(path)
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema
+
+
+def _index_columns(schema: Any) -> list[str]:
+    """Names of the stored index columns of an Arrow schema."""
+    metadata = (schema.metadata or {}).get(b"pandas")
+    if metadata is None:
+        return []
+    return [
+        column
+        for column in json.loads(metadata)["index_columns"]
+        if isinstance(column, str)
+    ]
+
+
+def matrix_columns(path: str, file_format: Optional[str] = None) -> pd.Index:
+    """
+    Columns of a matrix file, without reading its values.
+
+    Args:
+        path (str): Path to the matrix file.
+        file_format (str): One of MATRIX_FORMATS, default from the suffix.
+
+    Returns:
+        pd.Index: The columns besides the index, a DatetimeIndex for dates.
+    """
+    file_format = matrix_format(path, file_format)
+    if file_format == "csv":
+        columns = pd.read_csv(path, index_col=0, nrows=0).columns
+        return parse_date_columns(columns)
+    schema = _schema(path, file_format)
+    index_columns = _index_columns(schema)
+    columns = pd.Index([name for name in schema.names if name not in index_columns])
+    if (schema.metadata or {}).get(DATE_COLUMNS_KEY):
+        return pd.DatetimeIndex(pd.to_datetime(columns, format="%Y-%m-%d"))
+    return columns
+
+
+def read_matrix(
+    path: str,
+    columns: Optional[list] = None,
+    rows: Optional[list] = None,
+    file_format: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Read a matrix file, optionally only some of its columns and rows.
+
+    Parquet and Arrow files only read the selected columns, Parquet files
+    also skip the row groups without selected rows; uncompressed Arrow
+    files are memory-mapped. Date columns are returned as a DatetimeIndex.
+
+    Args:
+        path (str): Path to the matrix file.
+        columns (list): Columns to read, e.g. dates as str or Timestamp,
+            default all.
+        rows (list): Index values to read, e.g. mutations, default all.
+        file_format (str): One of MATRIX_FORMATS, default from the suffix.
+
+    Returns:
+        pd.DataFrame: The matrix, rows and columns in file order.
+
+    Raises:
+        KeyError: If a selected column is not in the matrix.
+    """
+    file_format = matrix_format(path, file_format)
+    available = matrix_columns(path, file_format)
+    names = None
+    if columns is not None:
+        if isinstance(available, pd.DatetimeIndex):
+            wanted = pd.DatetimeIndex(pd.to_datetime(list(columns)))
+        else:
+            wanted = pd.Index([str(column) for column in columns])
+        missing = wanted.difference(available)
+        if len(missing):
+            raise KeyError(f"Columns {list(missing)} not in matrix {path}.")
+        selected = available[available.isin(wanted)]
+        names = date_labels(selected) or [str(column) for column in selected]
+
+    if file_format == "csv":
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = None if names is None else [header[0]] + names
+        matrix = pd.read_csv(path, index_col=0, usecols=usecols)
+        matrix.columns = parse_date_columns(matrix.columns)
+        if rows is not None:
+            matrix = matrix[matrix.index.isin(rows)]
+        return matrix
+
+    pa = import_pyarrow()
+    schema = _schema(path, file_format)
+    index_columns = _index_columns(schema)
+    read_columns = None if names is None else index_columns + names
+    if file_format == "parquet":
+        filters = None
+        if rows is not None and index_columns:
+            filters = [(index_columns[0], "in", list(rows))]
+        table = pa.parquet.read_table(path, columns=read_columns, filters=filters)
+    else:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        if read_columns is not None:
+            table = table.select(read_columns)
+        if rows is not None and index_columns:
+            mask = pa.compute.is_in(
+                table[index_columns[0]], value_set=pa.array(list(rows))
+            )
+            table = table.filter(mask)
+    matrix = table.to_pandas(split_blocks=True)
+    if (schema.metadata or {}).get(DATE_COLUMNS_KEY):
+        matrix.columns = pd.DatetimeIndex(
+            pd.to_datetime(matrix.columns, format="%Y-%m-%d")
+        )
+    return matrix
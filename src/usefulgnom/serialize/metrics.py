@@ -0,0 +1,188 @@
+"""Implements per-stage timing and I/O metrics of the coverage analyses.
+
+Stages (timeline parsing, locating files, loading, writing, ...) are timed
+by the analysis, the readers of the coverage files record what they
+decompressed and parsed. Per-sample records are collected in the process that loads the
+sample, so they also work with a process pool.
+
+e.g. of a metrics file (<log>.basecnt_coverage.metrics.json):
+
+    {
+      "stages": {"timeline": 0.1, "locate_files": 0.4, "load_samples": 402.7,
+                 ...},
+      "totals": {"samples": 812, "files_opened": 812, "compressed_bytes": ...,
+                 "uncompressed_bytes": ..., "rows_parsed": ...},
+      "slowest_samples": [{"path": ".../basecnt.tsv.gz", "seconds": 9.1, ...}]
+    }
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, TextIO
+
+# reads recorded by the readers while a sample is being measured
+_reads: Optional[list[dict]] = None
+
+
+@contextmanager
+def collect_reads() -> Iterator[list[dict]]:
+    """
+    Collect the reads recorded by the coverage file readers.
+
+    Yields:
+        list[dict]: Filled with one record per file read, see record_read.
+    """
+    global _reads
+    outer, _reads = _reads, []
+    try:
+        yield _reads
+    finally:
+        _reads = outer
+
+
+def gzip_offsets(file: TextIO) -> tuple[int, int]:
+    """
+    Compressed and uncompressed bytes consumed so far from a gzip text stream.
+
+    Args:
+        file (TextIO): The text stream of gzip.open, before closing it.
+
+    Returns:
+        tuple[int, int]: Compressed and uncompressed bytes.
+    """
+    gzip_file = file.buffer  # type: ignore[attr-defined]
+    return gzip_file.fileobj.tell(), gzip_file.tell()
+
+
+def record_read(
+    coverage_path: str, compressed_bytes: int, uncompressed_bytes: int, rows: int
+) -> None:
+    """
+    Record a read of a gzipped coverage file, if reads are being collected.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+        compressed_bytes (int): Bytes read from the file.
+        uncompressed_bytes (int): Bytes decompressed.
+        rows (int): Number of rows parsed.
+    """
+    if _reads is None:
+        return
+    _reads.append(
+        {
+            "path": coverage_path,
+            "compressed_bytes": compressed_bytes,
+            "uncompressed_bytes": uncompressed_bytes,
+            "rows": rows,
+        }
+    )
+
+
+class MeasuredLoader:
+    """
+    Wraps a sample loader to also return the timing and reads of each call.
+
+    Picklable if the wrapped loader is, so it can be sent to a process pool.
+
+    Args:
+        loader (Callable): Function loading one coverage file.
+    """
+
+    def __init__(self, loader: Callable[[str], Any]):
+        self.loader = loader
+
+    def __call__(self, coverage_path: str) -> tuple[Any, dict]:
+        """Load a sample, return the result and its record."""
+        with collect_reads() as reads:
+            start = time.perf_counter()
+            result = self.loader(coverage_path)
+            seconds = time.perf_counter() - start
+        return result, {"path": coverage_path, "seconds": seconds, "reads": reads}
+
+
+class Metrics:
+    """
+    Sink of the stage durations and per-sample records of an analysis.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+        self.samples: list[dict] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a stage, durations of repeated stages add up.
+
+        Args:
+            name (str): Name of the stage, e.g. "timeline".
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add_samples(self, records: list[dict]) -> None:
+        """
+        Add per-sample records, see MeasuredLoader.
+
+        Args:
+            records (list[dict]): The records of the loaded samples.
+        """
+        self.samples.extend(records)
+
+    def summary(self, slowest: int = 10) -> dict:
+        """
+        Summarize the metrics.
+
+        Args:
+            slowest (int): Number of slowest samples to list.
+
+        Returns:
+            dict: Stage durations, I/O totals and the slowest samples.
+        """
+        reads = [read for sample in self.samples for read in sample["reads"]]
+        samples = []
+        for sample in self.samples:
+            samples.append(
+                {
+                    "path": sample["path"],
+                    "seconds": round(sample["seconds"], 6),
+                    "files_opened": len(sample["reads"]),
+                    "compressed_bytes": sum(
+                        read["compressed_bytes"] for read in sample["reads"]
+                    ),
+                    "uncompressed_bytes": sum(
+                        read["uncompressed_bytes"] for read in sample["reads"]
+                    ),
+                    "rows_parsed": sum(read["rows"] for read in sample["reads"]),
+                }
+            )
+        samples.sort(key=lambda sample: sample["seconds"], reverse=True)
+        return {
+            "stages": {name: round(value, 6) for name, value in self.stages.items()},
+            "totals": {
+                "samples": len(self.samples),
+                "sample_seconds": round(
+                    sum(sample["seconds"] for sample in self.samples), 6
+                ),
+                "files_opened": len(reads),
+                "compressed_bytes": sum(read["compressed_bytes"] for read in reads),
+                "uncompressed_bytes": sum(read["uncompressed_bytes"] for read in reads),
+                "rows_parsed": sum(read["rows"] for read in reads),
+            },
+            "slowest_samples": samples[:slowest],
+        }
+
+    def write(self, output_file: str, slowest: int = 10) -> None:
+        """
+        Write the summary as JSON.
+
+        Args:
+            output_file (str): Path to the metrics file.
+            slowest (int): Number of slowest samples to list.
+        """
+        with open(output_file, "w") as file:
+            json.dump(self.summary(slowest), file, indent=2)
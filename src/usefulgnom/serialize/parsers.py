@@ -0,0 +1,289 @@
+"""Implements the parser backends of the gzipped coverage files.
+
+All backends read the integer columns of a V-pipe coverage file (e.g.
+basecnt.tsv.gz, coverage.tsv.gz) below its header lines into a uint32 array
+with one row per line and one column per requested column:
+
+    - "pandas": pandas' C parser on the decoded text stream (default).
+    - "pyarrow": pyarrow's CSV reader, requires the optional pyarrow
+      dependency (pip install usefulgnom[arrow]).
+    - "numpy": byte-level parser on the decompressed bytes, no text decoding.
+    - "compare": runs all available backends, checks they agree and returns
+      the values they agree on.
+
+Files fetched ahead by usefulgnom.serialize.prefetch are parsed from memory.
+"""
+
+import gzip
+import io
+import time
+import warnings
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from usefulgnom.serialize.metrics import gzip_offsets, record_read
+from usefulgnom.serialize.prefetch import (
+    put_prefetched,
+    read_decompressed,
+    take_prefetched,
+)
+
+PARSERS = ["pandas", "pyarrow", "numpy", "compare"]
+
+DEFAULT_PARSER = "pandas"
+
+TAB, NEWLINE, SPACE = ord("\t"), ord("\n"), ord(" ")
+
+
+def parse_pandas(
+    coverage_path: str, usecols: list[int], skiprows: int
+) -> tuple[np.ndarray, int, int]:
+    """Parse with pandas, return the values, compressed and uncompressed bytes."""
+    options = dict(
+        delimiter="\t", usecols=usecols, header=None, skiprows=skiprows, dtype=np.uint32
+    )
+    prefetched = take_prefetched(coverage_path)
+    if prefetched is not None:
+        data, compressed_bytes = prefetched
+        df = pd.read_csv(io.BytesIO(data), **options)
+        return df[usecols].to_numpy(), compressed_bytes, len(data)
+
+    with gzip.open(coverage_path, "rt") as file:
+        df = pd.read_csv(file, **options)
+        compressed_bytes, uncompressed_bytes = gzip_offsets(file)
+    return df[usecols].to_numpy(), compressed_bytes, uncompressed_bytes
+
+
+def parse_pyarrow(
+    coverage_path: str, usecols: list[int], skiprows: int
+) -> tuple[np.ndarray, int, int]:
+    """Parse with pyarrow, return the values, compressed and uncompressed bytes."""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError as error:
+        raise ImportError(
+            "The pyarrow parser requires pyarrow, "
+            "install it with: pip install usefulgnom[arrow]"
+        ) from error
+
+    data, compressed_bytes = read_decompressed(coverage_path)
+    names = [f"f{column}" for column in usecols]
+    table = pa_csv.read_csv(
+        pa.BufferReader(data),
+        read_options=pa_csv.ReadOptions(
+            skip_rows=skiprows, autogenerate_column_names=True, use_threads=False
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter="\t"),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=names,
+            column_types={name: pa.uint32() for name in names},
+        ),
+    )
+    values = np.empty((table.num_rows, len(usecols)), dtype=np.uint32)
+    for i, name in enumerate(names):
+        values[:, i] = table.column(name).to_numpy()
+    return values, compressed_bytes, len(data)
+
+
+def parse_numpy_bytes(data: bytes, usecols: list[int], skiprows: int) -> np.ndarray:
+    """
+    Parse tab separated unsigned integer columns from raw bytes.
+
+    The bytes of the columns not requested (e.g. the reference name) are
+    blanked out and the remaining numbers parsed in one go by numpy.
+
+    Args:
+        data (bytes): Decompressed content of the file.
+        usecols (list[int]): Columns to read, all holding unsigned integers.
+        skiprows (int): Number of header lines to skip.
+
+    Returns:
+        np.ndarray: uint32 array of shape (lines, len(usecols)).
+
+    Raises:
+        ValueError: If the lines have differing numbers of columns, or a
+            requested field is empty, not a number or does not fit uint32.
+    """
+    start = 0
+    for _ in range(skiprows):
+        start = data.find(b"\n", start) + 1
+        if start == 0:
+            return np.zeros((0, len(usecols)), dtype=np.uint32)
+    body = np.frombuffer(data, dtype=np.uint8)[start:]
+    if body.size and body[-1] != NEWLINE:
+        body = np.append(body, np.uint8(NEWLINE))
+    if body.size == 0:
+        return np.zeros((0, len(usecols)), dtype=np.uint32)
+
+    # every field ends with a tab or a newline
+    field_ends = np.flatnonzero((body == TAB) | (body == NEWLINE))
+    n_columns = int(np.argmax(body[field_ends] == NEWLINE)) + 1
+    if (
+        field_ends.size % n_columns
+        or not (body[field_ends[n_columns - 1 :: n_columns]] == NEWLINE).all()
+    ):
+        raise ValueError("Lines of the coverage file differ in number of columns.")
+    fields = field_ends.reshape(-1, n_columns)
+    n_rows = fields.shape[0]
+
+    # blank out the fields of the columns that are not read
+    columns = sorted(set(usecols))
+    blank = np.zeros(body.size + 1, dtype=np.int8)
+    for column in range(n_columns):
+        if column in columns:
+            continue
+        if column == 0:
+            starts = np.concatenate([[0], fields[:-1, -1] + 1])
+        else:
+            starts = fields[:, column - 1] + 1
+        blank[starts] += 1
+        blank[fields[:, column]] -= 1
+    cleaned = body.copy()
+    cleaned[np.cumsum(blank[:-1], dtype=np.int8).view(bool)] = SPACE
+
+    with warnings.catch_warnings():
+        # older numpy ends the parse early at a malformed number with a
+        # warning, newer numpy raises; both are reported alike
+        warnings.simplefilter("ignore", DeprecationWarning)
+        try:
+            values = np.fromstring(cleaned.tobytes(), dtype=np.int64, sep=" ")
+        except ValueError:
+            values = np.empty(0, dtype=np.int64)
+    if values.size != n_rows * len(columns):
+        raise ValueError("Coverage file holds an empty field or a non-number count.")
+    if values.size and (values.min() < 0 or values.max() > np.iinfo(np.uint32).max):
+        raise ValueError("Coverage file holds a count that does not fit uint32.")
+    values = values.reshape(n_rows, len(columns))
+    return values[:, [columns.index(column) for column in usecols]].astype(np.uint32)
+
+
+def parse_numpy(
+    coverage_path: str, usecols: list[int], skiprows: int
+) -> tuple[np.ndarray, int, int]:
+    """Parse with numpy, return the values, compressed and uncompressed bytes."""
+    data, compressed_bytes = read_decompressed(coverage_path)
+    return parse_numpy_bytes(data, usecols, skiprows), compressed_bytes, len(data)
+
+
+BACKENDS = {
+    "pandas": parse_pandas,
+    "pyarrow": parse_pyarrow,
+    "numpy": parse_numpy,
+}
+
+
+def available_parsers() -> list[str]:
+    """
+    List the parser backends usable in this environment.
+
+    Returns:
+        list[str]: Names of the backends, "pyarrow" only if it is installed.
+    """
+    try:
+        import pyarrow.csv  # noqa: F401
+    except ImportError:
+        return ["pandas", "numpy"]
+    return ["pandas", "pyarrow", "numpy"]
+
+
+def read_columns(
+    coverage_path: str,
+    usecols: list[int],
+    skiprows: int,
+    parser: str = DEFAULT_PARSER,
+) -> np.ndarray:
+    """
+    Read integer columns of a gzipped coverage file.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+        usecols (list[int]): Columns to read, all holding unsigned integers.
+        skiprows (int): Number of header lines to skip.
+        parser (str): Parser backend, one of PARSERS.
+
+    Returns:
+        np.ndarray: uint32 array of shape (lines, len(usecols)).
+
+    Raises:
+        ValueError: If the parser is unknown, or with "compare" if two
+            backends disagree.
+    """
+    if parser == "compare":
+        values, compressed_bytes, uncompressed_bytes, _ = compare_parsers(
+            coverage_path, usecols, skiprows
+        )
+    elif parser in BACKENDS:
+        values, compressed_bytes, uncompressed_bytes = BACKENDS[parser](
+            coverage_path, usecols, skiprows
+        )
+    else:
+        raise ValueError(f"Unknown parser {parser}, expected one of {PARSERS}.")
+    record_read(coverage_path, compressed_bytes, uncompressed_bytes, len(values))
+    return values
+
+
+def compare_parsers(
+    coverage_path: str,
+    usecols: list[int],
+    skiprows: int,
+    parsers: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    """
+    Run parser backends on a file, check they agree and time them.
+
+    A file fetched ahead by usefulgnom.serialize.prefetch is parsed from
+    memory by every backend, otherwise each backend reads it.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+        usecols (list[int]): Columns to read, all holding unsigned integers.
+        skiprows (int): Number of header lines to skip.
+        parsers (list[str]): Backends to compare, default all available ones.
+
+    Returns:
+        tuple[np.ndarray, int, int, pd.DataFrame]: The values the backends
+            agree on, the compressed and uncompressed bytes of all their
+            reads, and the seconds taken by each backend, fastest first.
+
+    Raises:
+        ValueError: If a backend returns different values, shape or dtype
+            than the first one.
+    """
+    if parsers is None:
+        parsers = available_parsers()
+    prefetched = take_prefetched(coverage_path)
+    reference = None
+    seconds = {}
+    compressed_bytes = uncompressed_bytes = 0
+    for parser in parsers:
+        if prefetched is not None:
+            put_prefetched(coverage_path, prefetched)
+        start = time.perf_counter()
+        values, compressed, uncompressed = BACKENDS[parser](
+            coverage_path, usecols, skiprows
+        )
+        seconds[parser] = time.perf_counter() - start
+        if prefetched is None:
+            compressed_bytes += compressed
+            uncompressed_bytes += uncompressed
+        if reference is None:
+            reference = (parser, values)
+        elif values.dtype != reference[1].dtype or not np.array_equal(
+            values, reference[1]
+        ):
+            raise ValueError(
+                f"Parsers {reference[0]} and {parser} disagree on {coverage_path}."
+            )
+    if prefetched is not None:
+        # read and decompressed once, by the prefetch thread
+        compressed_bytes, uncompressed_bytes = prefetched[1], len(prefetched[0])
+    assert reference is not None
+    timings = (
+        pd.DataFrame({"parser": list(seconds), "seconds": list(seconds.values())})
+        .sort_values("seconds")
+        .reset_index(drop=True)
+    )
+    return reference[1], compressed_bytes, uncompressed_bytes, timings
@@ -0,0 +1,144 @@
+"""Implements prefetching of the coverage files on background threads.
+
+Loading a sample alternates waiting for the (network) filesystem, inflating
+the gzip stream and parsing the text. Reading and inflating release the GIL,
+so a few threads can fetch the next samples while the current one is parsed,
+which overlaps most of the I/O without spawning processes:
+
+    for path in prefetch(coverage_files, n_threads=2):
+        counts = read_basecnt_array(path)  # parses the prefetched bytes
+
+At most `depth` samples are fetched ahead, so the memory held is bounded by
+a few decompressed files. The parsers pick up the prefetched content of a
+file with read_decompressed, anything not prefetched is read as usual.
+"""
+
+import gzip
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+# decompressed content and compressed size of the files of the sample being
+# loaded, handed over by the prefetch threads
+_prefetched: dict[str, tuple[bytes, int]] = {}
+
+
+def read_gzip(coverage_path: str) -> tuple[bytes, int]:
+    """
+    Read and decompress a whole gzipped file.
+
+    Args:
+        coverage_path (str): Path to the gzipped file.
+
+    Returns:
+        tuple[bytes, int]: The decompressed content and the compressed size.
+    """
+    with open(coverage_path, "rb") as file:
+        compressed = file.read()
+    return gzip.decompress(compressed), len(compressed)
+
+
+def take_prefetched(coverage_path: str) -> Optional[tuple[bytes, int]]:
+    """
+    Take the prefetched content of a file, if it was prefetched.
+
+    Args:
+        coverage_path (str): Path to the gzipped file.
+
+    Returns:
+        tuple[bytes, int]: The decompressed content and the compressed size,
+            None if the file was not prefetched.
+    """
+    return _prefetched.pop(coverage_path, None)
+
+
+def put_prefetched(coverage_path: str, content: tuple[bytes, int]) -> None:
+    """
+    Hand the content of a file to its next reader, as if it was prefetched.
+
+    Args:
+        coverage_path (str): Path to the gzipped file.
+        content (tuple[bytes, int]): The decompressed content and the
+            compressed size, see read_gzip.
+    """
+    _prefetched[coverage_path] = content
+
+
+def read_decompressed(coverage_path: str) -> tuple[bytes, int]:
+    """
+    Decompressed content of a gzipped file, prefetched or read now.
+
+    Args:
+        coverage_path (str): Path to the gzipped file.
+
+    Returns:
+        tuple[bytes, int]: The decompressed content and the compressed size.
+    """
+    prefetched = take_prefetched(coverage_path)
+    if prefetched is not None:
+        return prefetched
+    return read_gzip(coverage_path)
+
+
+def prefetch(
+    paths: list[str],
+    n_threads: int = 2,
+    depth: Optional[int] = None,
+    sample_files: Optional[Callable[[str], list[str]]] = None,
+) -> Iterator[str]:
+    """
+    Iterate over samples while threads decompress the files of the next ones.
+
+    The files of each yielded sample are available to read_decompressed
+    until the iteration resumes. A file that fails to prefetch is left to
+    its reader, which then reports the error as without prefetching.
+
+    Args:
+        paths (list[str]): Paths of the samples, e.g. their coverage files.
+        n_threads (int): Number of prefetch threads.
+        depth (int): Maximum number of samples fetched ahead of the one being
+            loaded, default is twice the number of threads.
+        sample_files (Callable): Gzipped files read when loading a sample,
+            default is the sample path itself.
+
+    Yields:
+        str: The paths, in order.
+
+    Raises:
+        ValueError: If n_threads or depth is below 1.
+    """
+    if depth is None:
+        depth = 2 * n_threads
+    if n_threads < 1 or depth < 1:
+        raise ValueError(f"Cannot prefetch with {n_threads} threads, depth {depth}.")
+
+    remaining = iter(paths)
+    pending: deque[tuple[str, list[tuple[str, Future]]]] = deque()
+    with ThreadPoolExecutor(n_threads, thread_name_prefix="prefetch") as executor:
+        try:
+            while True:
+                # backpressure: stop submitting once depth samples are ahead
+                for path in remaining:
+                    files = [
+                        (file, executor.submit(read_gzip, file))
+                        for file in (sample_files(path) if sample_files else [path])
+                    ]
+                    pending.append((path, files))
+                    if len(pending) > depth:
+                        break
+                if not pending:
+                    return
+                path, files = pending.popleft()
+                for file, future in files:
+                    # on errors the reader reads the file again and raises
+                    if future.exception() is None:
+                        _prefetched[file] = future.result()
+                try:
+                    yield path
+                finally:
+                    for file, _ in files:
+                        _prefetched.pop(file, None)
+        finally:
+            for _, files in pending:
+                for _, future in files:
+                    future.cancel()
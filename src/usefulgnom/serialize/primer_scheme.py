@@ -0,0 +1,216 @@
+"""Implements loading and compiling primer schemes of amplicon protocols.
+
+A primer scheme is compiled once from its bed file into the amplicon table
+and the index arrays of the query windows used for the amplicon medians.
+Compiled schemes are cached on disk keyed by the content hash of the bed
+file, so later batch runs skip parsing the bed file.
+
+e.g. of primer bed file (ARTIC V3):
+
+MN908947.3	30	54	nCoV-2019_1_LEFT	nCoV-2019_1	+
+MN908947.3	385	410	nCoV-2019_1_RIGHT	nCoV-2019_1	-
+MN908947.3	320	342	nCoV-2019_2_LEFT	nCoV-2019_2	+
+
+Credits:
+    - core code: @dr-david (drdavid@student.ethz.ch)
+    - implementation: @koehng (koehng@ethz.ch)
+"""
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+AMPLICON_COLUMNS = [
+    "pool",
+    "primer_num",
+    "primer_start",
+    "seq_start",
+    "seq_end",
+    "primer_end",
+    "query_start",
+    "query_end",
+]
+
+# bump when the compiled layout changes, invalidates cached schemes
+SCHEME_FORMAT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class PrimerScheme:
+    """
+    Compiled primer scheme.
+
+    Attributes:
+        amplicons (pd.DataFrame): One row per amplicon, see make_amplicons_df.
+        index (np.ndarray): Coverage rows each amplicon median is taken over,
+            of shape (amplicons, width), see amplicon_windows.
+        valid (np.ndarray): Mask of the valid entries of `index`.
+    """
+
+    amplicons: pd.DataFrame
+    index: np.ndarray
+    valid: np.ndarray
+
+
+def load_bedfile(bed: Path) -> pd.DataFrame:
+    """
+    Load bedfile and parse it.
+
+    Args:
+        bed: Path to the bedfile.
+
+    Returns:
+        pd.DataFrame: DataFrame with parsed bedfile.
+    """
+    bedfile = pd.read_table(bed, header=None)
+
+    # Vectorized regex extraction, NaN if not found
+    names = bedfile[3].astype(str)
+    bedfile["sense"] = names.str.extract("(LEFT|RIGHT)", expand=False)
+    bedfile["primer_num"] = names.str.extract("_([0-9]+)_", expand=False).astype(float)
+    bedfile["pool"] = (
+        bedfile[4].astype(str).str.extract("([1-2])$", expand=False).astype(float)
+    )
+
+    # Filter rows where 'alt' is not in column 3
+    bedfile = bedfile[~names.str.contains("alt", regex=False)]
+
+    return bedfile
+
+
+def make_amplicons_df(bedfile: pd.DataFrame) -> pd.DataFrame:
+    """
+    From primer info in bedfile create a dataframe with amplicon info.
+
+    Args:
+        bedfile: DataFrame with parsed bedfile.
+
+    Returns:
+        pd.DataFrame: DataFrame with amplicon info.
+    """
+    # first LEFT and RIGHT primer of each amplicon
+    left = bedfile[bedfile["sense"] == "LEFT"].groupby("primer_num")[[1, 2]].first()
+    right = bedfile[bedfile["sense"] == "RIGHT"].groupby("primer_num")[[1, 2]].first()
+    # pool of the second primer of each amplicon
+    second = bedfile[bedfile.groupby("primer_num").cumcount() == 1]
+    pool = second.set_index("primer_num")["pool"]
+
+    primer_num = left.index
+    amplicons_df = pd.DataFrame(
+        {
+            "pool": pool.reindex(primer_num).to_numpy(),
+            "primer_num": primer_num.to_numpy(),
+            "primer_start": left[1].to_numpy(),
+            "seq_start": left[2].to_numpy(),
+            "seq_end": right[1].reindex(primer_num).to_numpy(),
+            "primer_end": right[2].reindex(primer_num).to_numpy(),
+        },
+        dtype=float,
+    )
+
+    # query windows lie between the primers of the neighbouring amplicons
+    query_start = amplicons_df["primer_end"].shift(1) + 5
+    query_start.iloc[0] = amplicons_df["primer_start"].iloc[0]
+    query_end = amplicons_df["primer_start"].shift(-1) - 5
+    query_end.iloc[-1] = amplicons_df["seq_end"].iloc[-1]
+    amplicons_df["query_start"] = query_start
+    amplicons_df["query_end"] = query_end
+    return amplicons_df
+
+
+def amplicon_windows(
+    amplicons_df: pd.DataFrame, length: int = 20
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Precompute the coverage rows each amplicon median is taken over.
+
+    Windows are built as
+    ``np.r_[query_start:length, (query_end - length):query_end]`` and padded
+    to a common width.
+
+    Args:
+        amplicons_df: DataFrame with amplicon info, see make_amplicons_df.
+        length: Number of positions at the end of the amplicon query window.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Row index matrix of shape
+            (amplicons, width) and the mask of its valid entries.
+    """
+    windows = [
+        np.r_[int(start) : length, (int(stop) - length) : int(stop)]
+        for start, stop in zip(amplicons_df["query_start"], amplicons_df["query_end"])
+    ]
+    width = max(len(window) for window in windows)
+    index = np.zeros((len(windows), width), dtype=np.int64)
+    valid = np.zeros((len(windows), width), dtype=bool)
+    for i, window in enumerate(windows):
+        index[i, : len(window)] = window
+        valid[i, : len(window)] = True
+    return index, valid
+
+
+def compile_primer_scheme(bed: Path, length: int = 20) -> PrimerScheme:
+    """
+    Compile a primer scheme from its bed file.
+
+    Args:
+        bed: Path to the bedfile.
+        length: Number of positions at the end of the amplicon query window.
+
+    Returns:
+        PrimerScheme: The compiled scheme.
+    """
+    amplicons_df = make_amplicons_df(load_bedfile(bed))
+    index, valid = amplicon_windows(amplicons_df, length)
+    return PrimerScheme(amplicons_df, index, valid)
+
+
+def load_primer_scheme(
+    bed: Path, cache_dir: Optional[str] = None, length: int = 20
+) -> PrimerScheme:
+    """
+    Load a compiled primer scheme, compiling and caching it on first use.
+
+    Args:
+        bed: Path to the bedfile.
+        cache_dir: Optional directory of compiled schemes, keyed by the
+            content hash of the bed file.
+        length: Number of positions at the end of the amplicon query window.
+
+    Returns:
+        PrimerScheme: The compiled scheme.
+    """
+    if cache_dir is None:
+        return compile_primer_scheme(bed, length)
+
+    with open(bed, "rb") as file:
+        digest = hashlib.sha256(file.read()).hexdigest()
+    entry = Path(cache_dir) / f"{digest}_{length}_v{SCHEME_FORMAT_VERSION}.npz"
+    if entry.exists():
+        with np.load(entry) as compiled:
+            amplicons_df = pd.DataFrame(compiled["amplicons"], columns=AMPLICON_COLUMNS)
+            return PrimerScheme(amplicons_df, compiled["index"], compiled["valid"])
+
+    scheme = compile_primer_scheme(bed, length)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    # write atomically, concurrent batch runs may share the cache directory
+    fd, tmp_path = tempfile.mkstemp(dir=entry.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            np.savez(
+                file,
+                amplicons=scheme.amplicons[AMPLICON_COLUMNS].to_numpy(dtype=float),
+                index=scheme.index,
+                valid=scheme.valid,
+            )
+        os.replace(tmp_path, entry)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return scheme
@@ -0,0 +1,252 @@
+"""Implements an indexed, cached lookup of V-pipe timeline files.
+
+The timeline.tsv lists every sample with its location, protocol and date
+and grows every week. Instead of parsing it for every query, it is parsed
+once into an index sorted by (location, protocol, date), which answers
+date-range queries by binary search. The index is kept in memory for the
+process and optionally stored as .npz, keyed by the path, modification time
+and size of the timeline, so parallel jobs share one parse.
+
+e.g. of a cache directory:
+
+    cache_dir/
+        timeline-5d2a...c1-91ab...07_v1.npz
+"""
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+TIMELINE_FORMAT_VERSION = 2
+
+TIMELINE_COLUMNS = ["sample", "proto", "date", "location"]
+
+# indexes already loaded by this process, keyed by the timeline identity
+_loaded: dict[str, "TimelineIndex"] = {}
+
+
+@dataclass(frozen=True)
+class TimelineIndex:
+    """
+    Samples of a timeline sorted by location, protocol and date.
+
+    Attributes:
+        locations: Locations of the timeline, codes index into them.
+        protocols: Protocols of the timeline, codes index into them.
+        groups: Sorted group of each sample, location code times
+            (len(protocols) + 1) plus protocol code + 1 (0 if missing).
+        dates: datetime64 dates of the samples, sorted within a group.
+        samples: Sample names.
+        batches: Sequencing batch of each sample, empty if the timeline
+            has no batch column.
+        rows: Row of each sample in the timeline file, 0-based.
+    """
+
+    locations: np.ndarray
+    protocols: np.ndarray
+    groups: np.ndarray
+    dates: np.ndarray
+    samples: np.ndarray
+    batches: np.ndarray
+    rows: np.ndarray
+
+    @classmethod
+    def from_tsv(cls, timeline_file: str) -> "TimelineIndex":
+        """
+        Parse a timeline file into an index.
+
+        Samples without location or date never match a query and are left out.
+
+        Args:
+            timeline_file (str): Path to the timeline file.
+
+        Returns:
+            TimelineIndex: The index of the timeline.
+
+        Raises:
+            ValueError: If a column of TIMELINE_COLUMNS is missing.
+        """
+        timeline = pd.read_csv(
+            timeline_file,
+            sep="\t",
+            usecols=lambda column: column in TIMELINE_COLUMNS + ["batch"],
+            dtype={"sample": str, "batch": str},
+            encoding="utf-8",
+        )
+        missing = [column for column in TIMELINE_COLUMNS if column not in timeline]
+        if missing:
+            raise ValueError(f"Timeline {timeline_file} lacks the columns {missing}.")
+        dates = pd.to_datetime(timeline["date"])
+        locations = pd.Categorical(timeline["location"])
+        protocols = pd.Categorical(timeline["proto"])
+
+        keep = (locations.codes >= 0) & dates.notna().to_numpy()
+        groups = locations.codes.astype(np.int64) * (len(protocols.categories) + 1)
+        groups += protocols.codes.astype(np.int64) + 1
+        dates = dates.to_numpy()
+        rows = np.flatnonzero(keep)
+        order = rows[np.lexsort((dates[rows], groups[rows]))]
+        return cls(
+            locations=np.asarray(locations.categories, dtype=str),
+            protocols=np.asarray(protocols.categories, dtype=str),
+            groups=groups[order],
+            dates=dates[order],
+            samples=timeline["sample"].to_numpy(dtype=str)[order],
+            batches=(
+                timeline["batch"].to_numpy(dtype=str)[order]
+                if "batch" in timeline
+                else np.empty(0, dtype=str)
+            ),
+            rows=order.astype(np.int64),
+        )
+
+    def query(
+        self,
+        startdate: datetime,
+        enddate: datetime,
+        location: str,
+        protocol: Optional[str] = None,
+        batch: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Select the samples of a location and protocol between two dates.
+
+        Both dates are exclusive and compared by day, as extract_sample_ID.
+
+        Args:
+            startdate (datetime): Start date of the time period.
+            enddate (datetime): End date of the time period.
+            location (str): Location of the samples.
+            protocol (str): Sequencing protocol used, None for all.
+            batch (bool): Also return the batch of the samples, if the
+                timeline has a batch column.
+
+        Returns:
+            pd.DataFrame: Columns [sample, date] (and batch) of the selected
+                samples, in the order and with the row numbers of the timeline
+                file.
+        """
+        start = np.datetime64(startdate.strftime("%Y-%m-%d"))
+        end = np.datetime64(enddate.strftime("%Y-%m-%d"))
+
+        selected = []
+        location_code = np.searchsorted(self.locations, location)
+        if (
+            location_code < len(self.locations)
+            and self.locations[location_code] == location
+        ):
+            if protocol is None:
+                protocol_codes = range(-1, len(self.protocols))
+            else:
+                code = int(np.searchsorted(self.protocols, protocol))
+                found = code < len(self.protocols) and self.protocols[code] == protocol
+                protocol_codes = [code] if found else []
+            for protocol_code in protocol_codes:
+                group = location_code * (len(self.protocols) + 1) + protocol_code + 1
+                first, last = np.searchsorted(self.groups, [group, group + 1])
+                dates = self.dates[first:last]
+                # exclusive on both ends
+                low = first + np.searchsorted(dates, start, side="right")
+                high = first + np.searchsorted(dates, end, side="left")
+                selected.append(np.arange(low, max(low, high)))
+
+        positions = np.concatenate(selected) if selected else np.empty(0, np.int64)
+        positions = positions[np.argsort(self.rows[positions], kind="stable")]
+        columns = {"sample": self.samples[positions], "date": self.dates[positions]}
+        if batch and len(self.batches) == len(self.samples):
+            columns["batch"] = self.batches[positions]
+        return pd.DataFrame(columns, index=pd.Index(self.rows[positions]))
+
+    def save(self, path: str) -> None:
+        """
+        Write the index as .npz, atomically.
+
+        Args:
+            path (str): Path to the index file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez(
+                    file,
+                    locations=self.locations,
+                    protocols=self.protocols,
+                    groups=self.groups,
+                    dates=self.dates,
+                    samples=self.samples,
+                    batches=self.batches,
+                    rows=self.rows,
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "TimelineIndex":
+        """
+        Read an index written by `save`.
+
+        Args:
+            path (str): Path to the index file.
+
+        Returns:
+            TimelineIndex: The index.
+        """
+        with np.load(path) as stored:
+            return cls(**{name: stored[name] for name in stored.files})
+
+
+def load_timeline_index(
+    timeline_file: str, cache_dir: Optional[str] = None
+) -> TimelineIndex:
+    """
+    Load the index of a timeline file, parsing it only if it changed.
+
+    Args:
+        timeline_file (str): Path to the timeline file.
+        cache_dir (str): Optional directory to share the index between
+            processes in; older indexes of the same timeline are removed.
+
+    Returns:
+        TimelineIndex: The index of the timeline.
+    """
+    path = os.path.abspath(timeline_file)
+    stat = os.stat(path)
+    identity = f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+    if identity in _loaded:
+        return _loaded[identity]
+
+    if cache_dir is None:
+        index = TimelineIndex.from_tsv(timeline_file)
+    else:
+        path_digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()
+        entry = (
+            Path(cache_dir)
+            / f"timeline-{path_digest}-{digest}_v{TIMELINE_FORMAT_VERSION}.npz"
+        )
+        try:
+            index = TimelineIndex.load(str(entry))
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            # missing or truncated entry: parse again
+            index = TimelineIndex.from_tsv(timeline_file)
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            index.save(str(entry))
+            for outdated in entry.parent.glob(f"timeline-{path_digest}-*.npz"):
+                if outdated != entry:
+                    outdated.unlink(missing_ok=True)
+
+    # keep only the latest version of each timeline
+    for key in [key for key in _loaded if key.startswith(f"{path}:")]:
+        del _loaded[key]
+    _loaded[identity] = index
+    return index
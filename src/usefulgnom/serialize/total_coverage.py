@@ -11,31 +11,81 @@ NC_045512.2	5	0
 
 """
 
-import pandas as pd
-import gzip
+import numpy as np
+from functools import partial
+from typing import Optional
 
+from usefulgnom.serialize.bgzf import load_position_index, read_indexed_positions
+from usefulgnom.serialize.cache import CoverageCache
+from usefulgnom.serialize.parsers import DEFAULT_PARSER, read_columns
+from usefulgnom.serialize.coverage import (
+    gather_positions,
+    stream_positions,
+    to_position_array,
+)
 
-def load_convert_total(coverage_path: str, pos: list[str]) -> pd.DataFrame:
+
+def read_total_array(coverage_path: str, parser: str = DEFAULT_PARSER) -> np.ndarray:
     """
-    Load and convert the total coverage data.
+    Read the total coverage of a coverage.tsv.gz file into a dense array.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+        parser (str): Parser backend, see usefulgnom.serialize.parsers.
+
+    Returns:
+        np.ndarray: uint32 array of length genome length, entry i holds
+                    the coverage of position i + 1.
     """
+    values = read_columns(coverage_path, [1, 2], 1, parser)
+    return to_position_array(values[:, 0], values[:, 1])
 
-    with gzip.open(coverage_path, "rt") as file:
-        # Use pd.read_csv to read the file
-        df = pd.read_csv(
-            file, delimiter="\t", usecols=[1, 2], header=None, index_col=None
-        )[1:]
 
-        df.columns = ["pos", "coverage"]
+def load_convert_total(
+    coverage_path: str,
+    pos: list[str],
+    cache: Optional[CoverageCache] = None,
+    streaming: bool = False,
+    parser: str = DEFAULT_PARSER,
+) -> np.ndarray:
+    """
+    Load and convert the total coverage data.
+
+    Args:
+        coverage_path (str): Path to the coverage file.
+        pos (list[str]): List of positions.
+        cache (CoverageCache): Optional cache of decoded coverage files.
+        streaming (bool): Parse the file in chunks, keep only the requested
+            positions and stop decompressing past the largest one.
+            Ignored if a cache is given, as the cache stores whole files.
+        parser (str): Parser backend of whole files, see
+            usefulgnom.serialize.parsers; streaming always uses pandas.
 
-    # extract coverage for specified position and nt
-    # record columns for df
-    column = []
-    for position in pos:
-        coverage = df.loc[df["pos"] == position, "coverage"]
+    BGZF files with a position index (see usefulgnom.serialize.bgzf) are
+    read by inflating only the blocks of the positions, unless a cache is
+    given.
 
-        column.append(coverage.iloc[0])
+    Returns:
+        np.ndarray: uint32 vector of the coverage of each position,
+                    in the order of `pos`.
+
+    Raises:
+        ValueError: If a position is not found in the coverage file.
+    """
+    if cache is None:
+        index = load_position_index(coverage_path)
+        if index is not None:
+            rows = read_indexed_positions(coverage_path, index, pos, usecols=[1, 2])
+            return rows[:, 0]
+    if streaming and cache is None:
+        return stream_positions(coverage_path, pos, usecols=[1, 2], skiprows=1)[:, 0]
 
-    df_out = pd.DataFrame(column)
+    if cache is not None:
+        coverage = cache.load(
+            coverage_path, "total", partial(read_total_array, parser=parser)
+        )
+    else:
+        coverage = read_total_array(coverage_path, parser)
 
-    return df_out
+    # extract coverage for specified positions in one go
+    return gather_positions(coverage, pos)
@@ -0,0 +1,5 @@
+"""Provides cohort-wide storage of coverage data."""
+
+from usefulgnom.store.coverage_store import CoverageStore
+
+__all__ = ["CoverageStore"]
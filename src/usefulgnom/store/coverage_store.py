@@ -0,0 +1,356 @@
+"""Implements a cohort-wide on-disk store of per-sample coverage.
+
+All basecnt.tsv.gz files of a cohort are ingested once into a single
+samples x positions x channels uint32 array, chunked along the positions,
+plus a table of the sample metadata. A query for a set of positions over a
+date range and location only reads the chunks holding those positions.
+
+e.g. of a store directory:
+
+    store_dir/
+        store.json              (genome length, chunk size, channels)
+        samples.tsv             (sample, batch, date, location, proto, path)
+        chunks/chunk_00000.bin  (samples x chunk size x channels, sample-major)
+        chunks/chunk_00001.bin
+        ...
+
+Chunk files are sample-major so that ingesting new samples only appends to
+them; the number of rows of samples.tsv is the number of complete samples.
+"""
+
+import glob
+import json
+import os
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from usefulgnom.analyze.coverage import load_samples, split_results_pattern
+from usefulgnom.serialize.basecnt_coverage import NUCLEOTIDES, read_basecnt_array
+from usefulgnom.serialize.total_coverage import read_total_array
+
+# per-base counts followed by the total coverage
+CHANNELS = NUCLEOTIDES + ["depth"]
+
+SAMPLE_COLUMNS = ["sample", "batch", "date", "location", "proto", "path"]
+
+
+def load_sample_tensor(basecnt_file: str, genome_length: int) -> np.ndarray:
+    """
+    Load the channels of one sample into a (genome length, channels) array.
+
+    The depth is read from the coverage.tsv.gz next to the basecnt file,
+    or derived from the per-base counts if there is none.
+
+    Args:
+        basecnt_file (str): Path to the basecnt.tsv.gz file of the sample.
+        genome_length (int): Number of positions of the store.
+
+    Returns:
+        np.ndarray: uint32 array of shape (genome_length, len(CHANNELS)).
+    """
+    tensor = np.zeros((genome_length, len(CHANNELS)), dtype=np.uint32)
+    counts = read_basecnt_array(basecnt_file)[:genome_length]
+    tensor[: counts.shape[0], : len(NUCLEOTIDES)] = counts
+
+    coverage_file = os.path.join(os.path.dirname(basecnt_file), "coverage.tsv.gz")
+    if os.path.exists(coverage_file):
+        depth = read_total_array(coverage_file)[:genome_length]
+        tensor[: depth.shape[0], -1] = depth
+    else:
+        tensor[: counts.shape[0], -1] = counts.sum(axis=1, dtype=np.uint32)
+    return tensor
+
+
+class CoverageStore:
+    """
+    Cohort-wide coverage store, chunked along the genome positions.
+
+    Args:
+        store_dir (str): Directory of an existing store, see `create`.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / "store.json") as file:
+            layout = json.load(file)
+        self.genome_length = int(layout["genome_length"])
+        self.chunk_size = int(layout["chunk_size"])
+        self.channels = list(layout["channels"])
+        self.samples = pd.read_csv(
+            self.store_dir / "samples.tsv",
+            sep="\t",
+            dtype={"sample": str, "batch": str, "path": str},
+            parse_dates=["date"],
+            encoding="utf-8",
+        )
+
+    @classmethod
+    def create(
+        cls, store_dir: str, genome_length: int = 29903, chunk_size: int = 1024
+    ) -> "CoverageStore":
+        """
+        Create an empty store.
+
+        Args:
+            store_dir (str): Directory to create the store in.
+            genome_length (int): Number of positions, default is SARS-CoV-2.
+            chunk_size (int): Number of positions per chunk.
+
+        Returns:
+            CoverageStore: The empty store.
+        """
+        store_path = Path(store_dir)
+        (store_path / "chunks").mkdir(parents=True, exist_ok=True)
+        with open(store_path / "store.json", "w") as file:
+            json.dump(
+                {
+                    "genome_length": genome_length,
+                    "chunk_size": chunk_size,
+                    "channels": CHANNELS,
+                },
+                file,
+                indent=2,
+            )
+        pd.DataFrame(columns=SAMPLE_COLUMNS).to_csv(
+            store_path / "samples.tsv", sep="\t", index=False
+        )
+        return cls(store_dir)
+
+    @property
+    def n_chunks(self) -> int:
+        """Number of position chunks."""
+        return -(-self.genome_length // self.chunk_size)
+
+    def chunk_path(self, chunk: int) -> Path:
+        """Path of the file of a position chunk."""
+        return self.store_dir / "chunks" / f"chunk_{chunk:05d}.bin"
+
+    def ingest(
+        self,
+        basecnt_fps: str,
+        timeline_file_dir: str,
+        n_workers: int = 1,
+        batch_size: int = 64,
+    ) -> int:
+        """
+        Ingest the samples of the timeline that are not in the store yet.
+
+        Args:
+            basecnt_fps (str): Path pattern to the basecnt.tsv.gz files, e.g.
+                '.../results/*/*/alignments/basecnt.tsv.gz'
+            timeline_file_dir (str): Path to the timeline file.
+            n_workers (int): Number of processes to load the samples with.
+            batch_size (int): Number of samples to hold in memory at a time.
+
+        Returns:
+            int: Number of ingested samples.
+        """
+        timeline = pd.read_csv(
+            timeline_file_dir,
+            sep="\t",
+            usecols=["sample", "batch", "proto", "date", "location"],
+            dtype={"sample": str, "batch": str},
+            encoding="utf-8",
+        )
+        timeline["date"] = pd.to_datetime(timeline["date"])
+
+        known = set(zip(self.samples["sample"], self.samples["batch"]))
+        split = split_results_pattern(basecnt_fps)
+        if split is None:
+            paths = glob.glob(basecnt_fps, recursive=True)
+        else:
+            # only check the new samples of the timeline, without listing
+            # the results tree
+            root, rest = split
+            pairs = dict.fromkeys(zip(timeline["sample"], timeline["batch"]))
+            paths = [
+                f"{root}/{sample}/{batch}/{rest}"
+                for sample, batch in pairs
+                if (sample, batch) not in known
+            ]
+            paths = [path for path in paths if os.path.exists(path)]
+        files = pd.DataFrame(
+            [
+                (path.split("/")[-4], path.split("/")[-3], path)
+                for path in sorted(paths)
+            ],
+            columns=["sample", "batch", "path"],
+        )
+        new_samples = files.merge(timeline, on=["sample", "batch"])
+        is_new = [
+            (sample, batch) not in known
+            for sample, batch in zip(new_samples["sample"], new_samples["batch"])
+        ]
+        new_samples = new_samples.loc[is_new, SAMPLE_COLUMNS].drop_duplicates(
+            ["sample", "batch"]
+        )
+
+        self._truncate_chunks()
+        loader = partial(load_sample_tensor, genome_length=self.genome_length)
+        for start in range(0, len(new_samples), batch_size):
+            batch = new_samples.iloc[start : start + batch_size]
+            tensors = np.stack(load_samples(loader, list(batch["path"]), n_workers))
+            self._append(tensors)
+            # only record the samples once their data is complete
+            self.samples = pd.concat([self.samples, batch], ignore_index=True)
+            self.samples.to_csv(
+                self.store_dir / "samples.tsv",
+                sep="\t",
+                index=False,
+                date_format="%Y-%m-%d",
+            )
+        return len(new_samples)
+
+    def select_samples(
+        self,
+        startdate: Optional[datetime] = None,
+        enddate: Optional[datetime] = None,
+        location: Optional[str] = None,
+        protocol: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Select samples by date range, location and protocol.
+
+        As in extract_sample_ID, both dates are exclusive.
+
+        Args:
+            startdate (datetime): Start date of the time period.
+            enddate (datetime): End date of the time period.
+            location (str): Location of the samples.
+            protocol (str): Sequencing protocol used.
+
+        Returns:
+            pd.DataFrame: Metadata of the selected samples, the index is
+                their row in the store.
+        """
+        selected = pd.Series(True, index=self.samples.index)
+        if startdate is not None:
+            selected &= self.samples["date"] > pd.Timestamp(startdate)
+        if enddate is not None:
+            selected &= self.samples["date"] < pd.Timestamp(enddate)
+        if location is not None:
+            selected &= self.samples["location"] == location
+        if protocol is not None:
+            selected &= self.samples["proto"] == protocol
+        return self.samples.loc[selected]
+
+    def query(
+        self, positions: list, samples: Optional[pd.DataFrame] = None
+    ) -> np.ndarray:
+        """
+        Read the channels of the given positions and samples.
+
+        Only the chunks holding the requested positions are read.
+
+        Args:
+            positions (list): 1-based genome positions, as int or str.
+            samples (pd.DataFrame): Samples to read, see `select_samples`,
+                default is all samples.
+
+        Returns:
+            np.ndarray: uint32 array of shape
+                (len(samples), len(positions), len(channels)).
+
+        Raises:
+            ValueError: If a position is outside of the genome.
+        """
+        if samples is None:
+            samples = self.samples
+        sample_rows = samples.index.to_numpy()
+        index = np.asarray(positions, dtype=np.int64) - 1
+        out_of_range = (index < 0) | (index >= self.genome_length)
+        if out_of_range.any():
+            raise ValueError(
+                f"Position {index[out_of_range][0] + 1} not found in coverage data."
+            )
+
+        values = np.zeros(
+            (sample_rows.size, index.size, len(self.channels)), dtype=np.uint32
+        )
+        if sample_rows.size == 0:
+            return values
+        chunks = index // self.chunk_size
+        for chunk in np.unique(chunks):
+            in_chunk = chunks == chunk
+            data = np.memmap(
+                self.chunk_path(chunk),
+                dtype=np.uint32,
+                mode="r",
+                shape=(len(self.samples), self.chunk_size, len(self.channels)),
+            )
+            offsets = index[in_chunk] - chunk * self.chunk_size
+            values[:, in_chunk, :] = data[np.ix_(sample_rows, offsets)]
+        return values
+
+    def basecnt_matrix(
+        self, pos_mut: list[tuple], mutations: list[str], samples: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Build the basecnt coverage matrix as run_basecnt_coverage does.
+
+        Args:
+            pos_mut (list[tuple]): List of tuples containing position and new
+                nucleotide.
+            mutations (list[str]): The mutations, the rows of the matrix.
+            samples (pd.DataFrame): Samples to include, see `select_samples`.
+
+        Returns:
+            pd.DataFrame: Matrix with one column per sample date, sorted by date.
+        """
+        values = self.query([position for position, _ in pos_mut], samples)
+        nt_index = [self.channels.index(nt) for _, nt in pos_mut]
+        counts = values[:, np.arange(len(pos_mut)), nt_index]
+        return self._matrix(counts, mutations, samples)
+
+    def total_matrix(
+        self, positions: list, mutations: list[str], samples: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Build the total coverage matrix as run_total_coverage_depth does.
+
+        Args:
+            positions (list): 1-based genome positions of the mutations.
+            mutations (list[str]): The mutations, the rows of the matrix.
+            samples (pd.DataFrame): Samples to include, see `select_samples`.
+
+        Returns:
+            pd.DataFrame: Matrix with one column per sample date, sorted by date.
+        """
+        depth = self.query(positions, samples)[:, :, self.channels.index("depth")]
+        return self._matrix(depth, mutations, samples)
+
+    def _matrix(
+        self, values: np.ndarray, mutations: list[str], samples: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Arrange samples x mutations values as a mutation x date matrix."""
+        # one column per date, later samples of the same date win
+        columns = dict(zip(samples["date"], values))
+        matrix = pd.DataFrame(columns, index=range(len(mutations))).sort_index(axis=1)
+        return matrix.set_index(pd.Index(mutations, name="mut"))
+
+    def _truncate_chunks(self) -> None:
+        """Drop data of samples whose ingestion was interrupted."""
+        sample_bytes = self.chunk_size * len(self.channels) * 4
+        for chunk in range(self.n_chunks):
+            path = self.chunk_path(chunk)
+            if not path.exists():
+                path.touch()
+            with open(path, "r+b") as file:
+                file.truncate(len(self.samples) * sample_bytes)
+
+    def _append(self, tensors: np.ndarray) -> None:
+        """Append (samples, genome length, channels) data to the chunk files."""
+        padded = np.zeros(
+            (tensors.shape[0], self.n_chunks * self.chunk_size, len(self.channels)),
+            dtype=np.uint32,
+        )
+        padded[:, : self.genome_length] = tensors
+        for chunk in range(self.n_chunks):
+            start = chunk * self.chunk_size
+            with open(self.chunk_path(chunk), "ab") as file:
+                file.write(padded[:, start : start + self.chunk_size].tobytes())
@@ -1 +1,23 @@
-"""Implements Visualisation Analysis."""
+"""Implements Visualisation Analysis.
+
+matplotlib is imported on the first access to a plotting function.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from usefulgnom.visualise.heatmap import downsample, make_cov_heatmap, plot_heatmap
+
+__all__ = [
+    "downsample",
+    "make_cov_heatmap",
+    "plot_heatmap",
+]
+
+
+def __getattr__(name: str):
+    """Import the plotting functions on their first access."""
+    if name in __all__:
+        return getattr(importlib.import_module("usefulgnom.visualise.heatmap"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,226 @@
+"""Implements a raster heatmap renderer for large coverage and frequency matrices.
+
+The matrix is colour-mapped and masked in NumPy and drawn as a single image
+layer, while the axes, tick labels and colour bar stay vector graphics. The
+cost of a plot then hardly depends on the number of cells, unlike seaborn
+heatmaps that draw one vector patch per cell.
+
+e.g. heatmap of the amplicon coverages, with the dropouts in black:
+
+    fig, ax = plt.subplots()
+    plot_heatmap(covs, ax=ax, cmap="Reds", mask=covs == 0, mask_color="black")
+    fig.savefig("cov_heatmap.pdf")
+"""
+
+from typing import Any, Optional, Union
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib import colormaps
+from matplotlib.axes import Axes
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Colormap, Normalize, to_rgba
+from matplotlib.image import AxesImage
+
+
+def block_starts(length: int, max_length: Optional[int]) -> np.ndarray:
+    """
+    Start of the blocks that downsample an axis to at most `max_length` entries.
+
+    Args:
+        length (int): Number of entries of the axis.
+        max_length (int): Maximum number of blocks, None to not downsample.
+
+    Returns:
+        np.ndarray: Sorted start index of each block, the first one is 0.
+    """
+    if max_length is None or length <= max_length:
+        return np.arange(length)
+    return np.unique(np.linspace(0, length, max_length, endpoint=False).astype(int))
+
+
+def downsample(
+    values: np.ndarray,
+    mask: Optional[np.ndarray] = None,
+    max_rows: Optional[int] = None,
+    max_cols: Optional[int] = None,
+) -> tuple[np.ndarray, Optional[np.ndarray], np.ndarray, np.ndarray]:
+    """
+    Downsample a matrix to at most `max_rows` x `max_cols` blocks.
+
+    Each block holds the mean of its values, ignoring NaN; a block is masked
+    if any of its cells is, so e.g. a single dropout stays visible.
+
+    Args:
+        values (np.ndarray): 2D matrix of values.
+        mask (np.ndarray): Optional boolean matrix of the cells to mask.
+        max_rows (int): Maximum number of rows, None to keep all.
+        max_cols (int): Maximum number of columns, None to keep all.
+
+    Returns:
+        tuple: The downsampled values and mask, and the start of the blocks
+            along the rows and the columns.
+    """
+    rows = block_starts(values.shape[0], max_rows)
+    cols = block_starts(values.shape[1], max_cols)
+    if len(rows) == values.shape[0] and len(cols) == values.shape[1]:
+        return values, mask, rows, cols
+    if values.size == 0:
+        if mask is not None:
+            mask = mask[rows][:, cols]
+        return values[rows][:, cols], mask, rows, cols
+
+    present = ~np.isnan(values)
+    sums = np.add.reduceat(np.add.reduceat(np.where(present, values, 0), rows), cols, 1)
+    counts = np.add.reduceat(np.add.reduceat(present.astype(np.int64), rows), cols, 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    if mask is not None:
+        mask = np.logical_or.reduceat(np.logical_or.reduceat(mask, rows), cols, 1)
+    return means, mask, rows, cols
+
+
+def tick_positions(length: int, max_ticks: int) -> np.ndarray:
+    """Positions of at most `max_ticks` evenly spread tick labels."""
+    if length <= max_ticks:
+        return np.arange(length)
+    return np.unique(np.linspace(0, length - 1, max_ticks).round().astype(int))
+
+
+def plot_heatmap(
+    matrix: Union[pd.DataFrame, np.ndarray],
+    ax: Optional[Axes] = None,
+    cmap: Union[str, Colormap] = "Reds",
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    mask: Optional[np.ndarray] = None,
+    mask_color: Any = "black",
+    max_rows: Optional[int] = None,
+    max_cols: Optional[int] = None,
+    max_ticks: int = 60,
+    aspect: str = "auto",
+    colorbar: bool = True,
+    colorbar_kws: Optional[dict] = None,
+    fontsize: Optional[float] = None,
+) -> AxesImage:
+    """
+    Draw a matrix as a rasterized heatmap with vector axes.
+
+    NaN cells are left transparent, as in seaborn heatmaps.
+
+    Args:
+        matrix (pd.DataFrame | np.ndarray): Values, rows are drawn top down;
+            the index and columns of a DataFrame become the tick labels.
+        ax (Axes): Axes to draw on, default is the current axes.
+        cmap (str | Colormap): Colour map of the values.
+        vmin (float): Value of the lowest colour, default is the minimum.
+        vmax (float): Value of the highest colour, default is the maximum.
+        mask (np.ndarray): Optional boolean matrix of the cells to draw in
+            `mask_color` instead, e.g. `matrix == 0` for dropouts.
+        mask_color: Matplotlib colour of the masked cells.
+        max_rows (int): Downsample to at most this many rows, for overviews.
+        max_cols (int): Downsample to at most this many columns.
+        max_ticks (int): Maximum number of tick labels per axis.
+        aspect (str): Aspect of the cells, "equal" for square cells.
+        colorbar (bool): Whether to draw a colour bar.
+        colorbar_kws (dict): Keyword arguments of the colour bar, e.g. shrink.
+        fontsize (float): Font size of the tick labels.
+
+    Returns:
+        AxesImage: The image layer of the heatmap.
+    """
+    if ax is None:
+        ax = plt.gca()
+    if isinstance(matrix, pd.DataFrame):
+        row_labels = matrix.index.astype(str).to_numpy()
+        col_labels = matrix.columns.astype(str).to_numpy()
+        values = matrix.to_numpy(dtype=float)
+    else:
+        values = np.asarray(matrix, dtype=float)
+        row_labels = np.arange(values.shape[0]).astype(str)
+        col_labels = np.arange(values.shape[1]).astype(str)
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+
+    values, mask, rows, cols = downsample(values, mask, max_rows, max_cols)
+    row_labels, col_labels = row_labels[rows], col_labels[cols]
+
+    finite = values[np.isfinite(values)]
+    if vmin is None:
+        vmin = float(finite.min()) if finite.size else 0.0
+    if vmax is None:
+        vmax = float(finite.max()) if finite.size else 1.0
+    norm = Normalize(vmin=vmin, vmax=vmax)
+    colormap = colormaps[cmap] if isinstance(cmap, str) else cmap
+
+    # colour-map and composite the mask in NumPy, drawn as one image
+    rgba = colormap(norm(np.ma.masked_invalid(values)))
+    rgba[np.isnan(values)] = 0.0
+    if mask is not None:
+        rgba[mask] = to_rgba(mask_color)
+    image = ax.imshow(
+        rgba, aspect=aspect, interpolation="nearest", resample=False, origin="upper"
+    )
+
+    yticks = tick_positions(len(row_labels), max_ticks)
+    xticks = tick_positions(len(col_labels), max_ticks)
+    ax.set_yticks(yticks, row_labels[yticks], fontsize=fontsize)
+    ax.set_xticks(xticks, col_labels[xticks], fontsize=fontsize, rotation=90)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+    if colorbar:
+        ax.figure.colorbar(
+            ScalarMappable(norm=norm, cmap=colormap), ax=ax, **(colorbar_kws or {})
+        )
+    return image
+
+
+def make_cov_heatmap(
+    cov_df: pd.DataFrame, output=None, max_rows: Optional[int] = None
+) -> None:
+    """Make heatmap of coverage and save it to output path.
+
+    Each half of the samples is drawn as one raster image, amplicons without
+    coverage in white.
+
+    Args:
+        cov_df: DataFrame with coverage values, the first column holds the
+            sample names, see usefulgnom.analyze.amplicon_coverage.
+        output: Path to save the heatmap
+        max_rows: Maximum number of rows of each half, larger batches are
+            downsampled. None to draw every sample.
+    Returns:
+        None
+    """
+    fig = plt.figure(figsize=(15, 8 * 2.5))
+    split_at = round(cov_df.shape[0] / 2)
+    halves = [
+        (cov_df.iloc[0:split_at], "Samples 0:{}".format(split_at)),
+        (
+            cov_df.iloc[split_at:],
+            "Samples {}:{}".format(split_at, cov_df.shape[0] - 1),
+        ),
+    ]
+    for i, (half, title) in enumerate(halves):
+        ax = fig.add_subplot(1, 2, i + 1)
+        covs = half.iloc[:, 1:]
+        plot_heatmap(
+            covs,
+            ax=ax,
+            cmap="Reds",
+            vmin=0,
+            mask=covs.to_numpy() == 0,
+            mask_color="white",
+            max_rows=max_rows,
+            aspect="equal",
+            colorbar_kws={"shrink": 0.2, "anchor": (0.0, 0.8)},
+        )
+        ax.set_xlabel("amplicon")
+        ax.set_ylabel("sample")
+        ax.set_title(title)
+
+    if output is not None:
+        fig.savefig(output)
+    plt.close(fig)
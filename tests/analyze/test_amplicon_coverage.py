@@ -0,0 +1,99 @@
+"""Test the relative amplicon coverage of a batch of samples."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import SAMPLES
+
+from usefulgnom.analyze.amplicon_coverage import (
+    amplicon_coverage_tables,
+    amplicon_medians,
+    get_samples_paths,
+)
+from usefulgnom.serialize.primer_scheme import amplicon_windows, load_primer_scheme
+
+# query windows over a genome of 300 positions: a window starting before the
+# 20 first positions, overlapping windows, a window shorter than its two
+# halves and one ending at the last position
+BED = """\
+NC_045512.2\t10\t30\tnCoV-2019_1_LEFT\tnCoV-2019_1\t+
+NC_045512.2\t150\t170\tnCoV-2019_1_RIGHT\tnCoV-2019_1\t-
+NC_045512.2\t120\t140\tnCoV-2019_2_LEFT\tnCoV-2019_2\t+
+NC_045512.2\t270\t290\tnCoV-2019_2_RIGHT\tnCoV-2019_2\t-
+"""
+
+QUERY_WINDOWS = [(5, 90), (60, 150), (120, 200), (185, 200), (240, 300)]
+
+
+def test_amplicon_medians():
+    """Medians over the padded windows equal one np.median per amplicon."""
+    rng = np.random.default_rng(0)
+    depths = rng.integers(0, 1000, size=(3, 300), dtype=np.uint32)
+    amplicons_df = pd.DataFrame(
+        QUERY_WINDOWS, columns=["query_start", "query_end"], index=[1, 2, 3, 4, 5]
+    )
+    index, valid = amplicon_windows(amplicons_df)
+    assert not valid.all()
+
+    expected = np.array(
+        [
+            [
+                np.median(depth[np.r_[start:20, stop - 20 : stop]])
+                for start, stop in QUERY_WINDOWS
+            ]
+            for depth in depths
+        ]
+    )
+    np.testing.assert_array_equal(amplicon_medians(depths, index, valid), expected)
+    for depth, medians in zip(depths, expected):
+        np.testing.assert_array_equal(amplicon_medians(depth, index, valid), medians)
+
+
+@pytest.fixture
+def amplicon_batch(vpipe_tree):
+    """Coverage files of the fixture samples, one missing, and a primer scheme."""
+    samplestsv = vpipe_tree["root"] / "samples.tsv"
+    samplestsv.write_text(
+        "".join(f"{sample}\t{batch}\n" for sample, batch, *_ in SAMPLES)
+        + "missing_sample\t20240505_DDD\n"
+    )
+    bed = vpipe_tree["root"] / "scheme.bed"
+    bed.write_text(BED)
+    return get_samples_paths(vpipe_tree["results"], samplestsv), bed
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_amplicon_coverage_tables(vpipe_tree, amplicon_batch, n_workers):
+    """Serial and parallel runs give the same tables, in the order of the list."""
+    sam_list, bed = amplicon_batch
+    scheme = load_primer_scheme(bed)
+    all_covs, all_covs_frac, missing = amplicon_coverage_tables(
+        sam_list, scheme, n_workers=n_workers, max_in_flight=2
+    )
+    assert missing == sam_list[-1:]
+    assert list(all_covs["sample"]) == [sample for sample, *_ in SAMPLES]
+    assert list(all_covs.columns[1:]) == list(scheme.amplicons.index)
+
+    depths = np.stack(
+        [vpipe_tree["counts"][sample].sum(axis=1) for sample, *_ in SAMPLES]
+    )
+    expected = np.array(
+        [
+            [
+                np.median(depth[np.r_[int(start) : 20, int(stop) - 20 : int(stop)]])
+                for start, stop in zip(
+                    scheme.amplicons["query_start"], scheme.amplicons["query_end"]
+                )
+            ]
+            for depth in depths
+        ]
+    )
+    np.testing.assert_array_equal(all_covs.iloc[:, 1:].to_numpy(), expected)
+    np.testing.assert_allclose(
+        all_covs_frac.iloc[:, 1:].to_numpy(),
+        expected / expected.sum(axis=1, keepdims=True),
+    )
+
+    serial = amplicon_coverage_tables(sam_list, scheme)
+    pd.testing.assert_frame_equal(all_covs, serial[0])
+    pd.testing.assert_frame_equal(all_covs_frac, serial[1])
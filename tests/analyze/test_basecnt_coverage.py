@@ -1,15 +1,68 @@
 """Test basecnt_coverage."""
 
-import pytest
+import numpy as np
+import pandas as pd
 
+from usefulgnom.analyze import run_basecnt_coverage
+from usefulgnom.analyze.basecnt_coverage import extract_mutation_position_and_nt
+from usefulgnom.serialize import load_convert_bnc
+from usefulgnom.serialize.basecnt_coverage import NUCLEOTIDES
 
-@pytest.mark.skip(reason="Test not implemented yet")
-def test_basecnt_coverage():
+
+def test_basecnt_coverage(vpipe_tree, tmp_path):
     """Test basecnt_coverage."""
-    return NotImplementedError
+    output_file = tmp_path / "mut_base_coverage.csv"
+    run_basecnt_coverage(
+        basecnt_fps=vpipe_tree["basecnt_fps"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        mutations_of_interest_dir=vpipe_tree["mutations"],
+        output_file=str(output_file),
+        location="Zürich (ZH)",
+    )
+    result = pd.read_csv(output_file, index_col=0)
+
+    assert list(result.columns) == ["2024-02-01", "2024-03-01", "2024-04-01"]
+    assert list(result.index) == ["C23G", "G100A", "T250C", "A7T"]
+    counts = vpipe_tree["counts"]["A1_10_2024_03_01"]
+    assert result.loc["C23G", "2024-03-01"] == counts[22, NUCLEOTIDES.index("G")]
+    assert result.loc["A7T", "2024-03-01"] == counts[6, NUCLEOTIDES.index("T")]
 
 
-@pytest.mark.skip(reason="Test not implemented yet")
-def test_extract_mutation_position_and_nt():
+def test_extract_mutation_position_and_nt(vpipe_tree):
     """Test extract_mutation_position_and_nt."""
-    assert NotImplementedError
+    assert extract_mutation_position_and_nt(vpipe_tree["mutations"]) == [
+        ("23", "G"),
+        ("100", "A"),
+        ("250", "C"),
+        ("7", "T"),
+    ]
+
+
+def test_load_convert_bnc(vpipe_tree):
+    """The loader gathers typed counts of each (position, nucleotide)."""
+    basecnt_fp = next(vpipe_tree["results"].glob("A1_05*/*/alignments/basecnt.tsv.gz"))
+    counts = vpipe_tree["counts"]["A1_05_2024_02_01"]
+
+    coverage = load_convert_bnc(str(basecnt_fp), [("300", "-"), ("1", "A"), (2, "C")])
+
+    assert coverage.dtype == np.uint32
+    np.testing.assert_array_equal(
+        coverage, [counts[299, 4], counts[0, 0], counts[1, 1]]
+    )
+
+
+def test_basecnt_coverage_parallel(vpipe_tree, tmp_path):
+    """Loading over a process pool gives the same matrix as the serial path."""
+    outputs = []
+    for n_workers in (1, 3):
+        output_file = tmp_path / f"mut_base_coverage_{n_workers}.csv"
+        run_basecnt_coverage(
+            basecnt_fps=vpipe_tree["basecnt_fps"],
+            timeline_file_dir=vpipe_tree["timeline"],
+            mutations_of_interest_dir=vpipe_tree["mutations"],
+            output_file=str(output_file),
+            n_workers=n_workers,
+        )
+        outputs.append(output_file.read_text())
+
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,166 @@
+"""Test the shared coverage analysis functions."""
+
+import os
+from glob import glob
+
+import pandas as pd
+import pytest
+
+from usefulgnom.analyze import run_total_coverage_depth
+from usefulgnom.analyze import coverage, total_coverage
+from usefulgnom.serialize.manifest import read_manifest
+
+from conftest import write_coverage
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_incremental_total_coverage(vpipe_tree, tmp_path, monkeypatch, suffix):
+    """A rerun loads only changed samples and mutations added to the list."""
+    output_file = str(tmp_path / f"mut_total_coverage{suffix}")
+    kwargs = dict(
+        coverage_tsv_fps=vpipe_tree["coverage_fps"],
+        mutations_of_interest_fp=vpipe_tree["mutations"],
+        timeline_file_dir=vpipe_tree["timeline"],
+    )
+    run_total_coverage_depth(output_file=output_file, **kwargs)
+    assert len(read_manifest(output_file)) == 3
+
+    # one sample is rewritten and a mutation is added to the list
+    changed = next(vpipe_tree["results"].glob("A1_10*/*/alignments/coverage.tsv.gz"))
+    write_coverage(changed, "A1_10_2024_03_01", range(1000, 1300))
+    stat = os.stat(changed)
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    mutations = pd.read_csv(vpipe_tree["mutations"])
+    pd.concat([mutations, pd.DataFrame({"mut": ["A42G"]})]).to_csv(
+        vpipe_tree["mutations"], index=False
+    )
+
+    calls = []
+    load_convert_total = total_coverage.load_convert_total
+
+    def counting_loader(coverage_path, pos, **loader_kwargs):
+        calls.append((coverage_path.split("/")[-4], list(pos)))
+        return load_convert_total(coverage_path, pos, **loader_kwargs)
+
+    monkeypatch.setattr(total_coverage, "load_convert_total", counting_loader)
+    run_total_coverage_depth(
+        output_file=output_file, previous_output=output_file, **kwargs
+    )
+    assert sorted(calls) == [
+        ("A1_05_2024_02_01", ["42"]),
+        ("A1_10_2024_03_01", ["23", "100", "250", "7", "42"]),
+        ("A1_16_2024_04_01", ["42"]),
+    ]
+
+    fresh_file = str(tmp_path / f"fresh{suffix}")
+    run_total_coverage_depth(output_file=fresh_file, **kwargs)
+    with open(output_file, "rb") as incremental, open(fresh_file, "rb") as fresh:
+        assert incremental.read() == fresh.read()
+
+
+def test_multi_location_total_coverage(vpipe_tree, tmp_path, monkeypatch):
+    """One pass over several locations writes each single-location output."""
+    globs = []
+
+    def counting_glob(pattern, **kwargs):
+        globs.append(pattern)
+        return glob(pattern, **kwargs)
+
+    monkeypatch.setattr(coverage.glob, "glob", counting_glob)
+    for location in ["Zürich (ZH)", "Genève (GE)"]:
+        run_total_coverage_depth(
+            coverage_tsv_fps=vpipe_tree["coverage_fps"],
+            mutations_of_interest_fp=vpipe_tree["mutations"],
+            timeline_file_dir=vpipe_tree["timeline"],
+            output_file=str(tmp_path / f"single_{location}.csv"),
+            location=location,
+        )
+    # the paths are resolved from the timeline, the results tree is not listed
+    assert globs == []
+    # a pattern that cannot be resolved is globbed once for all locations
+    unresolvable = vpipe_tree["coverage_fps"].replace(".tsv.gz", ".tsv.g?")
+    for location in [["Zürich (ZH)", "Genève (GE)"], "all"]:
+        run_total_coverage_depth(
+            coverage_tsv_fps=unresolvable,
+            mutations_of_interest_fp=vpipe_tree["mutations"],
+            timeline_file_dir=vpipe_tree["timeline"],
+            output_file=str(tmp_path / "multi_{location}.csv"),
+            location=location,
+        )
+        for name in ["Zürich (ZH)", "Genève (GE)"]:
+            assert (tmp_path / f"multi_{name}.csv").read_text() == (
+                tmp_path / f"single_{name}.csv"
+            ).read_text()
+    assert globs == [unresolvable] * 2
+
+    with pytest.raises(ValueError, match="placeholder"):
+        run_total_coverage_depth(
+            coverage_tsv_fps=vpipe_tree["coverage_fps"],
+            mutations_of_interest_fp=vpipe_tree["mutations"],
+            timeline_file_dir=vpipe_tree["timeline"],
+            output_file=str(tmp_path / "multi.csv"),
+            location="all",
+        )
+
+
+def test_resolve_sample_files(vpipe_tree):
+    """Paths are built from sample and batch, missing files are skipped."""
+    pattern = vpipe_tree["basecnt_fps"]
+    root = str(vpipe_tree["results"])
+    assert coverage.split_results_pattern(pattern) == (
+        root,
+        "alignments/basecnt.tsv.gz",
+    )
+    assert coverage.split_results_pattern(root + "/**/basecnt.tsv.gz") is None
+    assert coverage.split_results_pattern(root + "/*/*/alignments/*.gz") is None
+
+    sample_IDs = pd.DataFrame(
+        {
+            "sample": ["A1_10_2024_03_01", "A1_05_2024_02_01", "A1_05_2024_02_01"],
+            "batch": ["20240305_BBB", "20240205_AAA", "20240999_ZZZ"],
+        }
+    )
+    assert coverage.resolve_sample_files(pattern, sample_IDs) == [
+        f"{root}/A1_10_2024_03_01/20240305_BBB/alignments/basecnt.tsv.gz",
+        f"{root}/A1_05_2024_02_01/20240205_AAA/alignments/basecnt.tsv.gz",
+    ]
+
+
+@pytest.mark.parametrize(
+    "sample, change",
+    [
+        ("A1_16_2024_04_01", "rewrite"),
+        ("A1_16_2024_04_01", "remove"),
+        ("A1_10_2024_03_01", "rewrite"),
+        ("A1_10_2024_03_01", "remove"),
+    ],
+)
+def test_incremental_shared_date(vpipe_tree, tmp_path, sample, change):
+    """Samples sharing a date reuse only the column their own sample filled."""
+    timeline = pd.read_csv(vpipe_tree["timeline"], sep="\t")
+    timeline.loc[timeline["sample"] == "A1_16_2024_04_01", "date"] = "2024-03-01"
+    timeline.to_csv(vpipe_tree["timeline"], sep="\t", index=False)
+    output_file = str(tmp_path / "mut_total_coverage.csv")
+    kwargs = dict(
+        coverage_tsv_fps=vpipe_tree["coverage_fps"],
+        mutations_of_interest_fp=vpipe_tree["mutations"],
+        timeline_file_dir=vpipe_tree["timeline"],
+    )
+    run_total_coverage_depth(output_file=output_file, **kwargs)
+
+    changed = next(vpipe_tree["results"].glob(f"{sample}/*/alignments/coverage.tsv.gz"))
+    if change == "remove":
+        changed.unlink()
+    else:
+        write_coverage(changed, sample, range(1000, 1300))
+        stat = os.stat(changed)
+        os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    run_total_coverage_depth(
+        output_file=output_file, previous_output=output_file, **kwargs
+    )
+
+    fresh_file = str(tmp_path / "fresh.csv")
+    run_total_coverage_depth(output_file=fresh_file, **kwargs)
+    assert (tmp_path / "mut_total_coverage.csv").read_text() == (
+        tmp_path / "fresh.csv"
+    ).read_text()
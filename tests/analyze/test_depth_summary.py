@@ -0,0 +1,95 @@
+"""Test the streaming depth summaries and their quantile sketches."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from usefulgnom.analyze import DepthSummary, merge_depth_summaries, run_depth_summary
+
+
+def test_summary_matches_numpy(tmp_path):
+    """Running statistics are exact, sketch quantiles within their accuracy."""
+    rng = np.random.default_rng(0)
+    depths = rng.lognormal(5, 2, size=(301, 40)).astype(np.uint32)
+    depths[rng.random(depths.shape) < 0.1] = 0
+
+    summary = DepthSummary.empty(40, relative_accuracy=0.02)
+    for depth in depths:
+        summary.add(depth)
+    table = summary.to_frame([0.05, 0.5, 0.95], decimals=6)
+
+    np.testing.assert_allclose(table["mean"], depths.mean(axis=0), rtol=1e-9)
+    np.testing.assert_allclose(table["std"], depths.std(axis=0, ddof=1), rtol=1e-6)
+    np.testing.assert_array_equal(table["min"], depths.min(axis=0))
+    np.testing.assert_array_equal(table["max"], depths.max(axis=0))
+    np.testing.assert_allclose(
+        table["below_20x"], (depths < 20).mean(axis=0), atol=5e-5
+    )
+    for q, column in [(0.05, "q05"), (0.5, "q50"), (0.95, "q95")]:
+        exact = np.quantile(depths, q, axis=0, method="lower")
+        np.testing.assert_allclose(table[column], exact, rtol=0.02 + 1e-6)
+
+    # halves summarized apart and merged, e.g. by two workers
+    first = DepthSummary.empty(40, relative_accuracy=0.02)
+    second = DepthSummary.empty(40, relative_accuracy=0.02)
+    for depth in depths[:100]:
+        first.add(depth)
+    for depth in depths[100:]:
+        second.add(depth)
+    first.save(str(tmp_path / "first.npz"))
+    second.save(str(tmp_path / "second.npz"))
+    merged = merge_depth_summaries(
+        [str(tmp_path / "first.npz"), str(tmp_path / "second.npz")]
+    )
+    assert merged.n_samples == 301
+    np.testing.assert_array_equal(merged.bins, summary.bins)
+    pd.testing.assert_frame_equal(
+        merged.to_frame([0.05, 0.5, 0.95], decimals=6), table, rtol=1e-9
+    )
+
+    with pytest.raises(ValueError, match="low_depth"):
+        merged.merge(DepthSummary.empty(40, relative_accuracy=0.02, low_depth=10))
+    with pytest.raises(ValueError, match="positions"):
+        merged.add(np.zeros(41, dtype=np.uint32))
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_run_depth_summary(vpipe_tree, tmp_path, n_workers):
+    """The table summarizes the coverage files of the selected samples."""
+    output = tmp_path / "depth_summary.parquet"
+    summary = run_depth_summary(
+        vpipe_tree["coverage_fps"],
+        vpipe_tree["timeline"],
+        str(output),
+        location="Zürich (ZH)",
+        genome_length=300,
+        n_workers=n_workers,
+        summary_output=str(tmp_path / "depth_summary.npz"),
+    )
+    assert isinstance(summary, DepthSummary)
+    assert summary.n_samples == 3
+    depths = np.stack(
+        [
+            counts.sum(axis=1)
+            for sample, counts in vpipe_tree["counts"].items()
+            if sample.startswith("A1")
+        ]
+    )
+    table = pd.read_parquet(output)
+    assert list(table.columns) == [
+        "mean",
+        "std",
+        "min",
+        "max",
+        "q05",
+        "q25",
+        "q50",
+        "q75",
+        "q95",
+        "below_20x",
+    ]
+    assert list(table.index[:2]) == [1, 2]
+    np.testing.assert_allclose(table["mean"], depths.mean(axis=0).round(2))
+    np.testing.assert_array_equal(table["max"], depths.max(axis=0))
+    stored = DepthSummary.load(str(tmp_path / "depth_summary.npz"))
+    np.testing.assert_array_equal(stored.bins, summary.bins)
@@ -0,0 +1,197 @@
+"""Test the fused coverage and frequency analysis."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from usefulgnom.analyze import (
+    run_basecnt_coverage,
+    run_mutation_frequency,
+    run_total_coverage_depth,
+)
+from usefulgnom.analyze import frequency as frequency_module
+from usefulgnom.analyze.frequency import iter_frequency_chunks, masked_frequency
+from usefulgnom.serialize.manifest import read_manifest
+
+from conftest import write_basecnt
+
+
+def test_run_mutation_frequency(vpipe_tree, tmp_path):
+    """The fused pass matches the separate basecnt and total analyses."""
+    basecnt, totalcnt, frequency = run_mutation_frequency(
+        basecnt_fps=vpipe_tree["basecnt_fps"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        mutations_of_interest_dir=vpipe_tree["mutations"],
+        basecnt_output_file=str(tmp_path / "basecnt.csv"),
+        total_output_file=str(tmp_path / "total.csv"),
+        frequency_output_file=str(tmp_path / "frequency.csv"),
+        min_depth=1100,
+    )
+    run_basecnt_coverage(
+        basecnt_fps=vpipe_tree["basecnt_fps"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        mutations_of_interest_dir=vpipe_tree["mutations"],
+        output_file=str(tmp_path / "basecnt_separate.csv"),
+    )
+    run_total_coverage_depth(
+        coverage_tsv_fps=vpipe_tree["coverage_fps"],
+        mutations_of_interest_fp=vpipe_tree["mutations"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        output_file=str(tmp_path / "total_separate.csv"),
+    )
+
+    for fused, separate in [
+        ("basecnt", "basecnt_separate"),
+        ("total", "total_separate"),
+    ]:
+        assert (tmp_path / f"{fused}.csv").read_text() == (
+            tmp_path / f"{separate}.csv"
+        ).read_text()
+
+    expected = basecnt / totalcnt.where(totalcnt >= 1100)
+    pd.testing.assert_frame_equal(frequency, expected)
+    assert frequency.isna().to_numpy().any()
+    assert np.nanmax(frequency.to_numpy()) <= 1
+
+
+def test_chunked_frequency_matches_in_memory(vpipe_tree, tmp_path):
+    """The chunked float32 engine writes the in-memory frequencies."""
+    basecnt, totalcnt, frequency = run_mutation_frequency(
+        basecnt_fps=vpipe_tree["basecnt_fps"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        mutations_of_interest_dir=vpipe_tree["mutations"],
+        basecnt_output_file=str(tmp_path / "basecnt.csv"),
+        total_output_file=str(tmp_path / "total.csv"),
+        frequency_output_file=str(tmp_path / "frequency.csv"),
+        min_depth=1100,
+    )
+    _, _, chunked = run_mutation_frequency(
+        basecnt_fps=vpipe_tree["basecnt_fps"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        mutations_of_interest_dir=vpipe_tree["mutations"],
+        basecnt_output_file=str(tmp_path / "basecnt_chunked.csv"),
+        total_output_file=str(tmp_path / "total_chunked.csv"),
+        frequency_output_file=str(tmp_path / "frequency_chunked.csv"),
+        min_depth=1100,
+        chunk_rows=3,
+    )
+    assert chunked is None
+
+    written = pd.read_csv(tmp_path / "frequency_chunked.csv", index_col=0)
+    expected = pd.read_csv(tmp_path / "frequency.csv", index_col=0)
+    pd.testing.assert_index_equal(written.index, expected.index)
+    pd.testing.assert_index_equal(written.columns, expected.columns)
+    np.testing.assert_allclose(written.to_numpy(), expected.to_numpy(), rtol=1e-6)
+
+
+def test_masked_frequency_chunks():
+    """Blocks of rows cover the matrix, low and zero depths are masked."""
+    basecnt = np.array([[5, 0], [10, 3], [0, 0]], dtype=np.uint32)
+    totalcnt = np.array([[10, 0], [20, 4], [30, 19]], dtype=np.uint32)
+
+    frequency = masked_frequency(basecnt, totalcnt, min_depth=20)
+    assert frequency.dtype == np.float32
+    np.testing.assert_array_equal(
+        frequency, [[np.nan, np.nan], [0.5, np.nan], [0.0, np.nan]]
+    )
+    assert np.isnan(masked_frequency(basecnt, totalcnt, min_depth=0)[0, 1])
+
+    chunks = list(iter_frequency_chunks(basecnt, totalcnt, 20, chunk_rows=2))
+    assert [rows for rows, _ in chunks] == [slice(0, 2), slice(2, 4)]
+    np.testing.assert_array_equal(np.vstack([f for _, f in chunks]), frequency)
+
+
+def test_multi_location_mutation_frequency(vpipe_tree, tmp_path):
+    """Matrices of several locations match the single-location runs."""
+    kwargs = dict(
+        basecnt_fps=vpipe_tree["basecnt_fps"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        mutations_of_interest_dir=vpipe_tree["mutations"],
+        basecnt_output_file=str(tmp_path / "basecnt_{location}.csv"),
+        total_output_file=str(tmp_path / "total_{location}.csv"),
+        frequency_output_file=str(tmp_path / "frequency_{location}.csv"),
+    )
+    matrices = run_mutation_frequency(**kwargs, location="all")
+    assert list(matrices) == ["Genève (GE)", "Zürich (ZH)"]
+
+    for location, (basecnt, totalcnt, frequency) in matrices.items():
+        single = run_mutation_frequency(
+            **{
+                key: value.replace("{location}", "single")
+                for key, value in kwargs.items()
+            },
+            location=location,
+        )
+        for multi, expected in zip((basecnt, totalcnt, frequency), single):
+            pd.testing.assert_frame_equal(multi, expected)
+        assert (tmp_path / f"frequency_{location}.csv").read_text() == (
+            tmp_path / "frequency_single.csv"
+        ).read_text()
+
+
+@pytest.mark.parametrize("location", ["Zürich (ZH)", ["Zürich (ZH)", "Genève (GE)"]])
+def test_incremental_mutation_frequency(vpipe_tree, tmp_path, monkeypatch, location):
+    """A rerun on the previous outputs loads only changed samples and mutations."""
+    name = "" if isinstance(location, str) else "_{location}"
+    kwargs = dict(
+        basecnt_fps=vpipe_tree["basecnt_fps"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        mutations_of_interest_dir=vpipe_tree["mutations"],
+        location=location,
+    )
+
+    def outputs(run):
+        return dict(
+            basecnt_output_file=str(tmp_path / f"{run}_basecnt{name}.csv"),
+            total_output_file=str(tmp_path / f"{run}_total{name}.csv"),
+            frequency_output_file=str(tmp_path / f"{run}_frequency{name}.csv"),
+        )
+
+    run_mutation_frequency(**outputs("week1"), **kwargs)
+    first = outputs("week1")["basecnt_output_file"].replace("{location}", "Zürich (ZH)")
+    assert len(read_manifest(first)) == 3
+
+    # one sample is rewritten and a mutation is added to the list
+    changed = next(vpipe_tree["results"].glob("A1_10*/*/alignments/basecnt.tsv.gz"))
+    counts = vpipe_tree["counts"]["A1_10_2024_03_01"][::-1].copy()
+    write_basecnt(changed, "A1_10_2024_03_01", counts)
+    stat = os.stat(changed)
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    mutations = pd.read_csv(vpipe_tree["mutations"])
+    pd.concat([mutations, pd.DataFrame({"mut": ["A42G"]})]).to_csv(
+        vpipe_tree["mutations"], index=False
+    )
+
+    calls = []
+    load_sample_coverages = frequency_module.load_sample_coverages
+
+    def counting_loader(basecnt_file, pos_mut, **loader_kwargs):
+        calls.append((basecnt_file.split("/")[-4], len(pos_mut)))
+        return load_sample_coverages(basecnt_file, pos_mut, **loader_kwargs)
+
+    monkeypatch.setattr(frequency_module, "load_sample_coverages", counting_loader)
+    previous = outputs("week1")
+    run_mutation_frequency(
+        **outputs("week2"),
+        **kwargs,
+        previous_basecnt_output=previous["basecnt_output_file"],
+        previous_total_output=previous["total_output_file"],
+    )
+    expected_calls = [
+        ("A1_05_2024_02_01", 1),
+        ("A1_10_2024_03_01", 5),
+        ("A1_16_2024_04_01", 1),
+    ]
+    if not isinstance(location, str):
+        expected_calls.insert(0, ("B2_05_2024_02_02", 1))
+    assert sorted(calls) == sorted(expected_calls)
+
+    monkeypatch.undo()
+    run_mutation_frequency(**outputs("fresh"), **kwargs)
+    fresh_files = sorted(tmp_path.glob("fresh_*.csv"))
+    assert len(fresh_files) == 3 * (1 if isinstance(location, str) else 2)
+    for fresh in fresh_files:
+        week2 = tmp_path / fresh.name.replace("fresh", "week2")
+        assert week2.read_text() == fresh.read_text()
@@ -0,0 +1,55 @@
+"""Test the per-stage timing and I/O metrics of the analyses."""
+
+import json
+import os
+
+import pytest
+
+from usefulgnom.analyze import run_basecnt_coverage, run_total_coverage_depth
+from conftest import GENOME_LENGTH
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_run_basecnt_coverage_metrics(vpipe_tree, tmp_path, n_workers):
+    """The metrics record the stages and the reads of the Zürich samples."""
+    metrics_file = tmp_path / "metrics.json"
+    run_basecnt_coverage(
+        vpipe_tree["basecnt_fps"],
+        vpipe_tree["timeline"],
+        vpipe_tree["mutations"],
+        str(tmp_path / "output.csv"),
+        n_workers=n_workers,
+        metrics_output=str(metrics_file),
+    )
+    metrics = json.loads(metrics_file.read_text())
+
+    assert {"timeline", "locate_files", "mutations", "load_samples", "write"} <= set(
+        metrics["stages"]
+    )
+    totals = metrics["totals"]
+    assert totals["samples"] == 3
+    assert totals["files_opened"] == 3
+    assert totals["rows_parsed"] == 3 * GENOME_LENGTH
+    slowest = metrics["slowest_samples"]
+    assert [sample["seconds"] for sample in slowest] == sorted(
+        (sample["seconds"] for sample in slowest), reverse=True
+    )
+    for sample in slowest:
+        assert sample["compressed_bytes"] == os.path.getsize(sample["path"])
+        assert sample["uncompressed_bytes"] > sample["compressed_bytes"]
+
+
+def test_run_total_coverage_depth_metrics_streaming(vpipe_tree, tmp_path):
+    """Streaming stops parsing past the largest position of interest."""
+    metrics_file = tmp_path / "metrics.json"
+    run_total_coverage_depth(
+        vpipe_tree["coverage_fps"],
+        vpipe_tree["mutations"],
+        vpipe_tree["timeline"],
+        str(tmp_path / "output.csv"),
+        streaming=True,
+        metrics_output=str(metrics_file),
+    )
+    totals = json.loads(metrics_file.read_text())["totals"]
+    assert totals["files_opened"] == 3
+    assert 0 < totals["rows_parsed"] <= 3 * GENOME_LENGTH
@@ -0,0 +1,40 @@
+"""Test the rolling-window statistics of the mutation frequencies."""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from usefulgnom.analyze import mutation_statistics
+
+
+def test_mutation_statistics_matches_pandas():
+    """Each window holds the statistics of pandas' median and quantiles."""
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2024-01-01", periods=120, freq="D")
+    dates = dates[rng.permutation(120)[:60]].strftime("%Y-%m-%d")
+    values = rng.random((6, 60))
+    values[rng.random((6, 60)) < 0.3] = np.nan
+    values[0] = np.nan
+    frequency = pd.DataFrame(values, index=list("ABCDEF"), columns=dates)
+
+    statistics = mutation_statistics(frequency, windows=(1, 4, 52), decimals=None)
+    assert list(statistics.columns) == ["mutation", "time", "statistic", "value"]
+    assert len(statistics) == 6 * 3 * 4
+
+    frequency.columns = pd.to_datetime(frequency.columns)
+    for weeks in (1, 4, 52):
+        window = frequency.loc[
+            :, frequency.columns >= frequency.columns.max() - timedelta(weeks=weeks)
+        ]
+        q1 = window.quantile(0.25, axis=1)
+        q3 = window.quantile(0.75, axis=1)
+        expected = pd.DataFrame(
+            {"Median": window.median(axis=1), "IQR": q3 - q1, "Q1": q1, "Q3": q3}
+        )
+        actual = statistics[statistics["time"] == f"{weeks}weeks"].pivot(
+            index="mutation", columns="statistic", values="value"
+        )
+        pd.testing.assert_frame_equal(
+            actual[expected.columns], expected, check_names=False
+        )
@@ -0,0 +1,42 @@
+"""Smoke test of the benchmark suite on a tiny synthetic tree."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parents[2] / "benchmarks"
+
+
+def test_run_benchmarks(tmp_path):
+    """Every case reports its wall time, peak RSS and decompressed bytes."""
+    output = tmp_path / "bench.jsonl"
+    subprocess.run(
+        [
+            sys.executable,
+            str(BENCHMARK_DIR / "run_benchmarks.py"),
+            "--samples",
+            "8",
+            "--mutations",
+            "5",
+            "--genome-length",
+            "2000",
+            "--work-dir",
+            str(tmp_path / "trees"),
+            "--output",
+            str(output),
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [record["case"] for record in records] == [
+        "basecnt_coverage",
+        "total_coverage",
+        "amplicon_coverage",
+    ]
+    for record in records:
+        assert record["wall_time_s"] > 0
+        assert record["peak_rss_bytes"] > 0
+        assert record["bytes_decompressed"] > 0
@@ -0,0 +1,80 @@
+"""Shared fixtures: small synthetic V-pipe result trees."""
+
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+GENOME_LENGTH = 300
+
+SAMPLES = [
+    # sample, batch, date, location, proto
+    ("A1_05_2024_02_01", "20240205_AAA", "2024-02-01", "Zürich (ZH)", "v41"),
+    ("A1_10_2024_03_01", "20240305_BBB", "2024-03-01", "Zürich (ZH)", "v41"),
+    ("A1_16_2024_04_01", "20240405_CCC", "2024-04-01", "Zürich (ZH)", "v41"),
+    ("B2_05_2024_02_02", "20240205_AAA", "2024-02-02", "Genève (GE)", "v41"),
+]
+
+MUTATIONS = ["C23G", "G100A", "T250C", "A7T"]
+
+
+def sample_counts(seed: int, length: int = GENOME_LENGTH) -> np.ndarray:
+    """Deterministic per-base counts (A, C, G, T, -) of a synthetic sample."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 500, size=(length, 5), dtype=np.uint32)
+
+
+def write_basecnt(path, sample: str, counts: np.ndarray) -> None:
+    """Write counts in the layout of V-pipe's basecnt.tsv.gz."""
+    lines = [
+        "sample\t\t" + "\t".join([sample] * 5),
+        "nt\t\tA\tC\tG\tT\t-",
+        "ref\tpos\t\t\t\t\t",
+    ]
+    for pos, row in enumerate(counts, start=1):
+        lines.append(f"NC_045512.2\t{pos}\t" + "\t".join(map(str, row)))
+    with gzip.open(path, "wt") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def write_coverage(path, sample: str, depth: np.ndarray) -> None:
+    """Write depths in the layout of V-pipe's coverage.tsv.gz."""
+    lines = [f"ref\tpos\t{sample}"]
+    for pos, value in enumerate(depth, start=1):
+        lines.append(f"NC_045512.2\t{pos}\t{value}")
+    with gzip.open(path, "wt") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def vpipe_tree(tmp_path):
+    """A results tree with basecnt/coverage files, a timeline and mutations."""
+    results = tmp_path / "results"
+    counts = {}
+    for seed, (sample, batch, date, location, proto) in enumerate(SAMPLES):
+        alignments = results / sample / batch / "alignments"
+        alignments.mkdir(parents=True)
+        counts[sample] = sample_counts(seed)
+        write_basecnt(alignments / "basecnt.tsv.gz", sample, counts[sample])
+        write_coverage(
+            alignments / "coverage.tsv.gz", sample, counts[sample].sum(axis=1)
+        )
+
+    timeline = tmp_path / "timeline.tsv"
+    pd.DataFrame(
+        SAMPLES, columns=["sample", "batch", "date", "location", "proto"]
+    ).to_csv(timeline, sep="\t", index=False)
+
+    mutations = tmp_path / "mutations_of_interest.csv"
+    pd.DataFrame({"mut": MUTATIONS}).to_csv(mutations, index=False)
+
+    return {
+        "root": tmp_path,
+        "results": results,
+        "basecnt_fps": str(results / "*" / "*" / "alignments" / "basecnt.tsv.gz"),
+        "coverage_fps": str(results / "*" / "*" / "alignments" / "coverage.tsv.gz"),
+        "timeline": str(timeline),
+        "mutations": str(mutations),
+        "counts": counts,
+    }
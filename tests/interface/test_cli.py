@@ -0,0 +1,117 @@
+"""Test the usefulgnom command line interface and its start-up time."""
+
+import subprocess
+import sys
+import time
+
+import pandas as pd
+from click.testing import CliRunner
+
+from usefulgnom.analyze import mutation_statistics, run_mutation_frequency
+from usefulgnom.analyze.depth_summary import (
+    DEFAULT_QUANTILES,
+    DEFAULT_RELATIVE_ACCURACY,
+)
+from usefulgnom.analyze.statistics import DEFAULT_WINDOWS
+from usefulgnom.interface import cli
+from usefulgnom.serialize.bgzf import DEFAULT_BLOCK_SIZE
+from usefulgnom.serialize.cache import DEFAULT_MAX_BYTES
+from usefulgnom.serialize.matrix import MATRIX_FORMATS
+from usefulgnom.serialize.parsers import DEFAULT_PARSER, PARSERS
+
+# wall time of `python -m usefulgnom --help`, about 0.1 s against 0.8 s for
+# the former amplicon_covs.py script importing pandas and matplotlib
+STARTUP_BUDGET_S = 0.5
+
+HEAVY_MODULES = ["numpy", "pandas", "matplotlib", "seaborn", "pyarrow"]
+
+
+def test_startup():
+    """The CLI starts within its budget, without the heavy dependencies."""
+    code = (
+        "import sys, usefulgnom, usefulgnom.interface, usefulgnom.interface.cli; "
+        "print(sorted({m.split('.')[0] for m in sys.modules}))"
+    )
+    loaded = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert not [module for module in HEAVY_MODULES if f"'{module}'" in loaded]
+
+    durations = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "usefulgnom", "--help"],
+            capture_output=True,
+            check=True,
+        )
+        durations.append(time.perf_counter() - start)
+    assert min(durations) < STARTUP_BUDGET_S
+
+
+def test_option_choices_in_sync():
+    """The choices of the CLI mirror the constants of the lazy modules."""
+    assert cli.PARSERS == PARSERS
+    assert cli.DEFAULT_PARSER == DEFAULT_PARSER
+    assert cli.MATRIX_FORMATS == MATRIX_FORMATS
+    assert cli.DEFAULT_CACHE_MEMORY * 1024**2 == DEFAULT_MAX_BYTES
+    assert cli.DEFAULT_BLOCK_SIZE == DEFAULT_BLOCK_SIZE
+    assert cli.DEFAULT_WINDOWS == DEFAULT_WINDOWS
+    assert cli.DEFAULT_QUANTILES == DEFAULT_QUANTILES
+    assert cli.DEFAULT_RELATIVE_ACCURACY == DEFAULT_RELATIVE_ACCURACY
+
+
+def test_analysis_commands(vpipe_tree, tmp_path):
+    """The subcommands write the matrices and statistics of the analysis."""
+    expected = run_mutation_frequency(
+        vpipe_tree["basecnt_fps"],
+        vpipe_tree["timeline"],
+        vpipe_tree["mutations"],
+        *[str(tmp_path / f"{name}.csv") for name in ["basecnt", "total", "freq"]],
+    )
+    runner = CliRunner()
+    options = ["-t", vpipe_tree["timeline"], "-m", vpipe_tree["mutations"]]
+
+    outdir = tmp_path / "out"
+    result = runner.invoke(
+        cli.main,
+        ["mutation-frequency", "-b", vpipe_tree["basecnt_fps"], "-o", str(outdir)]
+        + options,
+    )
+    assert result.exit_code == 0, result.output
+    for name, reference in zip(
+        ["mut_base_coverage", "mut_total_coverage", "frequency_data_matrix"],
+        ["basecnt", "total", "freq"],
+    ):
+        written = (outdir / f"{name}.csv").read_text()
+        assert written == (tmp_path / f"{reference}.csv").read_text()
+
+    result = runner.invoke(
+        cli.main,
+        ["total-coverage", "-c", vpipe_tree["coverage_fps"]]
+        + options
+        + ["-o", str(tmp_path / "total_cli.csv")],
+    )
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "total_cli.csv").read_text() == (
+        tmp_path / "total.csv"
+    ).read_text()
+
+    result = runner.invoke(
+        cli.main,
+        [
+            "mutation-statistics",
+            str(outdir / "frequency_data_matrix.csv"),
+            "-o",
+            str(tmp_path / "statistics.csv"),
+            "-w",
+            "4",
+            "-w",
+            "12",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    pd.testing.assert_frame_equal(
+        pd.read_csv(tmp_path / "statistics.csv"),
+        mutation_statistics(expected[2], windows=(4, 12)),
+    )
@@ -0,0 +1,175 @@
+"""Test the local coverage query server and its client."""
+
+import http.client
+import json
+import threading
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from usefulgnom.analyze import run_mutation_frequency
+from usefulgnom.interface import CoverageClient, CoverageServer, CoverageService
+
+from conftest import sample_counts, write_basecnt, write_coverage
+
+
+def test_service_matches_analysis(vpipe_tree, tmp_path):
+    """Queries answer the matrices of the analysis, refreshed as the tree changes."""
+    mutations = list(pd.read_csv(vpipe_tree["mutations"])["mut"])
+    outputs = [str(tmp_path / f"{name}.csv") for name in ["basecnt", "total", "freq"]]
+    expected = run_mutation_frequency(
+        vpipe_tree["basecnt_fps"],
+        vpipe_tree["timeline"],
+        vpipe_tree["mutations"],
+        *outputs,
+    )
+    # room for two samples only
+    service = CoverageService(
+        vpipe_tree["basecnt_fps"],
+        vpipe_tree["timeline"],
+        max_bytes=2 * 300 * 6 * 4,
+        genome_length=300,
+        refresh_interval=None,
+    )
+    start, end = datetime(2024, 1, 1), datetime(2024, 7, 3)
+    for kind, matrix in zip(["basecnt", "depth", "frequency"], expected):
+        pd.testing.assert_frame_equal(
+            service.query(mutations, "Zürich (ZH)", start, end, kind),
+            matrix,
+            check_freq=False,
+        )
+    assert service.stats()["samples_in_memory"] == 2
+    assert service.stats()["evictions"] > 0
+    with pytest.raises(ValueError, match="nucleotide"):
+        service.query(["23"], "Zürich (ZH)", kind="basecnt")
+    with pytest.raises(ValueError, match="not found"):
+        service.query(["C301G"], "Zürich (ZH)")
+
+    # a rewritten coverage file is reloaded after a refresh
+    alignments = next(vpipe_tree["results"].glob("A1_16*/*/alignments"))
+    write_coverage(alignments / "coverage.tsv.gz", "A1_16_2024_04_01", range(300))
+    assert service.refresh() == 1
+    depth = service.query(["G100A"], "Zürich (ZH)", kind="depth")
+    assert depth.loc["G100A", pd.Timestamp("2024-04-01")] == 99
+
+    # a sample added to the timeline is answered by the next query
+    alignments = vpipe_tree["results"] / "A1_20_2024_05_01" / "20240505_DDD"
+    alignments = alignments / "alignments"
+    alignments.mkdir(parents=True)
+    counts = sample_counts(10)
+    write_basecnt(alignments / "basecnt.tsv.gz", "A1_20_2024_05_01", counts)
+    write_coverage(alignments / "coverage.tsv.gz", "A1_20", counts.sum(axis=1))
+    with open(vpipe_tree["timeline"], "a") as file:
+        file.write("A1_20_2024_05_01\t20240505_DDD\t2024-05-01\tZürich (ZH)\tv41\n")
+    depth = service.query(["G100A"], "Zürich (ZH)", kind="depth")
+    assert depth.loc["G100A", pd.Timestamp("2024-05-01")] == counts[99].sum()
+
+
+def test_concurrent_clients(vpipe_tree):
+    """Clients on several threads get the answers of the service."""
+    service = CoverageService(
+        vpipe_tree["basecnt_fps"], vpipe_tree["timeline"], genome_length=300
+    )
+    assert service.preload("Zürich (ZH)") == 3
+    expected = service.query(["C23G", "A7T"], "Zürich (ZH)", kind="basecnt")
+
+    server = CoverageServer(service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        results, errors = [], []
+
+        def run_client():
+            client = CoverageClient(server.url)
+            try:
+                for _ in range(10):
+                    results.append(
+                        client.query(["C23G", "A7T"], "Zürich (ZH)", kind="basecnt")
+                    )
+                with pytest.raises(ValueError, match="Unknown query kind"):
+                    client.query(["C23G"], "Zürich (ZH)", kind="coverage")
+            except AssertionError as error:
+                errors.append(error)
+            finally:
+                client.close()
+
+        clients = [threading.Thread(target=run_client) for _ in range(4)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        assert errors == []
+        assert len(results) == 40
+        for result in results:
+            pd.testing.assert_frame_equal(result, expected, check_freq=False)
+
+        client = CoverageClient(server.url)
+        assert client.locations() == ["Genève (GE)", "Zürich (ZH)"]
+        frequency = client.query(
+            ["T250C"], "Zürich (ZH)", "2024-02-01", "2024-07-03", min_depth=10**6
+        )
+        # exclusive start date, every frequency masked
+        assert list(frequency.columns.strftime("%Y-%m-%d")) == [
+            "2024-03-01",
+            "2024-04-01",
+        ]
+        assert frequency.isna().all().all()
+        assert client.stats()["queries"] == 42
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_server_errors(vpipe_tree, monkeypatch):
+    """Failed queries are answered with a JSON error on the same connection."""
+    # globbed once, with room for one sample and no automatic refresh
+    service = CoverageService(
+        vpipe_tree["basecnt_fps"].replace(".tsv.gz", ".tsv.g?"),
+        vpipe_tree["timeline"],
+        max_bytes=300 * 6 * 4,
+        genome_length=300,
+        refresh_interval=None,
+    )
+    server = CoverageServer(service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+    try:
+
+        def get(path):
+            connection.request("GET", path)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+
+        query = "/query?mutation=G100A&location=Z%C3%BCrich+(ZH)&kind=depth"
+        assert get(query)[0] == 200
+
+        # a sample file deleted between two refreshes, and evicted since
+        basecnt_file = next(
+            vpipe_tree["results"].glob("A1_05*/*/alignments/basecnt.tsv.gz")
+        )
+        basecnt_file.unlink()
+        status, body = get(query)
+        assert status == 404
+        assert str(basecnt_file) in body["error"]
+
+        def failing_query(*args):
+            raise KeyError("C23G")
+
+        monkeypatch.setattr(service, "query", failing_query)
+        status, body = get(query)
+        assert status == 500
+        assert body["error"] == "KeyError: 'C23G'"
+        # the connection is still usable after the errors
+        assert get("/health") == (200, {"status": "ok"})
+
+        client = CoverageClient(server.url)
+        with pytest.raises(ValueError, match="KeyError"):
+            client.query(["G100A"], "Zürich (ZH)", kind="depth")
+        client.close()
+    finally:
+        connection.close()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,86 @@
+"""Test the BGZF coverage files and their position index."""
+
+import gzip
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from usefulgnom.serialize import load_convert_bnc, load_convert_total
+from usefulgnom.serialize.bgzf import convert_to_bgzf, load_position_index
+from usefulgnom.serialize.metrics import collect_reads
+
+from conftest import write_coverage
+
+
+def test_indexed_read_matches_full_parse(vpipe_tree):
+    """Only the blocks of the positions are inflated, the values are unchanged."""
+    alignments = next(vpipe_tree["results"].glob("A1_10*/*/alignments"))
+    basecnt_fp = str(alignments / "basecnt.tsv.gz")
+    coverage_fp = str(alignments / "coverage.tsv.gz")
+    pos_mut = [("250", "C"), ("7", "T"), ("23", "-"), ("24", "A")]
+    expected_bnc = load_convert_bnc(basecnt_fp, pos_mut)
+    expected_total = load_convert_total(coverage_fp, ["250", "7", "300"])
+    content = gzip.decompress((alignments / "basecnt.tsv.gz").read_bytes())
+
+    convert_to_bgzf(basecnt_fp, block_size=256)
+    convert_to_bgzf(coverage_fp, block_size=256)
+    # still a gzip file of the same content
+    assert gzip.decompress((alignments / "basecnt.tsv.gz").read_bytes()) == content
+    assert load_position_index(basecnt_fp).first_positions[0] == 1
+
+    with collect_reads() as reads:
+        np.testing.assert_array_equal(
+            load_convert_bnc(basecnt_fp, pos_mut), expected_bnc
+        )
+        np.testing.assert_array_equal(
+            load_convert_total(coverage_fp, ["250", "7", "300"]), expected_total
+        )
+    assert reads[0]["uncompressed_bytes"] < len(content) / 10
+    # whole-file parsers read the BGZF file as any gzip file
+    np.testing.assert_array_equal(
+        load_convert_bnc(basecnt_fp, pos_mut, streaming=True), expected_bnc
+    )
+
+    with pytest.raises(ValueError, match="not found"):
+        load_convert_total(coverage_fp, ["301"])
+
+
+def test_stale_index_is_ignored(vpipe_tree, tmp_path):
+    """A file rewritten after indexing is read in full, not through its index."""
+    alignments = next(vpipe_tree["results"].glob("A1_10*/*/alignments"))
+    coverage_fp = str(alignments / "coverage.tsv.gz")
+    original = tmp_path / "coverage.tsv.gz"
+    shutil.copy(coverage_fp, original)
+    expected = load_convert_total(coverage_fp, ["1", "150"])
+
+    convert_to_bgzf(coverage_fp)
+    shutil.copy(original, coverage_fp)
+    assert load_position_index(coverage_fp) is None
+    np.testing.assert_array_equal(
+        load_convert_total(coverage_fp, ["1", "150"]), expected
+    )
+
+    with pytest.raises(ValueError, match="block size"):
+        convert_to_bgzf(coverage_fp, block_size=70000)
+
+
+def test_same_size_rewrite_is_detected(tmp_path):
+    """A file rewritten with the same size is not read through its old index."""
+    coverage_fp = str(tmp_path / "coverage.tsv.gz")
+    write_coverage(coverage_fp, "A1_10_2024_03_01", [500] * 300)
+    # stored blocks: the size only depends on the length of the content
+    convert_to_bgzf(coverage_fp, block_size=256, level=0)
+    size = os.path.getsize(coverage_fp)
+
+    rewritten = str(tmp_path / "rewritten.tsv.gz")
+    write_coverage(rewritten, "A1_10_2024_03_01", [600] * 300)
+    convert_to_bgzf(rewritten, block_size=256, level=0)
+    stat = os.stat(coverage_fp)
+    shutil.copyfile(rewritten, coverage_fp)
+    os.utime(coverage_fp, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert os.path.getsize(coverage_fp) == size
+
+    assert load_position_index(coverage_fp) is None
+    np.testing.assert_array_equal(load_convert_total(coverage_fp, ["1", "150"]), 600)
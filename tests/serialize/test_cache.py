@@ -0,0 +1,45 @@
+"""Test the decoded coverage cache."""
+
+import os
+
+import numpy as np
+
+from usefulgnom.serialize import CoverageCache, load_convert_bnc, load_convert_total
+from usefulgnom.serialize.basecnt_coverage import read_basecnt_array
+
+
+def test_load_convert_with_cache(vpipe_tree, tmp_path):
+    """Cached and uncached loaders extract the same coverages."""
+    sample = "A1_05_2024_02_01"
+    alignments = vpipe_tree["results"] / sample / "20240205_AAA" / "alignments"
+    basecnt_fp = str(alignments / "basecnt.tsv.gz")
+    coverage_fp = str(alignments / "coverage.tsv.gz")
+    cache = CoverageCache(str(tmp_path / "cache"))
+
+    pos_mut = [("23", "G"), ("100", "A"), ("7", "T")]
+    expected = load_convert_bnc(basecnt_fp, pos_mut)
+    for _ in range(2):
+        cached = load_convert_bnc(basecnt_fp, pos_mut, cache)
+        np.testing.assert_array_equal(cached, expected)
+
+    expected = load_convert_total(coverage_fp, ["23", "100", "7"])
+    cached = load_convert_total(coverage_fp, ["23", "100", "7"], cache)
+    np.testing.assert_array_equal(cached, expected)
+    assert len(list((tmp_path / "cache").glob("*.npy"))) == 2
+
+
+def test_cache_invalidation_and_eviction(vpipe_tree, tmp_path):
+    """A modified file is decoded again and the cache stays within its bound."""
+    basecnt_fps = sorted(vpipe_tree["results"].glob("*/*/alignments/basecnt.tsv.gz"))
+    entry_size = read_basecnt_array(str(basecnt_fps[0])).nbytes + 128
+    cache = CoverageCache(str(tmp_path / "cache"), max_bytes=2 * entry_size)
+
+    key = cache.key(str(basecnt_fps[0]), "basecnt")
+    stat = os.stat(basecnt_fps[0])
+    os.utime(basecnt_fps[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.key(str(basecnt_fps[0]), "basecnt") != key
+
+    for path in basecnt_fps:
+        cache.load(str(path), "basecnt", read_basecnt_array)
+        assert cache.size() <= 2 * entry_size
+    assert len(list((tmp_path / "cache").glob("*.npy"))) == 2
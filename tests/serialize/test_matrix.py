@@ -0,0 +1,68 @@
+"""Test the typed CSV, Parquet and Arrow IPC matrix files."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from usefulgnom.analyze.frequency import mutation_frequency, write_frequency_matrix
+from usefulgnom.serialize.matrix import (
+    matrix_columns,
+    matrix_format,
+    read_matrix,
+    write_matrix,
+)
+
+
+@pytest.fixture
+def coverage():
+    """Coverage matrix of 4 mutations x 3 sample dates."""
+    dates = pd.DatetimeIndex(pd.to_datetime(["2024-01-02", "2024-01-09", "2024-01-16"]))
+    return pd.DataFrame(
+        np.arange(12, dtype=np.uint32).reshape(4, 3) * 7,
+        index=pd.Index(["C23039G", "G22599C", "T22926C", "A23063T"], name="mut"),
+        columns=dates,
+    )
+
+
+@pytest.mark.parametrize("suffix", [".parquet", ".arrow"])
+def test_binary_matrix_round_trip(coverage, tmp_path, suffix):
+    """Dtypes and date columns survive, only selected columns and rows are read."""
+    path = str(tmp_path / f"mut_base_coverage{suffix}")
+    write_matrix(coverage, path)
+    pd.testing.assert_frame_equal(read_matrix(path), coverage, check_freq=False)
+    pd.testing.assert_index_equal(matrix_columns(path), coverage.columns)
+
+    selected = read_matrix(path, columns=["2024-01-16"], rows=["A23063T", "G22599C"])
+    pd.testing.assert_frame_equal(
+        selected, coverage.iloc[[1, 3], [2]], check_freq=False
+    )
+    assert selected.dtypes.iloc[0] == np.uint32
+    with pytest.raises(KeyError, match="2024-02-01"):
+        read_matrix(path, columns=["2024-02-01"])
+
+
+def test_csv_matrix_matches_to_csv(coverage, tmp_path):
+    """CSV matrices are written as before, and read back with date columns."""
+    path = tmp_path / "mut_base_coverage.csv"
+    write_matrix(coverage, str(path))
+    assert path.read_text() == coverage.to_csv()
+    matrix = read_matrix(str(path), columns=[pd.Timestamp("2024-01-09")])
+    assert list(matrix.columns) == [pd.Timestamp("2024-01-09")]
+    assert list(matrix.iloc[:, 0]) == [7, 28, 49, 70]
+
+    assert matrix_format("matrix.pq") == "parquet"
+    with pytest.raises(ValueError, match="Unknown matrix format"):
+        matrix_format("matrix.csv", "xlsx")
+
+
+def test_chunked_frequency_matrix_as_parquet(coverage, tmp_path):
+    """Frequencies written in blocks of rows are the in-memory float32 matrix."""
+    totalcnt = coverage + 30
+    expected = mutation_frequency(coverage, totalcnt, min_depth=40).astype(np.float32)
+    path = str(tmp_path / "frequency_data_matrix.parquet")
+    write_frequency_matrix(coverage, totalcnt, path, min_depth=40, chunk_rows=3)
+    pd.testing.assert_frame_equal(read_matrix(path), expected, check_freq=False)
+
+    # an empty matrix keeps its columns
+    write_frequency_matrix(coverage.iloc[:0], totalcnt.iloc[:0], path)
+    pd.testing.assert_index_equal(read_matrix(path).columns, coverage.columns)
@@ -0,0 +1,116 @@
+"""Test the parser backends of the coverage files."""
+
+import gzip
+
+import numpy as np
+import pytest
+
+from usefulgnom.serialize import parsers
+from usefulgnom.serialize import prefetch as prefetch_module
+from usefulgnom.serialize.metrics import collect_reads
+from usefulgnom.serialize.prefetch import prefetch
+from usefulgnom.serialize.parsers import (
+    available_parsers,
+    compare_parsers,
+    parse_numpy_bytes,
+    read_columns,
+)
+
+
+def test_backends_agree(vpipe_tree):
+    """All available backends return the same uint32 arrays."""
+    alignments = next(vpipe_tree["results"].glob("A1_10*/*/alignments"))
+    counts = vpipe_tree["counts"]["A1_10_2024_03_01"]
+
+    for parser in available_parsers() + ["compare"]:
+        basecnt = read_columns(
+            str(alignments / "basecnt.tsv.gz"), [1, 2, 3, 4, 5, 6], 3, parser
+        )
+        assert basecnt.dtype == np.uint32
+        np.testing.assert_array_equal(basecnt[:, 0], np.arange(1, 301))
+        np.testing.assert_array_equal(basecnt[:, 1:], counts)
+
+        depth = read_columns(str(alignments / "coverage.tsv.gz"), [2, 1], 1, parser)
+        np.testing.assert_array_equal(depth[:, 0], counts.sum(axis=1))
+        np.testing.assert_array_equal(depth[:, 1], np.arange(1, 301))
+
+    values, _, _, timings = compare_parsers(
+        str(alignments / "coverage.tsv.gz"), [1, 2], 1
+    )
+    np.testing.assert_array_equal(values[:, 1], counts.sum(axis=1))
+    assert sorted(timings["parser"]) == sorted(available_parsers())
+
+    with pytest.raises(ValueError, match="Unknown parser"):
+        read_columns(str(alignments / "coverage.tsv.gz"), [1, 2], 1, "polars")
+
+
+def test_numpy_backend_rejects_malformed_input():
+    """Malformed fields are reported instead of silently misparsed."""
+    header = b"ref\tpos\tsample\n"
+    np.testing.assert_array_equal(
+        parse_numpy_bytes(header + b"NC\t1\t5\nNC\t2\t7", [2], 1), [[5], [7]]
+    )
+    with pytest.raises(ValueError, match="number of columns"):
+        parse_numpy_bytes(header + b"NC\t1\t5\nNC\t2\n", [1, 2], 1)
+    with pytest.raises(ValueError, match="non-number"):
+        parse_numpy_bytes(header + b"NC\t1\tx5\n", [1, 2], 1)
+    with pytest.raises(ValueError, match="non-number"):
+        parse_numpy_bytes(header + b"NC\t1\t\n", [1, 2], 1)
+    with pytest.raises(ValueError, match="uint32"):
+        parse_numpy_bytes(header + b"NC\t1\t4294967296\n", [1, 2], 1)
+
+
+def test_compare_detects_disagreement(tmp_path, monkeypatch):
+    """The comparison mode fails if two backends disagree."""
+    coverage_fp = tmp_path / "coverage.tsv.gz"
+    with gzip.open(coverage_fp, "wt") as file:
+        file.write("ref\tpos\tsample\nNC\t1\t5\nNC\t2\t7\n")
+
+    monkeypatch.setitem(
+        parsers.BACKENDS,
+        "numpy",
+        lambda path, usecols, skiprows: (np.zeros((2, 2), dtype=np.uint32), 0, 0),
+    )
+    with pytest.raises(ValueError, match="disagree"):
+        read_columns(str(coverage_fp), [1, 2], 1, "compare")
+
+
+def test_compare_reads_each_backend_once(vpipe_tree, monkeypatch):
+    """The comparison parses once per backend and records all of their reads."""
+    coverage_fp = str(
+        next(vpipe_tree["results"].glob("A1_10*/*/alignments/coverage.tsv.gz"))
+    )
+    calls = []
+    for name, backend in list(parsers.BACKENDS.items()):
+
+        def counting_backend(path, usecols, skiprows, name=name, backend=backend):
+            calls.append(name)
+            return backend(path, usecols, skiprows)
+
+        monkeypatch.setitem(parsers.BACKENDS, name, counting_backend)
+
+    with collect_reads() as reads:
+        single = read_columns(coverage_fp, [1, 2], 1, "numpy")
+    with collect_reads() as compared_reads:
+        values = read_columns(coverage_fp, [1, 2], 1, "compare")
+    np.testing.assert_array_equal(values, single)
+    assert calls == ["numpy"] + available_parsers()
+    n_backends = len(available_parsers())
+    assert len(compared_reads) == 1
+    assert compared_reads[0]["compressed_bytes"] == (
+        n_backends * reads[0]["compressed_bytes"]
+    )
+    assert compared_reads[0]["uncompressed_bytes"] == (
+        n_backends * reads[0]["uncompressed_bytes"]
+    )
+
+    # a prefetched file is parsed from memory by every backend, read once
+    calls.clear()
+    with collect_reads() as prefetched_reads:
+        for path in prefetch([coverage_fp], n_threads=1):
+            monkeypatch.setattr(prefetch_module, "read_gzip", None)
+            np.testing.assert_array_equal(
+                read_columns(path, [1, 2], 1, "compare"), single
+            )
+    assert calls == available_parsers()
+    assert prefetched_reads == reads
@@ -0,0 +1,127 @@
+"""Test the prefetching of coverage files on background threads."""
+
+import threading
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from usefulgnom.analyze import run_depth_summary, run_mutation_frequency
+from usefulgnom.analyze.coverage import load_samples
+from usefulgnom.analyze.frequency import load_sample_coverages, sample_coverage_files
+from usefulgnom.serialize import prefetch as prefetch_module
+from usefulgnom.serialize.bgzf import convert_to_bgzf
+from usefulgnom.serialize.parsers import read_columns
+from usefulgnom.serialize.prefetch import prefetch
+
+
+def test_prefetch_bounds_files_ahead(vpipe_tree, monkeypatch):
+    """Files are decompressed ahead at most depth samples and parsed from memory."""
+    basecnt_files = sorted(
+        str(path)
+        for path in vpipe_tree["results"].glob("*/*/alignments/basecnt.tsv.gz")
+    )
+    read_gzip = prefetch_module.read_gzip
+    fetched, lock = [], threading.Lock()
+
+    def counting_read_gzip(path):
+        with lock:
+            fetched.append(path)
+        return read_gzip(path)
+
+    monkeypatch.setattr(prefetch_module, "read_gzip", counting_read_gzip)
+
+    consumed = []
+    for path in prefetch(basecnt_files * 3, n_threads=2, depth=2):
+        # the sample being loaded plus at most depth samples ahead
+        assert len(fetched) <= len(consumed) + 3
+        values = read_columns(path, [1, 2, 3, 4, 5, 6], 3, "numpy")
+        sample = path.split("/")[-4]
+        np.testing.assert_array_equal(values[:, 1:], vpipe_tree["counts"][sample])
+        consumed.append(path)
+    assert consumed == basecnt_files * 3
+    # each file was decompressed once, by the prefetch threads only
+    assert len(fetched) == len(consumed)
+    assert prefetch_module._prefetched == {}
+
+    with pytest.raises(ValueError, match="threads"):
+        next(prefetch(basecnt_files, n_threads=0))
+
+
+def test_load_samples_with_prefetch(vpipe_tree):
+    """Prefetching threads load the same coverages as a serial load."""
+    basecnt_files = sorted(
+        str(path)
+        for path in vpipe_tree["results"].glob("*/*/alignments/basecnt.tsv.gz")
+    )
+    loader = partial(load_sample_coverages, pos_mut=[("23", "G"), ("100", "A")])
+    expected = load_samples(loader, basecnt_files)
+
+    for parser in ["pandas", "numpy"]:
+        loaded = load_samples(
+            partial(loader, parser=parser),
+            basecnt_files,
+            prefetch_threads=2,
+            sample_files=sample_coverage_files,
+        )
+        for (basecnt, total), (expected_basecnt, expected_total) in zip(
+            loaded, expected
+        ):
+            np.testing.assert_array_equal(basecnt, expected_basecnt)
+            np.testing.assert_array_equal(total, expected_total)
+
+    # a missing file is reported by its loader, as without prefetching
+    with pytest.raises(FileNotFoundError):
+        load_samples(
+            loader, basecnt_files + ["missing/basecnt.tsv.gz"], prefetch_threads=2
+        )
+
+
+def test_prefetch_skips_cached_and_indexed_files(vpipe_tree, tmp_path, monkeypatch):
+    """Files answered by the decoded cache or a position index are not prefetched."""
+    read_gzip = prefetch_module.read_gzip
+    fetched, lock = [], threading.Lock()
+
+    def counting_read_gzip(path):
+        with lock:
+            fetched.append(path)
+        return read_gzip(path)
+
+    monkeypatch.setattr(prefetch_module, "read_gzip", counting_read_gzip)
+    kwargs = dict(
+        basecnt_fps=vpipe_tree["basecnt_fps"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        mutations_of_interest_dir=vpipe_tree["mutations"],
+        basecnt_output_file=str(tmp_path / "basecnt.csv"),
+        total_output_file=str(tmp_path / "total.csv"),
+        frequency_output_file=str(tmp_path / "frequency.csv"),
+        prefetch_threads=2,
+    )
+    cache_dir = str(tmp_path / "cache")
+    # cold cache: the basecnt and coverage files of the 3 samples
+    expected = run_mutation_frequency(**kwargs, cache_dir=cache_dir)
+    assert len(fetched) == 6
+
+    fetched.clear()
+    matrices = run_mutation_frequency(**kwargs, cache_dir=cache_dir)
+    assert fetched == []
+    for matrix, expected_matrix in zip(matrices, expected):
+        pd.testing.assert_frame_equal(matrix, expected_matrix)
+    run_depth_summary(
+        vpipe_tree["coverage_fps"],
+        vpipe_tree["timeline"],
+        str(tmp_path / "depth_summary.csv"),
+        genome_length=300,
+        cache_dir=cache_dir,
+        prefetch_threads=2,
+    )
+    assert fetched == []
+
+    # without a cache, the BGZF files are read by their position index
+    for path in vpipe_tree["results"].glob("*/*/alignments/*.tsv.gz"):
+        convert_to_bgzf(str(path), block_size=256)
+    matrices = run_mutation_frequency(**kwargs)
+    assert fetched == []
+    for matrix, expected_matrix in zip(matrices, expected):
+        pd.testing.assert_frame_equal(matrix, expected_matrix)
@@ -0,0 +1,54 @@
+"""Test compiling and caching primer schemes."""
+
+import numpy as np
+import pandas as pd
+
+from usefulgnom.serialize.primer_scheme import (
+    compile_primer_scheme,
+    load_primer_scheme,
+)
+
+BED = """\
+MN908947.3\t30\t54\tnCoV-2019_1_LEFT\tnCoV-2019_1\t+
+MN908947.3\t385\t410\tnCoV-2019_1_RIGHT\tnCoV-2019_1\t-
+MN908947.3\t320\t342\tnCoV-2019_2_LEFT\tnCoV-2019_2\t+
+MN908947.3\t704\t726\tnCoV-2019_2_RIGHT\tnCoV-2019_2\t-
+MN908947.3\t690\t712\tnCoV-2019_2_RIGHT_alt1\tnCoV-2019_2\t-
+MN908947.3\t642\t664\tnCoV-2019_3_LEFT\tnCoV-2019_1\t+
+MN908947.3\t1004\t1028\tnCoV-2019_3_RIGHT\tnCoV-2019_1\t-
+"""
+
+
+def test_compile_primer_scheme(tmp_path):
+    """Amplicons and query windows are derived from neighbouring primers."""
+    bed = tmp_path / "scheme.bed"
+    bed.write_text(BED)
+
+    scheme = compile_primer_scheme(bed)
+    assert list(scheme.amplicons["primer_num"]) == [1.0, 2.0, 3.0]
+    assert list(scheme.amplicons["pool"]) == [1.0, 2.0, 1.0]
+    assert list(scheme.amplicons["seq_end"]) == [385.0, 704.0, 1004.0]
+    assert list(scheme.amplicons["query_start"]) == [30.0, 415.0, 731.0]
+    assert list(scheme.amplicons["query_end"]) == [315.0, 637.0, 1004.0]
+    np.testing.assert_array_equal(scheme.index[1][scheme.valid[1]], np.arange(617, 637))
+
+
+def test_load_primer_scheme_cache(tmp_path):
+    """A cached scheme equals the compiled one."""
+    bed = tmp_path / "scheme.bed"
+    bed.write_text(BED)
+    cache_dir = tmp_path / "schemes"
+
+    expected = compile_primer_scheme(bed)
+    for _ in range(2):
+        scheme = load_primer_scheme(bed, cache_dir=str(cache_dir))
+        pd.testing.assert_frame_equal(scheme.amplicons, expected.amplicons)
+        np.testing.assert_array_equal(scheme.index, expected.index)
+        np.testing.assert_array_equal(scheme.valid, expected.valid)
+    assert len(list(cache_dir.glob("*.npz"))) == 1
+
+    # a changed bed file is compiled again
+    bed.write_text(BED.replace("\t385\t", "\t380\t"))
+    scheme = load_primer_scheme(bed, cache_dir=str(cache_dir))
+    assert scheme.amplicons["seq_end"].iloc[0] == 380.0
+    assert len(list(cache_dir.glob("*.npz"))) == 2
@@ -0,0 +1,43 @@
+"""Test the streaming parse of coverage files."""
+
+import gzip
+
+import numpy as np
+import pytest
+
+from usefulgnom.serialize import load_convert_bnc, load_convert_total
+from usefulgnom.serialize.coverage import stream_positions
+
+
+def test_streaming_matches_full_parse(vpipe_tree):
+    """Streaming and full parse extract the same coverages."""
+    alignments = next(vpipe_tree["results"].glob("A1_10*/*/alignments"))
+    pos_mut = [("250", "C"), ("7", "T"), ("23", "-")]
+
+    np.testing.assert_array_equal(
+        load_convert_bnc(str(alignments / "basecnt.tsv.gz"), pos_mut, streaming=True),
+        load_convert_bnc(str(alignments / "basecnt.tsv.gz"), pos_mut),
+    )
+    np.testing.assert_array_equal(
+        load_convert_total(
+            str(alignments / "coverage.tsv.gz"), ["250", "7", "23"], streaming=True
+        ),
+        load_convert_total(str(alignments / "coverage.tsv.gz"), ["250", "7", "23"]),
+    )
+    with pytest.raises(ValueError, match="not found"):
+        load_convert_total(str(alignments / "coverage.tsv.gz"), ["301"], streaming=True)
+
+
+def test_streaming_stops_after_max_position(tmp_path):
+    """Rows past the largest requested position are never parsed."""
+    coverage_fp = tmp_path / "coverage.tsv.gz"
+    lines = ["ref\tpos\tsample"]
+    lines += [f"NC_045512.2\t{pos}\t{pos * 2}" for pos in range(1, 101)]
+    lines += ["not\ta\tnumber"] * 100
+    with gzip.open(coverage_fp, "wt") as file:
+        file.write("\n".join(lines) + "\n")
+
+    values = stream_positions(
+        str(coverage_fp), [40, 3], usecols=[1, 2], skiprows=1, chunksize=50
+    )
+    np.testing.assert_array_equal(values[:, 0], [80, 6])
@@ -0,0 +1,77 @@
+"""Test the indexed, cached timeline lookups."""
+
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from usefulgnom.serialize import extract_sample_ID, load_timeline_index
+from usefulgnom.serialize import timeline
+
+
+def test_timeline_index_matches_filter(tmp_path):
+    """Queries select what filtering the parsed timeline selects."""
+    timeline_fp = tmp_path / "timeline.tsv"
+    pd.DataFrame(
+        {
+            "sample": [f"S{i}" for i in range(8)],
+            "proto": ["v41", "v532", "v41", None, "v41", "v41", "v532", "v41"],
+            "date": [
+                "2024-03-01",
+                "2024-01-15",
+                "2024-02-01",
+                "2024-02-10",
+                "2024-01-01",
+                None,
+                "2024-02-20",
+                "2024-02-05",
+            ],
+            "location": ["ZH", "ZH", "ZH", "ZH", "ZH", "ZH", "GE", None],
+        }
+    ).to_csv(timeline_fp, sep="\t", index=False)
+
+    for location, protocol in [
+        ("ZH", None),
+        ("ZH", "v41"),
+        ("GE", "v41"),
+        ("BS", None),
+    ]:
+        selected = extract_sample_ID(
+            str(timeline_fp),
+            datetime(2024, 1, 1, 12),
+            datetime(2024, 3, 1),
+            location,
+            protocol,
+        )
+        expected = pd.read_csv(timeline_fp, sep="\t")
+        expected["date"] = pd.to_datetime(expected["date"])
+        mask = (
+            (expected["date"] > "2024-01-01")
+            & (expected["date"] < "2024-03-01")
+            & (expected["location"] == location)
+        )
+        if protocol is not None:
+            mask &= expected["proto"] == protocol
+        pd.testing.assert_frame_equal(selected, expected.loc[mask, ["sample", "date"]])
+
+
+def test_timeline_index_cache(tmp_path, vpipe_tree):
+    """The index is shared through the cache and invalidated by changes."""
+    cache_dir = tmp_path / "cache"
+    first = load_timeline_index(vpipe_tree["timeline"], str(cache_dir))
+    assert load_timeline_index(vpipe_tree["timeline"], str(cache_dir)) is first
+    assert len(list(cache_dir.glob("timeline-*.npz"))) == 1
+
+    # another process loads the stored index
+    timeline._loaded.clear()
+    stored = load_timeline_index(vpipe_tree["timeline"], str(cache_dir))
+    assert stored is not first
+    assert list(stored.samples) == list(first.samples)
+
+    # a rewritten timeline is parsed again, its old index removed
+    with open(vpipe_tree["timeline"], "a") as file:
+        file.write("C3_01_2024_05_01\t20240505_DDD\t2024-05-01\tZürich (ZH)\tv41\n")
+    os.utime(vpipe_tree["timeline"], ns=(0, 10**18))
+    updated = load_timeline_index(vpipe_tree["timeline"], str(cache_dir))
+    assert "C3_01_2024_05_01" in updated.samples
+    assert len(list(cache_dir.glob("timeline-*.npz"))) == 1
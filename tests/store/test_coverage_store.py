@@ -0,0 +1,48 @@
+"""Test the cohort-wide coverage store."""
+
+from datetime import datetime
+
+import pandas as pd
+
+from usefulgnom.analyze import run_basecnt_coverage, run_total_coverage_depth
+from usefulgnom.analyze.basecnt_coverage import extract_mutation_position_and_nt
+from usefulgnom.store import CoverageStore
+
+
+def test_store_matches_file_analysis(vpipe_tree, tmp_path):
+    """Matrices answered from the store match the per-file analyses."""
+    store = CoverageStore.create(
+        str(tmp_path / "store"), genome_length=300, chunk_size=64
+    )
+    assert store.ingest(vpipe_tree["basecnt_fps"], vpipe_tree["timeline"]) == 4
+    # reopening sees the same samples, ingesting again adds nothing
+    store = CoverageStore(str(tmp_path / "store"))
+    assert store.ingest(vpipe_tree["basecnt_fps"], vpipe_tree["timeline"]) == 0
+    assert len(store.samples) == 4
+
+    samples = store.select_samples(
+        datetime(2024, 1, 1), datetime(2024, 7, 3), "Zürich (ZH)"
+    )
+    pos_mut = extract_mutation_position_and_nt(vpipe_tree["mutations"])
+    mutations = list(pd.read_csv(vpipe_tree["mutations"])["mut"])
+
+    run_basecnt_coverage(
+        basecnt_fps=vpipe_tree["basecnt_fps"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        mutations_of_interest_dir=vpipe_tree["mutations"],
+        output_file=str(tmp_path / "basecnt.csv"),
+    )
+    store.basecnt_matrix(pos_mut, mutations, samples).to_csv(tmp_path / "store.csv")
+    assert (tmp_path / "store.csv").read_text() == (
+        tmp_path / "basecnt.csv"
+    ).read_text()
+
+    run_total_coverage_depth(
+        coverage_tsv_fps=vpipe_tree["coverage_fps"],
+        mutations_of_interest_fp=vpipe_tree["mutations"],
+        timeline_file_dir=vpipe_tree["timeline"],
+        output_file=str(tmp_path / "total.csv"),
+    )
+    positions = [position for position, _ in pos_mut]
+    store.total_matrix(positions, mutations, samples).to_csv(tmp_path / "store.csv")
+    assert (tmp_path / "store.csv").read_text() == (tmp_path / "total.csv").read_text()
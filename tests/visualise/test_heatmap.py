@@ -0,0 +1,49 @@
+"""Test the raster heatmap renderer."""
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from usefulgnom.visualise import downsample, plot_heatmap
+
+
+def test_downsample_keeps_masked_blocks():
+    """Blocks hold the mean of their values and any masked cell masks them."""
+    values = np.arange(24, dtype=float).reshape(6, 4)
+    values[0, 0] = np.nan
+    mask = np.zeros((6, 4), dtype=bool)
+    mask[5, 3] = True
+
+    means, blocks, rows, cols = downsample(values, mask, max_rows=3, max_cols=2)
+    np.testing.assert_array_equal(rows, [0, 2, 4])
+    np.testing.assert_array_equal(cols, [0, 2])
+    np.testing.assert_allclose(means[0], [(1 + 4 + 5) / 3, (2 + 3 + 6 + 7) / 4])
+    np.testing.assert_allclose(means[2, 1], (18 + 19 + 22 + 23) / 4)
+    np.testing.assert_array_equal(blocks, [[False, False]] * 2 + [[False, True]])
+
+    same, _, _, _ = downsample(values, None, max_rows=10)
+    assert same is values
+
+
+def test_plot_heatmap_draws_one_image(tmp_path):
+    """The matrix is a single RGBA layer with masked and NaN cells composited."""
+    covs = pd.DataFrame(
+        [[0.0, 1.0, np.nan], [2.0, 0.0, 4.0]],
+        index=["s1", "s2"],
+        columns=["1", "2", "3"],
+    )
+    fig, ax = plt.subplots()
+    image = plot_heatmap(covs, ax=ax, vmin=0, mask=covs.to_numpy() == 0, max_ticks=2)
+
+    assert list(ax.images) == [image]
+    rgba = image.get_array()
+    assert rgba.shape == (2, 3, 4)
+    np.testing.assert_array_equal(rgba[0, 0], [0, 0, 0, 1])
+    np.testing.assert_array_equal(rgba[1, 1], [0, 0, 0, 1])
+    assert rgba[0, 2, 3] == 0
+    assert [label.get_text() for label in ax.get_xticklabels()] == ["1", "3"]
+    assert len(fig.axes) == 2
+
+    fig.savefig(tmp_path / "heatmap.pdf")
+    plt.close(fig)
+    assert (tmp_path / "heatmap.pdf").stat().st_size > 0
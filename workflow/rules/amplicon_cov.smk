@@ -22,6 +22,15 @@ rule relative_amplicon_coverage_per_batch:
     params:
         primers_fp=config["primers_fp"],
         output_dir=config["output_dir"] + "{batch}/",
+        # per-stage timing and I/O metrics, next to the log, if enabled
+        metrics=(
+            "--metrics "
+            + config["output_dir"]
+            + "relative_amplicon_coverage_per_batch/{batch}.log.metrics.json"
+            if config.get("metrics")
+            else ""
+        ),
+    threads: config.get("threads", 1)
     log:
         config["output_dir"] + "relative_amplicon_coverage_per_batch/{batch}.log",
     shell:
@@ -32,6 +41,8 @@ rule relative_amplicon_coverage_per_batch:
             -f {input.samples} \
             -r {params.primers_fp} \
             -o {params.output_dir} \
+            -j {threads} \
+            {params.metrics} \
             -p \
             -v 
         """
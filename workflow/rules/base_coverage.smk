@@ -14,15 +14,41 @@ import glob
 import usefulgnom as ug
 
 from pathlib import Path
-import pandas as pd
-from datetime import timedelta
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from usefulgnom.serialize.matrix import matrix_suffix, read_matrix
 
 
 configfile: "config/base_coverage.yaml"
 
 
+# suffix of the coverage and frequency matrices, selecting their format
+MATRIX_SUFFIX = matrix_suffix(config.get("matrix_format", "csv"))
+
+
+def previous_enddate(locations, enddate):
+    """Most recent earlier enddate with a basecnt coverage output of the locations.
+
+    Its matrices and manifests are reused by the run of `enddate`, so only
+    the samples that are new or changed since are loaded.
+    """
+    enddates = []
+    for location in locations:
+        prefix = config["outdir"] + f"{location}/mut_base_coverage_{location}_"
+        for path in glob.glob(glob.escape(prefix) + "*" + MATRIX_SUFFIX):
+            earlier = path[len(prefix) : -len(MATRIX_SUFFIX)]
+            if earlier < enddate:
+                enddates.append(earlier)
+    return max(enddates, default=None)
+
+
+def previous_output(name, location, enddate):
+    """Output of the previous enddate of a matrix, None if there is none."""
+    earlier = previous_enddate([location], enddate)
+    if earlier is None:
+        return None
+    return config["outdir"] + f"{location}/{name}_{location}_{earlier}" + MATRIX_SUFFIX
+
+
 # TODO: add protocol and subset params, see extract_sample_ID
 rule basecnt_coverage_depth:
     """Generate matrix of coverage depth per base position
@@ -32,11 +58,13 @@ rule basecnt_coverage_depth:
         timeline=config["timeline_fp"],
     output:
         output_file=config["outdir"]
-        + "{location}/mut_base_coverage_{location}_{enddate}.csv",
+        + "{location}/mut_base_coverage_{location}_{enddate}"
+        + MATRIX_SUFFIX,
     params:
         startdate="2024-01-01",
         enddate="{enddate}",
         location="{location}",
+    threads: config.get("threads", 1)
     log:
         "logs/basecnt_coverage_depth/{location}_{enddate}.log",
     run:
@@ -49,6 +77,19 @@ rule basecnt_coverage_depth:
             startdate=params.startdate,
             enddate=params.enddate,
             location=params.location,
+            cache_dir=config.get("cache_dir"),
+            n_workers=threads,
+            streaming=config.get("streaming", False),
+            parser=config.get("parser", "pandas"),
+            prefetch_threads=config.get("prefetch_threads", 0),
+            previous_output=previous_output(
+                "mut_base_coverage", params.location, params.enddate
+            ),
+            metrics_output=(
+                f"{log[0]}.basecnt_coverage.metrics.json"
+                if config.get("metrics")
+                else None
+            ),
         )
 
         # TODO: add protocol and subset params, see extract_sample_ID
@@ -63,11 +104,13 @@ rule total_coverage_depth:
         timeline=config["timeline_fp"],
     output:
         output_file=config["outdir"]
-        + "{location}/mut_total_coverage_{location}_{enddate}.csv",
+        + "{location}/mut_total_coverage_{location}_{enddate}"
+        + MATRIX_SUFFIX,
     params:
         startdate="2024-01-01",
         enddate="{enddate}",
         location="{location}",
+    threads: config.get("threads", 1)
     log:
         "logs/basecnt_coverage_depth/{location}_{enddate}.log",
     run:
@@ -80,18 +123,177 @@ rule total_coverage_depth:
             startdate=params.startdate,
             enddate=params.enddate,
             location=params.location,
+            cache_dir=config.get("cache_dir"),
+            n_workers=threads,
+            streaming=config.get("streaming", False),
+            parser=config.get("parser", "pandas"),
+            prefetch_threads=config.get("prefetch_threads", 0),
+            previous_output=previous_output(
+                "mut_total_coverage", params.location, params.enddate
+            ),
+            metrics_output=(
+                f"{log[0]}.total_coverage.metrics.json"
+                if config.get("metrics")
+                else None
+            ),
         )
 
 
-# snakemake lint=off
-rule mutation_statistics:
-    """Compute mutation frequencies from the basecnt and general coverages and report the statistics
+# The fused rule below produces the same coverage matrices as the two rules
+# above, but visits every sample directory and the timeline only once.
+ruleorder: mutation_frequency > basecnt_coverage_depth
+ruleorder: mutation_frequency > total_coverage_depth
+
+
+rule mutation_frequency:
+    """Generate the basecnt coverage, total coverage and frequency matrices in one pass
     """
     input:
+        mutations_of_interest=config["mutations_of_interest_dir"],
+        timeline=config["timeline_fp"],
+    output:
         basecnt_coverage=config["outdir"]
-        + "{location}/mut_base_coverage_{location}_{enddate}.csv",
+        + "{location}/mut_base_coverage_{location}_{enddate}"
+        + MATRIX_SUFFIX,
         total_coverage=config["outdir"]
-        + "{location}/mut_total_coverage_{location}_{enddate}.csv",
+        + "{location}/mut_total_coverage_{location}_{enddate}"
+        + MATRIX_SUFFIX,
+        frequency_data_matrix=config["outdir"]
+        + "{location}/frequency_data_matrix_{location}_{enddate}"
+        + MATRIX_SUFFIX,
+    params:
+        startdate="2024-01-01",
+        enddate="{enddate}",
+        location="{location}",
+    threads: config.get("threads", 1)
+    log:
+        "logs/basecnt_coverage_depth/{location}_{enddate}.log",
+    run:
+        logging.info("Running mutation_frequency")
+        ug.analyze.run_mutation_frequency(
+            basecnt_fps=config["basecnt_tsv_dir"],
+            timeline_file_dir=input.timeline,
+            mutations_of_interest_dir=input.mutations_of_interest,
+            basecnt_output_file=output.basecnt_coverage,
+            total_output_file=output.total_coverage,
+            frequency_output_file=output.frequency_data_matrix,
+            startdate=params.startdate,
+            enddate=params.enddate,
+            location=params.location,
+            cache_dir=config.get("cache_dir"),
+            n_workers=threads,
+            streaming=config.get("streaming", False),
+            parser=config.get("parser", "pandas"),
+            prefetch_threads=config.get("prefetch_threads", 0),
+            metrics_output=(
+                f"{log[0]}.mutation_frequency.metrics.json"
+                if config.get("metrics")
+                else None
+            ),
+            chunk_rows=config.get("frequency_chunk_rows"),
+            previous_basecnt_output=previous_output(
+                "mut_base_coverage", params.location, params.enddate
+            ),
+            previous_total_output=previous_output(
+                "mut_total_coverage", params.location, params.enddate
+            ),
+        )
+
+
+# With a list of locations in the config, the matrices of all of them are
+# computed by one job, from a single glob of the results tree and a single
+# timeline read, instead of one job per location.
+if config.get("locations"):
+
+    ruleorder: mutation_frequency_locations > mutation_frequency
+
+    rule mutation_frequency_locations:
+        """Generate the coverage and frequency matrices of all configured locations in one pass
+        """
+        input:
+            mutations_of_interest=config["mutations_of_interest_dir"],
+            timeline=config["timeline_fp"],
+        output:
+            basecnt_coverage=expand(
+                config["outdir"]
+                + "{location}/mut_base_coverage_{location}_{{enddate}}"
+                + MATRIX_SUFFIX,
+                location=config["locations"],
+            ),
+            total_coverage=expand(
+                config["outdir"]
+                + "{location}/mut_total_coverage_{location}_{{enddate}}"
+                + MATRIX_SUFFIX,
+                location=config["locations"],
+            ),
+            frequency_data_matrix=expand(
+                config["outdir"]
+                + "{location}/frequency_data_matrix_{location}_{{enddate}}"
+                + MATRIX_SUFFIX,
+                location=config["locations"],
+            ),
+        params:
+            startdate="2024-01-01",
+            enddate="{enddate}",
+        threads: config.get("threads", 1)
+        log:
+            "logs/basecnt_coverage_depth/locations_{enddate}.log",
+        run:
+            logging.info("Running mutation_frequency_locations")
+            output_dir = config["outdir"] + "{location}/"
+            earlier = previous_enddate(config["locations"], params.enddate)
+            ug.analyze.run_mutation_frequency(
+                basecnt_fps=config["basecnt_tsv_dir"],
+                timeline_file_dir=input.timeline,
+                mutations_of_interest_dir=input.mutations_of_interest,
+                basecnt_output_file=output_dir
+                + f"mut_base_coverage_{{location}}_{wildcards.enddate}"
+                + MATRIX_SUFFIX,
+                total_output_file=output_dir
+                + f"mut_total_coverage_{{location}}_{wildcards.enddate}"
+                + MATRIX_SUFFIX,
+                frequency_output_file=output_dir
+                + f"frequency_data_matrix_{{location}}_{wildcards.enddate}"
+                + MATRIX_SUFFIX,
+                startdate=params.startdate,
+                enddate=params.enddate,
+                location=list(config["locations"]),
+                cache_dir=config.get("cache_dir"),
+                n_workers=threads,
+                streaming=config.get("streaming", False),
+                parser=config.get("parser", "pandas"),
+                prefetch_threads=config.get("prefetch_threads", 0),
+                metrics_output=(
+                    f"{log[0]}.mutation_frequency.metrics.json"
+                    if config.get("metrics")
+                    else None
+                ),
+                chunk_rows=config.get("frequency_chunk_rows"),
+                previous_basecnt_output=(
+                    output_dir
+                    + f"mut_base_coverage_{{location}}_{earlier}"
+                    + MATRIX_SUFFIX
+                    if earlier is not None
+                    else None
+                ),
+                previous_total_output=(
+                    output_dir
+                    + f"mut_total_coverage_{{location}}_{earlier}"
+                    + MATRIX_SUFFIX
+                    if earlier is not None
+                    else None
+                ),
+            )
+
+
+# snakemake lint=off
+rule mutation_statistics:
+    """Report the statistics of the mutation frequencies
+    """
+    input:
+        frequency_data_matrix=config["outdir"]
+        + "{location}/frequency_data_matrix_{location}_{enddate}"
+        + MATRIX_SUFFIX,
     params:
         location="{location}",
         enddate="{enddate}",
@@ -100,57 +302,34 @@ rule mutation_statistics:
     output:
         heatmap=config["outdir"] + "{location}/heatmap_{location}_{enddate}.pdf",
         lineplot=config["outdir"] + "{location}/lineplot_{location}_{enddate}.pdf",
-        frequency_data_matrix=config["outdir"]
-        + "{location}/frequency_data_matrix_{location}_{enddate}.csv",
         mutations_statistics=config["outdir"]
         + "{location}/mutations_statistics__{location}_{enddate}.csv",
     run:
         logging.info("Running mutation_statistics")
+        # plotting libraries, only imported by the jobs drawing plots
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
+        from usefulgnom.visualise import plot_heatmap
+
         # Median frequency with IQR
 
         ## Labels for the plots
         location = params.location
         enddate = params.enddate
 
-        # Compute mutation frequencies based on the
-
-        basecnt_coverage_csv = input.basecnt_coverage
-        total_cov = input.total_coverage
-
-        basecnt = pd.read_csv(basecnt_coverage_csv, header=0, index_col=0)
-        totalcnt = pd.read_csv(total_cov, header=0, index_col=0)
-        # If position is covered less than 20 reads -> not enough information
-        totalcnt[totalcnt < 20] = None
-        # Computing mutations statistics:
-        frequency_data_matrix = basecnt / totalcnt
-        logging.info("Saving frequency data matrix")
-        frequency_data_matrix.to_csv(
-            output.frequency_data_matrix,
-            header=True,
-            index=True,
+        # Mutation frequencies, computed by rule mutation_frequency
+        frequency_data_matrix = read_matrix(input.frequency_data_matrix)
+        # the plots label the samples by their date
+        frequency_data_matrix.columns = frequency_data_matrix.columns.strftime(
+            "%Y-%m-%d"
         )
-        logging.info("Saved frequency data matrix")
 
-        sns.set(rc = {"figure.figsize": (8 , 8)})  # fmt: skip
-        samples = frequency_data_matrix.columns.to_list()
-        # plot heatmap in normal scale
+        # plot heatmap in normal scale, rows are the sample dates
         df = frequency_data_matrix.transpose()
-        sns.set_style("white")
-
-        g = sns.heatmap(
-            df, yticklabels=samples, cmap="Blues", linewidths=0, linecolor="none"
-        )
-
-        fig = g.get_figure()
-        plt.yticks(rotation=0, fontsize=8)
-        # Set y-axis ticks and labels
-        # Get the figure and axes
-        ax = g.axes
-
-        ax.set_xticks([x + 0.5 for x in range(df.shape[1])])
-        ax.set_xticklabels(
-            df.transpose().index, fontsize=8, rotation=0, ha="right", va="center"
-        )
+        fig, ax = plt.subplots(figsize=(8, 8))
+        plot_heatmap(df, ax=ax, cmap="Blues", fontsize=8)
+        ax.tick_params(axis="x", labelrotation=0)
         logging.info("Saving heatmap")
         fig.savefig(
             output.heatmap,
@@ -204,88 +383,12 @@ rule mutation_statistics:
 
 
         #####################################
-        # convert columns to date type
-        frequency_data_matrix.columns = pd.to_datetime(frequency_data_matrix.columns)
-
-        # the most recent date in the data matrix:
-        most_recent_date = frequency_data_matrix.columns.max()
-
-        # select most recent 2 weeks
-        two_weeks_ago = most_recent_date - timedelta(weeks=2)
-        mut_last_2_weeks = frequency_data_matrix.loc[
-            :, frequency_data_matrix.columns >= two_weeks_ago
-        ]
-        medians = mut_last_2_weeks.median(axis=1)
-        q1 = mut_last_2_weeks.quantile(0.25, axis=1)
-        q3 = mut_last_2_weeks.quantile(0.75, axis=1)
-        iqr = q3 - q1
-
-        # Combine results into a DataFrame
-        results_2_weeks = pd.DataFrame(
-            {"Median": medians, "IQR": iqr, "Q1": q1, "Q3": q3}
+        # median, IQR, Q1 and Q3 over the most recent 2, 6, 12 and 24 weeks
+        combined_df = ug.analyze.mutation_statistics(
+            frequency_data_matrix,
+            windows=tuple(config.get("statistics_windows", [2, 6, 12, 24])),
         )
 
-        # select most recent 6 weeks
-        six_weeks_ago = most_recent_date - timedelta(weeks=6)
-        mut_last_6_weeks = frequency_data_matrix.loc[
-            :, frequency_data_matrix.columns >= six_weeks_ago
-        ]
-        medians = mut_last_6_weeks.median(axis=1)
-        q1 = mut_last_6_weeks.quantile(0.25, axis=1)
-        q3 = mut_last_6_weeks.quantile(0.75, axis=1)
-        iqr = q3 - q1
-
-        # Combine results into a DataFrame
-        results_6_weeks = pd.DataFrame(
-            {"Median": medians, "IQR": iqr, "Q1": q1, "Q3": q3}
-        )
-
-        # select most recent 12 weeks (3 months)
-        three_months_ago = most_recent_date - timedelta(weeks=12)
-        mut_last_3_months = frequency_data_matrix.loc[
-            :, frequency_data_matrix.columns >= three_months_ago
-        ]
-        medians = mut_last_3_months.median(axis=1)
-        q1 = mut_last_3_months.quantile(0.25, axis=1)
-        q3 = mut_last_3_months.quantile(0.75, axis=1)
-        iqr = q3 - q1
-
-        # Combine results into a DataFrame
-        results_12_weeks = pd.DataFrame(
-            {"Median": medians, "IQR": iqr, "Q1": q1, "Q3": q3}
-        )
-
-        # select most recent 24 weeks (6 months)
-        six_months_ago = most_recent_date - timedelta(weeks=24)
-        mut_last_6_months = frequency_data_matrix.loc[
-            :, frequency_data_matrix.columns >= six_months_ago
-        ]
-        medians = mut_last_6_months.median(axis=1)
-        q1 = mut_last_6_months.quantile(0.25, axis=1)
-        q3 = mut_last_6_months.quantile(0.75, axis=1)
-        iqr = q3 - q1
-
-        # Combine results into a DataFrame
-        results_24_weeks = pd.DataFrame(
-            {"Median": medians, "IQR": iqr, "Q1": q1, "Q3": q3}
-        )
-
-        # Combine information about each mutation into a single df
-        dict_mut = {}
-        for i, mutation in enumerate(frequency_data_matrix.index):
-            dict_mut[f"df_mut_{mutation}"] = pd.concat(
-                [
-                    round(results_2_weeks.loc[mutation, :], 3),
-                    round(results_6_weeks.loc[mutation, :], 3),
-                    round(results_12_weeks.loc[mutation, :], 3),
-                    round(results_24_weeks.loc[mutation, :], 3),
-                ],
-                keys=["2weeks", "6weeks", "12weeks", "24weeks"],
-                axis=0,
-            )
-        combined_df = pd.concat(dict_mut, axis=0).reset_index()
-        combined_df.columns = ["mutation", "time", "statistic", "value"]
-
         logging.info("Saving mutation statistics")
         combined_df.to_csv(
             output.mutations_statistics,
@@ -305,6 +408,7 @@ rule mutation_statistics_Zürich_2024_07_03:
         config["outdir"] + "Zürich (ZH)/lineplot_Zürich (ZH)_2024-07-03.pdf",
         config["outdir"] + "Zürich (ZH)/heatmap_Zürich (ZH)_2024-07-03.pdf",
         config["outdir"]
-        + "Zürich (ZH)/frequency_data_matrix_Zürich (ZH)_2024-07-03.csv",
+        + "Zürich (ZH)/frequency_data_matrix_Zürich (ZH)_2024-07-03"
+        + MATRIX_SUFFIX,
         config["outdir"]
         + "Zürich (ZH)/mutations_statistics__Zürich (ZH)_2024-07-03.csv",